@@ -5,7 +5,7 @@ from datetime import datetime
 
 # Import from our existing prediction logic
 # Note: Ensure predict.py is in the same directory
-from predict import load_system, get_station_mapping, find_sensor_id, get_input_data, DEVICE
+from predict import load_system, get_station_mapping, find_sensor_id, get_station_inputs, batch_inference
 
 # --- CONFIGURATION ---
 LOCATIONS = [
@@ -40,61 +40,44 @@ def run_batch_forecast():
     print(f"{'LOCATION':<25} | {'NEAREST STATION':<25} | {'DIST (km)':<10} | {'PREDICTION (Next 10m)':<25}")
     print("-" * 95)
 
+    # Resolve every location first, then prepare each distinct station once
+    # and run a single batched model pass.
+    resolved = {}
     for loc_name in LOCATIONS:
-        # Find Sensor
-        # find_sensor_id handles: csv_match -> fuzzy_name_match -> geocode -> nearest_sensor
-        # It prints logs, so we might see some output from it.
-        # to suppress logs we could redirect stdout, but for now let's keep it simple.
-        
-        # We need to capture the sensor ID to run prediction
-        # `find_sensor_id` in predict.py returns the ID.
-        # But `find_sensor_id` prints stuff. Let's just run it.
-        
         try:
-            # Note: find_sensor_id prints to stdout. 
-            # We might want to wrap it or modify predict.py to be silent, 
-            # but for this MVP script, we accept the noise or try to parse results.
-            
-            # Use a slightly different approach: Resolve ID and Distance first
-            # We reuse the logic but maybe we want to calculate distance explicitly for the report?
-            # actually `find_sensor_id` calls `find_nearest_sensor` which prints distance.
-            
-            # Let's just get the ID.
-            sensor_id = find_sensor_id(loc_name, df, stations_meta)
-            
-            if not sensor_id:
-                print(f"{loc_name:<25} | {'NOT FOUND':<25} | {'-':<10} | {'N/A'}")
-                continue
-                
-            # Run Prediction
-            sat_in, sensor_in = get_input_data(df, sensor_id, last_ts)
-            
-            weather_desc = "N/A"
-            if sat_in is not None and sensor_in is not None:
-                with torch.no_grad():
-                     pred = model(sat_in.to(DEVICE), sensor_in.to(DEVICE)).item()
-                
-                if pred < 0.1: weather_desc = "Clear / No Rain"
-                elif pred < 2.0: weather_desc = "Light Rain"
-                else: weather_desc = "Heavy Rain / Storm"
-                
-                # Format Prediction String
-                pred_str = f"{pred:.4f} mm ({weather_desc})"
-            else:
-                pred_str = "Data Missing"
-
-            # Check if we can get station name for the table
-            # Try to find name in metadata
-            station_name = sensor_id
-            for s in stations_meta:
-                if s['id'] == sensor_id:
-                    station_name = s.get('name', sensor_id)
-                    break
-            
-            print(f"{loc_name:<25} | {station_name[:25]:<25} | {'?':<10} | {pred_str}")
-
+            # find_sensor_id handles: csv_match -> fuzzy_name_match -> geocode -> nearest_sensor
+            resolved[loc_name] = find_sensor_id(loc_name, df, stations_meta)
         except Exception as e:
-            print(f"{loc_name:<25} | {'ERROR':<25} | {'-':<10} | {str(e)}")
+            resolved[loc_name] = e
+    
+    sensor_ids = [sid for sid in resolved.values() if isinstance(sid, str)]
+    try:
+        preds = batch_inference(model, get_station_inputs(df, sensor_ids, last_ts))
+    except Exception as e:
+        print(f"CRITICAL ERROR: Batch inference failed. {e}")
+        return
+    
+    names = {s['id']: s.get('name', s['id']) for s in stations_meta}
+    for loc_name, sensor_id in resolved.items():
+        if isinstance(sensor_id, Exception):
+            print(f"{loc_name:<25} | {'ERROR':<25} | {'-':<10} | {str(sensor_id)}")
+            continue
+        if not sensor_id:
+            print(f"{loc_name:<25} | {'NOT FOUND':<25} | {'-':<10} | {'N/A'}")
+            continue
+        
+        curve = preds.get(sensor_id)
+        if curve is not None:
+            pred = curve[0]  # next 10 minutes
+            if pred < 0.1: weather_desc = "Clear / No Rain"
+            elif pred < 2.0: weather_desc = "Light Rain"
+            else: weather_desc = "Heavy Rain / Storm"
+            pred_str = f"{pred:.4f} mm ({weather_desc})"
+        else:
+            pred_str = "Data Missing"
+        
+        station_name = names.get(sensor_id, sensor_id)
+        print(f"{loc_name:<25} | {station_name[:25]:<25} | {'?':<10} | {pred_str}")
 
     print("-" * 95)
     print("Batch Run Complete.")
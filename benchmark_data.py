@@ -0,0 +1,113 @@
+"""
+benchmark_data.py
+Synthetic data generators for the benchmark scripts (same shapes as create_dummy_data.py)
+
+- Sensor history CSV: 1-minute readings, naive local time (UTC+8), like real_sensor_data.csv
+- Processed satellite frames: 64x64 .npy in processed_data/, named by UTC like preprocess_images.py
+- Station metadata in the NEA API format used by predict.get_station_mapping()
+"""
+
+import os
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# Singapore sensor area (keeps all stations inside MAX_RADIUS_KM of each other)
+LAT_RANGE = (1.25, 1.45)
+LON_RANGE = (103.65, 104.00)
+
+
+def make_stations(num_sensors, seed=0):
+    """Synthetic stations on a jittered grid: [{'id', 'name', 'location': {...}}]"""
+    rng = np.random.default_rng(seed)
+    cols = int(np.ceil(np.sqrt(num_sensors)))
+    rows = int(np.ceil(num_sensors / cols))
+    lats = np.linspace(*LAT_RANGE, rows)
+    lons = np.linspace(*LON_RANGE, cols)
+
+    stations = []
+    for i in range(num_sensors):
+        lat = lats[i // cols] + rng.uniform(-0.005, 0.005)
+        lon = lons[i % cols] + rng.uniform(-0.005, 0.005)
+        stations.append({
+            "id": f"S{100 + i}",
+            "device_id": f"S{100 + i}",
+            "name": f"Synthetic Station {i}",
+            "location": {"latitude": float(lat), "longitude": float(lon)},
+        })
+    return stations
+
+
+def generate_sensor_history(csv_path, stations, start, hours, seed=0):
+    """1-minute sensor readings for every station, written to csv_path. Returns the DataFrame."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(start, periods=hours * 60, freq="min")
+    n = len(timestamps)
+
+    frames = []
+    for s in stations:
+        rain = np.zeros(n)
+        # One random storm event per sensor
+        storm = rng.integers(0, max(n - 60, 1))
+        rain[storm:storm + 30] = rng.uniform(0.1, 5.0, len(rain[storm:storm + 30]))
+        frames.append(pd.DataFrame({
+            "timestamp": timestamps,
+            "sensor_id": s["id"],
+            "humidity": rng.uniform(70, 95, n),
+            "pm25": rng.uniform(10, 30, n),
+            "rainfall": rain,
+            "temperature": 28.0 + rng.standard_normal(n).cumsum() * 0.05,
+        }))
+
+    df = pd.concat(frames, ignore_index=True).sort_values(["timestamp", "sensor_id"])
+    df.to_csv(csv_path, index=False)
+    return df
+
+
+def generate_processed_frames(out_dir, start, hours, seed=0):
+    """64x64 brightness-temperature frames every 10 minutes. Returns the number of files."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    count = 0
+    for i in range(hours * 6):
+        # Filenames are UTC, sensor timestamps are local (UTC+8)
+        utc = start + datetime.timedelta(minutes=10 * i) - datetime.timedelta(hours=8)
+        noise = rng.random((64, 64))
+        cloud = (noise + np.roll(noise, 1, axis=0) + np.roll(noise, 1, axis=1)) / 3.0
+        tbb = (300 - cloud * 100).astype(np.float32)
+        np.save(os.path.join(out_dir, f"NC_H09_{utc:%Y%m%d_%H%M}_R21_FLDK.02401_02401.npy"), tbb)
+        count += 1
+    return count
+
+
+def make_osm_path(num_points=200, seed=0):
+    """Overpass-style response for a roughly north-south path across the sensor area"""
+    rng = np.random.default_rng(seed)
+    lats = np.linspace(LAT_RANGE[1], LAT_RANGE[0], num_points)
+    lons = np.linspace(103.75, 103.80, num_points) + rng.normal(0, 0.002, num_points)
+    # Split into a few ways, like a real corridor made of several segments
+    elements = []
+    for chunk in np.array_split(np.arange(num_points), 4):
+        elements.append({
+            "type": "way",
+            "tags": {"highway": "path"},
+            "geometry": [{"lat": float(lats[i]), "lon": float(lons[i])} for i in chunk],
+        })
+    return {"elements": elements}
+
+
+def generate_workspace(workdir, num_sensors=20, days=2, seed=0):
+    """
+    Build a self-contained data directory (real_sensor_data.csv + processed_data/).
+    Data covers whole local days ending yesterday, so the API's
+    "same time on the previous day" lookup always finds history.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - datetime.timedelta(days=days)
+
+    stations = make_stations(num_sensors, seed=seed)
+    df = generate_sensor_history(os.path.join(workdir, "real_sensor_data.csv"), stations, start, days * 24, seed=seed)
+    frames = generate_processed_frames(os.path.join(workdir, "processed_data"), start, days * 24, seed=seed)
+    return {"stations": stations, "rows": len(df), "frames": frames, "start": start}
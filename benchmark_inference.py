@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+benchmark_inference.py
+推理热路径基准测试
+
+在合成数据（benchmark_data.py）上分别测量各阶段和端到端请求的延迟:
+    get_input_data   单个传感器的输入准备（CSV 切片 + 重采样 + 卫星帧读取）
+    nearest_sensors  Delaunay 选站
+    forward          WeatherFusionNet 单样本前向
+    backends         （--backends）eager / TorchScript / ONNX / int8 前向对比，按 batch 大小
+    micro_batching   （--micro-batch）并发单样本前向：直接调用 vs 微批处理队列，按并发级别
+    idw              反距离加权插值
+    /predict         TestClient 端到端（lat/lon 与 location 两种）
+    /predict/path    TestClient 端到端（合成 OSM 路径）
+
+外部网络调用（Nominatim / Overpass / NEA 站点元数据）被替换为本地合成结果，
+因此测得的是本服务自身的开销。
+
+输出 p50/p95/p99、均值、吞吐量，并写入 JSON 报告，可用 --compare 与上一版本报告对比。
+
+用法:
+    python3 benchmark_inference.py
+    python3 benchmark_inference.py --sensors 60 --iterations 200 --concurrency 1,4,8
+    python3 benchmark_inference.py --compare benchmark_reports/inference_v0.5.json
+    python3 benchmark_inference.py --micro-batch 3 --concurrency 1,8,32 --no-cache
+    python3 benchmark_inference.py --skip-endpoints --backends eager,torchscript,onnx,quantized --batch-sizes 1,32
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import torch
+
+import benchmark_data
+
+REPORT_DIR = "benchmark_reports"
+# p95 变慢超过该比例视为回归
+REGRESSION_THRESHOLD = 0.20
+# 绝对差值小于该值（毫秒）时忽略，避免微秒级用例的噪声
+MIN_REGRESSION_MS = 0.05
+
+
+def summarize(latencies_s, elapsed_s=None):
+    """延迟列表（秒）-> 统计结果（毫秒）"""
+    arr = np.asarray(latencies_s, dtype=np.float64) * 1000.0
+    if arr.size == 0:
+        return {"count": 0}
+    elapsed_s = elapsed_s if elapsed_s is not None else arr.sum() / 1000.0
+    return {
+        "count": int(arr.size),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "max_ms": round(float(arr.max()), 3),
+        "throughput_per_sec": round(arr.size / elapsed_s, 2) if elapsed_s > 0 else None,
+    }
+
+
+def time_calls(fn, args_list, warmup=3):
+    """顺序执行 fn(*args)，返回统计结果"""
+    for args in args_list[:warmup]:
+        fn(*args)
+    latencies = []
+    start = time.perf_counter()
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def time_concurrent(fn, args_list, concurrency, warmup=3, with_results=False):
+    """
+    concurrency 个线程并发执行 fn(*args)，返回统计结果（吞吐按墙钟时间计算）
+    with_results=True 时返回 (统计结果, 每次调用的返回值)
+    """
+    for args in args_list[:warmup]:
+        fn(*args)
+
+    def timed(args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        return time.perf_counter() - t0, result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timed_results = list(pool.map(timed, args_list))
+    stats = summarize([t for t, _ in timed_results], time.perf_counter() - start)
+    if with_results:
+        return stats, [r for _, r in timed_results]
+    return stats
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽热路径里的 print，避免终端输出影响计时"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def read_version():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "VERSION")
+    if os.path.exists(path):
+        with open(path) as f:
+            return f.read().strip()
+    return None
+
+
+def random_points(stations, n, rng, jitter_deg=0.03):
+    """合成站点附近的随机查询点（±0.03° ≈ 3 km，始终在 10 km 选站半径内，稀疏站点时也不会 404）"""
+    lats = np.array([s["location"]["latitude"] for s in stations])
+    lons = np.array([s["location"]["longitude"] for s in stations])
+    idx = rng.integers(0, len(stations), n)
+    return list(zip(lats[idx] + rng.uniform(-jitter_deg, jitter_deg, n),
+                    lons[idx] + rng.uniform(-jitter_deg, jitter_deg, n)))
+
+
+def bench_stages(df, model, stations, args, rng):
+    """单阶段基准"""
+    import predict
+    import api
+
+    results = {}
+    sensor_ids = [s["id"] for s in stations]
+    target_time = df["timestamp"].max() - pd.Timedelta(hours=12)
+    sids = [(df, sensor_ids[i % len(sensor_ids)], target_time) for i in range(args.iterations)]
+
+    with quiet():
+        results["get_input_data"] = time_calls(predict.get_input_data, sids)
+
+        points = random_points(stations, args.iterations, rng)
+        results["nearest_sensors"] = time_calls(
+            predict.find_nearest_n_sensors, [(lat, lon, stations, 3) for lat, lon in points])
+
+        sat_in, sensor_in = predict.get_input_data(df, sensor_ids[0], target_time)
+
+    def forward(sat, sensor):
+        with torch.no_grad():
+            model(sat, sensor).tolist()
+
+    results["forward"] = time_calls(forward, [(sat_in, sensor_in)] * args.iterations)
+
+    idw_args = [(list(rng.uniform(0, 5, 3)), list(rng.uniform(0.5, 8, 3))) for _ in range(args.iterations)]
+    results["idw"] = time_calls(api.calculate_idw, idw_args)
+    return results
+
+
+def bench_backends(model, args):
+    """各推理后端的前向延迟（导出到当前目录，即合成数据目录）"""
+    import inference_backend as ib
+
+    exported = ib.export_all(model, [b for b in args.backends if b in ("torchscript", "onnx")])
+    if "quantized" in args.backends:
+        # 合成数据目录的缓存帧用于校准（精度检查见 inference_backend.py quantize）
+        exported["quantized"] = ib.export_torchscript(
+            ib.quantize_model(model, ib.calibration_frames()), ib.QUANTIZED_PATH)
+    results = {}
+    for name in args.backends:
+        if name == "eager":
+            backend = ib.EagerBackend(model)
+        elif name in exported:
+            if name == "onnx":
+                backend = ib.OnnxBackend(exported[name])
+            else:
+                backend = ib.TorchScriptBackend(exported[name], name=name)
+        else:
+            print(f"   ⚠️  {name} 不可用，跳过")
+            continue
+        results[name] = {}
+        for batch in args.batch_sizes:
+            inputs = (torch.randn(batch, *ib.SAT_SHAPE), torch.randn(batch, ib.SEQ_LEN, ib.SENSOR_FEATURES))
+            results[name][f"b{batch}"] = time_calls(lambda sat, sensor: backend(sat, sensor).tolist(),
+                                                    [inputs] * args.iterations)
+    return results
+
+
+def bench_micro_batching(model, args):
+    """并发单样本前向：直接调用后端 vs 经过 MicroBatcher"""
+    from inference_backend import EagerBackend, SAT_SHAPE, SEQ_LEN, SENSOR_FEATURES
+    from inference_queue import MicroBatcher
+
+    backend = EagerBackend(model)
+    batcher = MicroBatcher(backend, window_ms=args.micro_batch)
+    calls = [(torch.randn(1, *SAT_SHAPE), torch.randn(1, SEQ_LEN, SENSOR_FEATURES))
+             for _ in range(args.iterations)]
+    results = {"direct": {}, f"batched {args.micro_batch:g}ms": {}}
+    try:
+        for c in args.concurrency:
+            results["direct"][f"c{c}"] = time_concurrent(lambda sat, sensor: backend(sat, sensor).tolist(), calls, c)
+            results[f"batched {args.micro_batch:g}ms"][f"c{c}"] = time_concurrent(
+                lambda sat, sensor: batcher(sat, sensor).tolist(), calls, c)
+    finally:
+        batcher.close()
+    return results
+
+
+def bench_endpoints(stations, args, rng):
+    """端到端请求基准（TestClient，按并发级别）"""
+    from fastapi.testclient import TestClient
+    import api
+
+    client = TestClient(api.app)
+    points = random_points(stations, args.iterations, rng)
+    names = [s["name"] for s in stations]
+
+    def get(url, params):
+        return client.get(url, params=params).status_code
+
+    cases = {
+        "/predict?lat&lon": [("/predict", {"lat": lat, "lon": lon}) for lat, lon in points],
+        "/predict?location": [("/predict", {"location": names[i % len(names)]}) for i in range(args.iterations)],
+        "/predict/path": [("/predict/path", {"query": "Synthetic Corridor"})] * max(args.iterations // 10, 5),
+    }
+
+    results = {}
+    with quiet():
+        for name, calls in cases.items():
+            results[name] = {}
+            for c in args.concurrency:
+                stats, statuses = time_concurrent(get, calls, c, with_results=True)
+                # 非 200 计入报告，不中断基准
+                failed = sorted(code for code in statuses if code != 200)
+                stats["errors"] = len(failed)
+                if failed:
+                    stats["error_status"] = {str(code): failed.count(code) for code in set(failed)}
+                results[name][f"c{c}"] = stats
+    return results
+
+
+def patch_network(stations):
+    """将外部服务替换为合成结果（只影响本进程）"""
+    import api
+
+    by_name = {s["name"]: (s["location"]["latitude"], s["location"]["longitude"]) for s in stations}
+    osm_path = benchmark_data.make_osm_path()
+
+    api.geocode_location = lambda address: by_name.get(address, (None, None))
+    api.reverse_geocode = lambda lat, lon: None
+    api.fetch_osm_path = lambda query: osm_path
+
+
+def compare_reports(current, baseline_path, threshold=REGRESSION_THRESHOLD):
+    """对比两份报告的 p95，返回回归列表"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def flatten(section):
+        out = {}
+        for name, stats in section.items():
+            if "p95_ms" in stats:
+                out[name] = stats
+            else:
+                for level, s in stats.items():
+                    out[f"{name} [{level}]"] = s
+        return out
+
+    sections = ("stages", "endpoints", "backends", "micro_batching")
+    base = {k: v for sec in sections for k, v in flatten(baseline.get(sec, {})).items()}
+    cur = {k: v for sec in sections for k, v in flatten(current.get(sec, {})).items()}
+
+    regressions = []
+    print(f"\n📊 对比基线: {baseline_path} (version {baseline.get('version')}, {baseline.get('git_revision')})")
+    print(f"{'case':<32}{'base p95':>12}{'now p95':>12}{'change':>10}")
+    for name in sorted(cur):
+        if name not in base or not base[name].get("p95_ms"):
+            continue
+        b, c = base[name]["p95_ms"], cur[name]["p95_ms"]
+        change = (c - b) / b
+        regressed = change > threshold and (c - b) > MIN_REGRESSION_MS
+        flag = " ⚠️" if regressed else ""
+        print(f"{name:<32}{b:>12.3f}{c:>12.3f}{change:>+10.1%}{flag}")
+        if regressed:
+            regressions.append({"case": name, "baseline_p95_ms": b, "p95_ms": c, "change": round(change, 4)})
+    return regressions
+
+
+def print_table(title, section):
+    print(f"\n{title}")
+    print(f"{'case':<32}{'p50':>10}{'p95':>10}{'p99':>10}{'req/s':>10}{'errors':>8}")
+    for name, stats in section.items():
+        rows = [(name, stats)] if "p95_ms" in stats else [(f"{name} [{k}]", v) for k, v in stats.items()]
+        for label, s in rows:
+            errors = s.get("errors", "")
+            print(f"{label:<32}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}"
+                  f"{s['throughput_per_sec']:>10.1f}{errors:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference benchmark for the predict/API hot path")
+    parser.add_argument("--sensors", type=int, default=20, help="合成传感器数量")
+    parser.add_argument("--days", type=int, default=2, help="合成历史天数 (>=2)")
+    parser.add_argument("--iterations", type=int, default=100, help="每个用例的调用次数")
+    parser.add_argument("--concurrency", default="1,4", help="端到端并发级别，逗号分隔")
+    parser.add_argument("--model", default=None, help="模型权重路径（默认随机权重，不影响延迟）")
+    parser.add_argument("--workdir", default=None, help="合成数据目录（默认临时目录）")
+    parser.add_argument("--skip-endpoints", action="store_true", help="只测单阶段")
+    parser.add_argument("--backends", default=None, help="对比推理后端，逗号分隔 (eager,torchscript,onnx,quantized)")
+    parser.add_argument("--batch-sizes", default="1,32", help="后端对比的 batch 大小，逗号分隔")
+    parser.add_argument("--micro-batch", type=float, default=0,
+                        help="微批处理窗口毫秒数；>0 时对比并发前向，并让端到端请求经过队列")
+    parser.add_argument("--no-cache", action="store_true", help="关闭 /predict 响应缓存，测量未命中路径")
+    parser.add_argument("--output", default=None, help="报告路径（默认 benchmark_reports/inference_<时间>.json）")
+    parser.add_argument("--compare", default=None, help="基线报告路径")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    args.backends = [b for b in (args.backends or "").split(",") if b]
+    args.batch_sizes = [int(b) for b in args.batch_sizes.split(",") if b]
+    args.days = max(args.days, 2)
+
+    repo_dir = os.getcwd()
+    revision = git_revision()
+    output = args.output or os.path.join(REPORT_DIR, f"inference_{datetime.now():%Y%m%d_%H%M%S}.json")
+    output = os.path.abspath(output)
+    model_path = os.path.abspath(args.model) if args.model else None
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="weather_bench_")
+    print(f"🧪 生成合成数据: {args.sensors} 传感器 × {args.days} 天 -> {workdir}")
+    t0 = time.perf_counter()
+    info = benchmark_data.generate_workspace(workdir, num_sensors=args.sensors, days=args.days, seed=args.seed)
+    print(f"   {info['rows']} 行传感器数据, {info['frames']} 帧卫星图 ({time.perf_counter() - t0:.1f}s)")
+
+    # predict.py / api.py 使用相对路径读取数据
+    os.chdir(workdir)
+    logging.disable(logging.INFO)
+
+    import predict
+    import api
+    import inference_backend
+    if model_path:
+        predict.MODEL_PATH = model_path
+
+    with quiet():
+        model, df = predict.load_system()
+    # Same intra-op thread count as the API (inference_backend.load_backend)
+    inference_backend.configure_threads()
+    stations = info["stations"]
+    patch_network(stations)
+    api.model, api.df, api.stations_meta = model, df, stations
+    if args.no_cache:
+        api.predict_cache.max_entries = 0
+
+    rng = np.random.default_rng(args.seed)
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "version": read_version(),
+        "git_revision": revision,
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "sensors": args.sensors,
+            "days": args.days,
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "model": model_path or "random-init",
+            "predict_cache": not args.no_cache,
+            "micro_batch_window_ms": args.micro_batch,
+        },
+    }
+
+    print("⏱️  单阶段...")
+    report["stages"] = bench_stages(df, model, stations, args, rng)
+    print_table("Stages (ms)", report["stages"])
+
+    if args.backends:
+        print(f"\n⏱️  推理后端 ({torch.get_num_threads()} threads)...")
+        with quiet():
+            report["backends"] = bench_backends(model, args)
+        print_table("Backends forward (ms)", report["backends"])
+
+    if args.micro_batch > 0:
+        print(f"\n⏱️  微批处理 (窗口 {args.micro_batch:g}ms)...")
+        report["micro_batching"] = bench_micro_batching(model, args)
+        print_table("Concurrent forward (ms)", report["micro_batching"])
+        from inference_queue import MicroBatcher
+        api.model = MicroBatcher(model, window_ms=args.micro_batch)
+
+    if not args.skip_endpoints:
+        print("\n⏱️  端到端请求...")
+        report["endpoints"] = bench_endpoints(stations, args, rng)
+        print_table("Endpoints (ms)", report["endpoints"])
+
+    os.chdir(repo_dir)
+    if args.compare:
+        report["regressions"] = compare_reports(report, args.compare)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ 报告已保存: {output}")
+
+    if report.get("regressions"):
+        print(f"⚠️  {len(report['regressions'])} 个用例 p95 回归超过 {REGRESSION_THRESHOLD:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+benchmark_training.py
+训练流水线基准测试 / 性能剖析
+
+在合成数据（benchmark_data.py，天数 × 传感器数可配置）上运行 WeatherDataset + train.py 的训练循环，
+分阶段记录耗时:
+    dataset_init   WeatherDataset.__init__（读 CSV、重采样、卫星对齐、生成样本）
+    split          时间切分 (time_split)
+    getitem        单样本 __getitem__（随机访问，含 .npy 读取）
+    train          训练循环，拆分为 data_wait / forward / backward(+optimizer.step)
+    checkpoint     torch.save(state_dict)
+
+同时记录 samples/s、各阶段结束时的峰值 RSS，可选输出 torch.profiler 或 cProfile 结果，
+用于评估训练服务器规格和发现性能退化。
+
+用法:
+    python3 benchmark_training.py --days 7 --sensors 20
+    python3 benchmark_training.py --days 30 --sensors 60 --steps 200 --profile torch
+    python3 benchmark_training.py --profile cprofile --output benchmark_reports/train.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import pstats
+import resource
+import argparse
+import platform
+import tempfile
+import cProfile
+from datetime import datetime
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader, Subset
+
+import benchmark_data
+from benchmark_inference import summarize, quiet, git_revision, read_version, REPORT_DIR
+from weather_dataset import WeatherDataset, time_split
+from weather_fusion_model import WeatherFusionNet
+
+# 与 train.py 一致（导入 train.py 会在模块级选择设备并打印）
+BATCH_SIZE = 4
+LEARNING_RATE = 1e-3
+
+
+def peak_rss_mb():
+    """进程峰值 RSS (MB)；Linux 单位为 KB，macOS 为字节"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+
+class PhaseTimer:
+    """记录各阶段墙钟时间和结束时的峰值 RSS"""
+
+    def __init__(self):
+        self.phases = {}
+
+    def run(self, name, fn, *args, silent=False, **kwargs):
+        t0 = time.perf_counter()
+        if silent:
+            with quiet():
+                result = fn(*args, **kwargs)
+        else:
+            result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - t0
+        self.phases[name] = {"seconds": round(elapsed, 4), "peak_rss_mb": peak_rss_mb()}
+        print(f"   {name:<14} {elapsed:8.3f}s   peak RSS {self.phases[name]['peak_rss_mb']} MB")
+        return result
+
+
+def bench_getitem(dataset, n, seed=0):
+    """随机访问 n 个样本的 __getitem__ 延迟"""
+    rng = random.Random(seed)
+    indices = [rng.randrange(len(dataset)) for _ in range(n)]
+    latencies = []
+    start = time.perf_counter()
+    for i in indices:
+        t0 = time.perf_counter()
+        dataset[i]
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def train_loop(model, loader, device, epochs, max_steps, profiler=None):
+    """与 train.py 相同的训练步骤，按步拆分 data_wait / forward / backward 耗时"""
+    t_setup = time.perf_counter()
+    criterion = nn.MSELoss()
+    optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE)
+    model.train()
+    setup = time.perf_counter() - t_setup
+
+    data_wait, forward, backward = [], [], []
+    samples = 0
+    start = time.perf_counter()
+    for _ in range(epochs):
+        t_data = time.perf_counter()
+        for step, (sat, sensor, target) in enumerate(loader):
+            if max_steps and step >= max_steps:
+                break
+            sat, sensor, target = sat.to(device), sensor.to(device), target.to(device)
+            t0 = time.perf_counter()
+            data_wait.append(t0 - t_data)
+
+            optimizer.zero_grad()
+            outputs = model(sat, sensor)
+            loss = criterion(outputs, target)
+            t1 = time.perf_counter()
+            forward.append(t1 - t0)
+
+            loss.backward()
+            optimizer.step()
+            loss.item()
+            t2 = time.perf_counter()
+            backward.append(t2 - t1)
+
+            samples += target.shape[0]
+            if profiler is not None:
+                profiler.step()
+            t_data = time.perf_counter()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "steps": len(forward),
+        "samples": samples,
+        "seconds": round(elapsed, 4),
+        "setup_seconds": round(setup, 4),
+        "samples_per_sec": round(samples / elapsed, 2) if elapsed > 0 else None,
+        "data_wait": summarize(data_wait),
+        "forward": summarize(forward),
+        "backward": summarize(backward),
+        "data_wait_fraction": round(sum(data_wait) / elapsed, 4) if elapsed > 0 else None,
+    }
+
+
+def bench_checkpoint(model, path, repeats=5):
+    latencies = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        torch.save(model.state_dict(), path)
+        latencies.append(time.perf_counter() - t0)
+    stats = summarize(latencies)
+    stats["bytes"] = os.path.getsize(path)
+    return stats
+
+
+def run(args, timer, report, trace_dir):
+    csv_path = "real_sensor_data.csv"
+    print("\n⏱️  阶段计时:")
+    dataset = timer.run("dataset_init", WeatherDataset, csv_path, "satellite_data", silent=True)
+    report["dataset"] = {"samples": len(dataset)}
+    if len(dataset) == 0:
+        raise RuntimeError("合成数据未生成任何样本")
+    report["dataset"]["samples_per_sec_init"] = round(len(dataset) / timer.phases["dataset_init"]["seconds"], 2)
+
+    train_idx, _ = timer.run("split", time_split, dataset, 0.8,
+                             os.path.join(os.getcwd(), "dataset_split.json"), silent=True)
+
+    report["getitem"] = timer.run("getitem", bench_getitem, dataset, args.getitem_samples, args.seed)
+
+    loader = DataLoader(Subset(dataset, train_idx), batch_size=args.batch_size, shuffle=True,
+                        num_workers=args.num_workers)
+    device = torch.device(args.device)
+    model = WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=1).to(device)
+
+    if args.profile == "torch":
+        from torch.profiler import profile, ProfilerActivity, schedule, tensorboard_trace_handler
+        activities = [ProfilerActivity.CPU]
+        if device.type == "cuda":
+            activities.append(ProfilerActivity.CUDA)
+        with profile(activities=activities,
+                     schedule=schedule(wait=1, warmup=1, active=min(max(args.steps, 3), 20)),
+                     on_trace_ready=tensorboard_trace_handler(trace_dir),
+                     record_shapes=True, profile_memory=True) as prof:
+            report["train"] = timer.run("train", train_loop, model, loader, device,
+                                        args.epochs, args.steps, prof)
+        table = prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=30)
+        with open(os.path.join(trace_dir, "torch_profile.txt"), "w") as f:
+            f.write(table)
+    else:
+        report["train"] = timer.run("train", train_loop, model, loader, device, args.epochs, args.steps)
+
+    report["checkpoint"] = timer.run("checkpoint", bench_checkpoint, model,
+                                     os.path.join(os.getcwd(), "benchmark_model.pth"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training pipeline benchmark / profiler")
+    parser.add_argument("--days", type=int, default=3, help="合成数据天数")
+    parser.add_argument("--sensors", type=int, default=10, help="合成传感器数量")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=100, help="每个 epoch 最多训练步数 (0 = 全部)")
+    parser.add_argument("--num-workers", type=int, default=0, help="DataLoader workers")
+    parser.add_argument("--getitem-samples", type=int, default=500, help="__getitem__ 随机访问次数")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--profile", choices=["none", "torch", "cprofile"], default="none")
+    parser.add_argument("--workdir", default=None, help="合成数据目录（默认临时目录）")
+    parser.add_argument("--output", default=None, help="报告路径（默认 benchmark_reports/training_<时间>.json）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stamp = f"{datetime.now():%Y%m%d_%H%M%S}"
+    output = os.path.abspath(args.output or os.path.join(REPORT_DIR, f"training_{stamp}.json"))
+    trace_dir = os.path.abspath(os.path.join(os.path.dirname(output), f"training_{stamp}_profile"))
+    revision = git_revision()
+    repo_dir = os.getcwd()
+
+    torch.manual_seed(args.seed)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="weather_train_bench_")
+    print(f"🧪 生成合成数据: {args.sensors} 传感器 × {args.days} 天 -> {workdir}")
+    t0 = time.perf_counter()
+    info = benchmark_data.generate_workspace(workdir, num_sensors=args.sensors, days=args.days, seed=args.seed)
+    print(f"   {info['rows']:,} 行传感器数据, {info['frames']} 帧卫星图 ({time.perf_counter() - t0:.1f}s)")
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "version": read_version(),
+        "git_revision": revision,
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "days": args.days,
+            "sensors": args.sensors,
+            "sensor_rows": info["rows"],
+            "frames": info["frames"],
+            "batch_size": args.batch_size,
+            "epochs": args.epochs,
+            "max_steps": args.steps,
+            "num_workers": args.num_workers,
+            "device": args.device,
+            "profile": args.profile,
+        },
+    }
+
+    # WeatherDataset 使用相对路径 processed_data/
+    os.chdir(workdir)
+    if args.profile != "none":
+        os.makedirs(trace_dir, exist_ok=True)
+    timer = PhaseTimer()
+    try:
+        if args.profile == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.runcall(run, args, timer, report, trace_dir)
+            profiler.dump_stats(os.path.join(trace_dir, "training.prof"))
+            with open(os.path.join(trace_dir, "cprofile_top.txt"), "w") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+        else:
+            run(args, timer, report, trace_dir)
+    finally:
+        os.chdir(repo_dir)
+
+    report["phases"] = timer.phases
+    report["peak_rss_mb"] = peak_rss_mb()
+    if args.profile != "none":
+        report["profile_dir"] = trace_dir
+
+    train = report["train"]
+    print(f"\n📈 训练: {train['samples']} 样本 / {train['seconds']}s = {train['samples_per_sec']} samples/s "
+          f"(data wait {train['data_wait_fraction']:.0%}, setup {train['setup_seconds']}s)")
+    print(f"   step p50: data {train['data_wait']['p50_ms']}ms | forward {train['forward']['p50_ms']}ms "
+          f"| backward {train['backward']['p50_ms']}ms")
+    print(f"   __getitem__ p50 {report['getitem']['p50_ms']}ms, p95 {report['getitem']['p95_ms']}ms")
+    print(f"   峰值 RSS: {report['peak_rss_mb']} MB")
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ 报告已保存: {output}")
+    if args.profile != "none":
+        print(f"   Profile: {trace_dir}")
+
+
+if __name__ == "__main__":
+    main()
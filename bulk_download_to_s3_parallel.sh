@@ -9,6 +9,7 @@ SATELLITE_PREFIX="satellite"
 ARCHIVED_PREFIX="archived/satellite"  # 已处理的数据归档位置
 GOVDATA_PREFIX="govdata"
 MIN_FILES_PER_DAY=50  # 每天最少文件数，低于此值不标记为完成
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
 
 # 并行配置
 PARALLEL_JOBS="${PARALLEL_JOBS:-4}"  # 默认 4 个并行下载
@@ -210,6 +211,10 @@ while [[ "$current" < "$END_DATE" ]] || [[ "$current" == "$END_DATE" ]]; do
         echo "   ⚠️ 日期未完成: $current (只有 $actual_count 文件，需要 >= $MIN_FILES_PER_DAY)"
     fi
     
+    # 更新每日清单（监控/调度读取清单，无需实时列出 S3）
+    python3 "$SCRIPT_DIR/s3_manifest.py" write --date "$current" --by downloader --bucket "$S3_BUCKET" || \
+        echo "   ⚠️ 清单更新失败: $current"
+    
     # 下一天
     current=$(date -d "$current + 1 day" "+%Y-%m-%d" 2>/dev/null || date -j -v+1d -f "%Y-%m-%d" "$current" "+%Y-%m-%d")
 done
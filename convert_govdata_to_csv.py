@@ -2,53 +2,32 @@
 """
 将 govdata/*.json 转换为 real_sensor_data.csv
 从本地 JSON 文件读取，确保日期与卫星图像对齐
+
+用法:
+    python3 convert_govdata_to_csv.py                # 全量重建
+    python3 convert_govdata_to_csv.py --incremental  # 只导入新增/变化的文件并 upsert
 """
 import json
 import os
-import glob
 import pandas as pd
 from pathlib import Path
 
+from govdata_parser import ReadingColumns, SENSOR_TYPES
+from sensor_store import IngestLedger, file_fingerprint, upsert_rows
+
 GOVDATA_DIR = Path("govdata")
 OUTPUT_FILE = "real_sensor_data.csv"
 
-def parse_json_file(filepath, dtype):
-    """解析单个 JSON 文件，处理不同格式"""
+def parse_json_file(filepath, dtype, columns):
+    """解析单个 JSON 文件，按列写入 columns (ReadingColumns)，返回读数条数"""
     with open(filepath) as f:
         data = json.load(f)
     
-    records = []
-    items = data.get("items", [])
-    
-    for item in items:
-        timestamp = item.get("timestamp")
-        readings = item.get("readings", [])
-        
-        # PM25 格式不同：readings 是字典而不是列表
-        if dtype == "pm25" and isinstance(readings, dict):
-            pm25_data = readings.get("pm25_one_hourly", {})
-            for region, value in pm25_data.items():
-                records.append({
-                    "timestamp": timestamp,
-                    "station_id": f"PM25_{region}",  # 虚拟 station_id
-                    "value": value if value else 0
-                })
-        elif isinstance(readings, list):
-            # 标准格式：rainfall, temperature, humidity
-            for reading in readings:
-                if isinstance(reading, dict):
-                    station_id = reading.get("station_id")
-                    value = reading.get("value", 0)
-                    records.append({
-                        "timestamp": timestamp,
-                        "station_id": station_id,
-                        "value": value if value else 0
-                    })
-    
-    return records
+    # PM25 格式不同：readings 是字典而不是列表，使用虚拟 station_id PM25_{region}
+    return columns.add(data, dtype)
 
 
-def main():
+def main(incremental=False):
     print("🔄 转换 govdata JSON 到 CSV...")
     
     # 查找所有 JSON 文件
@@ -59,44 +38,27 @@ def main():
         print("❌ 没有找到 JSON 文件")
         return
     
-    # 按类型分组
-    data_by_type = {"rainfall": [], "temperature": [], "humidity": [], "pm25": []}
+    if incremental:
+        ingest_incremental(json_files)
+        return
+    
+    # 按类型解析，读数直接写入列式数组
+    columns = ReadingColumns()
     
     for f in json_files:
         filename = f.name
-        for dtype in data_by_type.keys():
+        for dtype in SENSOR_TYPES:
             if filename.startswith(dtype):
-                records = parse_json_file(f, dtype)
-                for r in records:
-                    r["type"] = dtype
-                data_by_type[dtype].extend(records)
-                print(f"   ✓ {filename}: {len(records)} 条记录")
+                count = parse_json_file(f, dtype, columns)
+                print(f"   ✓ {filename}: {count} 条记录")
                 break
     
-    # 合并数据
-    all_data = []
-    for dtype, records in data_by_type.items():
-        for r in records:
-            all_data.append(r)
-    
-    if not all_data:
+    if not len(columns):
         print("❌ 没有数据可转换")
         return
     
-    # 创建 DataFrame
-    df = pd.DataFrame(all_data)
-    
-    # 透视表：每个 (timestamp, station_id) 一行，各类型为列
-    pivot = df.pivot_table(
-        index=["timestamp", "station_id"],
-        columns="type",
-        values="value",
-        aggfunc="first"
-    ).reset_index()
-    
-    # 重命名列
-    pivot.columns.name = None
-    pivot = pivot.rename(columns={"station_id": "sensor_id"})
+    # 宽表：每个 (timestamp, sensor_id) 一行，各类型为列
+    pivot = columns.to_frame()
     
     # 确保所有列存在
     for col in ["humidity", "pm25", "rainfall", "temperature"]:
@@ -106,15 +68,55 @@ def main():
     # 排序列
     pivot = pivot[["timestamp", "sensor_id", "humidity", "pm25", "rainfall", "temperature"]]
     
-    # 填充缺失值
+    # 填充缺失值（None 读数在解析时为 NaN，这里落为 0）
     pivot = pivot.fillna(0.0)
     
     # 保存
     pivot.to_csv(OUTPUT_FILE, index=False)
     
+    # 记录已导入文件，之后可切换到 --incremental
+    ledger = IngestLedger()
+    ledger.reset({f.name: file_fingerprint(f) for f in json_files}, pivot["timestamp"].max())
+    ledger.save()
+    
     print(f"✅ 已保存到 {OUTPUT_FILE}")
     print(f"   行数: {len(pivot)}")
     print(f"   日期范围: {pivot['timestamp'].min()} ~ {pivot['timestamp'].max()}")
 
+def ingest_incremental(json_files):
+    """增量导入：跳过指纹未变化的文件，新数据 upsert 到 OUTPUT_FILE"""
+    ledger = IngestLedger()
+    columns = ReadingColumns()
+    ingested = []
+    
+    for f in sorted(json_files):
+        fingerprint = file_fingerprint(f)
+        if ledger.is_ingested(f.name, fingerprint):
+            continue
+        for dtype in SENSOR_TYPES:
+            if f.name.startswith(dtype):
+                count = parse_json_file(f, dtype, columns)
+                ingested.append((f.name, fingerprint))
+                print(f"   ✓ {f.name}: {count} 条记录")
+                break
+    
+    if not ingested:
+        print("✅ 没有新文件需要导入")
+        return
+    
+    new_rows = columns.to_frame()
+    mode = upsert_rows(new_rows, OUTPUT_FILE, ledger)
+    
+    for name, fingerprint in ingested:
+        ledger.mark(name, fingerprint)
+    ledger.save()
+    
+    print(f"✅ 增量导入 {len(ingested)} 个文件 ({mode}) -> {OUTPUT_FILE}")
+    print(f"   新增/更新行数: {len(new_rows)}")
+
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="govdata JSON -> real_sensor_data.csv")
+    parser.add_argument("--incremental", action="store_true", help="只导入新增/变化的文件")
+    args = parser.parse_args()
+    main(incremental=args.incremental)
@@ -5,6 +5,9 @@ from datetime import datetime, timedelta
 import time
 import subprocess
 import re
+import fcntl
+import tempfile
+import threading
 
 # --- USER CONFIGURATION ---
 # Please register at https://www.eorc.jaxa.jp/ptree/registration_top.html
@@ -19,6 +22,18 @@ DOWNLOAD_DIR = "satellite_data"
 # JAXA Path format: /jma/netcdf/YYYYMM/DD/
 REMOTE_BASE_PATH = "/jma/netcdf"
 
+# Full Disk (FLDK) file names
+# Expected: NC_H09_YYYYMMDD_HHMM_R21_FLDK.06001_06001.nc (or 07001)
+FLDK_PATTERN = re.compile(r"^NC_H09_\d{8}_\d{4}_R21_FLDK\.0[67]001_06001\.nc$")
+
+# --- Live ingest (daemon mode) ---
+# Cropped 64x64 frames are written here (same layout as preprocess_images.py)
+PROCESSED_DIR = "processed_data"
+# How often the daemon lists the JAXA directory for a new slot
+SAT_POLL_SECONDS = float(os.environ.get("SAT_POLL_SECONDS", "30"))
+# Only the process holding this lock ingests (every API worker and a standalone daemon may run one)
+INGEST_LOCK = os.path.join(PROCESSED_DIR, ".ingest.lock")
+
 # Helper: Run curl command
 def run_curl_list(remote_path):
     """List files using curl."""
@@ -69,9 +84,7 @@ def download_latest_files(hours_to_check=1):
         files = run_curl_list(remote_path)
         
         # Filter for Full Disk (FLDK) using Regex
-        # Expected: NC_H09_YYYYMMDD_HHMM_R21_FLDK.06001_06001.nc (or 07001)
-        pattern = re.compile(r"^NC_H09_\d{8}_\d{4}_R21_FLDK\.0[67]001_06001\.nc$")
-        target_files = [f for f in files if pattern.match(f)]
+        target_files = [f for f in files if FLDK_PATTERN.match(f)]
         
         for file_name in target_files:
             local_path = os.path.join(DOWNLOAD_DIR, file_name)
@@ -91,15 +104,13 @@ def upload_to_s3(local_path, file_name):
     """Upload a file to S3."""
     if not S3_BUCKET: return
     
-    endpoint_url = os.environ.get("S3_ENDPOINT_URL")
-    
-    import boto3
-    s3 = boto3.client('s3', endpoint_url=endpoint_url)
+    from storage import upload_file
     
     s3_key = f"{S3_PREFIX}/{file_name}"
     print(f"  > Uploading to s3://{S3_BUCKET}/{s3_key} ...")
     try:
-        s3.upload_file(local_path, S3_BUCKET, s3_key)
+        # Full-disk files are large: multipart + concurrent parts via the shared transfer config
+        upload_file(local_path, S3_BUCKET, s3_key)
         # Optional: Delete local file after upload to save space?
         # os.remove(local_path) 
     except Exception as e:
@@ -122,8 +133,7 @@ def download_range(start_date, end_date):
         files = run_curl_list(remote_path)
         
         # Filter for Full Disk (FLDK) using Regex
-        pattern = re.compile(r"^NC_H09_\d{8}_\d{4}_R21_FLDK\.0[67]001_06001\.nc$")
-        target_files = [f for f in files if pattern.match(f)]
+        target_files = [f for f in files if FLDK_PATTERN.match(f)]
         
         for file_name in target_files:
             # Check if file timestamp matches current hour?
@@ -151,6 +161,122 @@ def download_range(start_date, end_date):
     
     print("Batch download complete.")
 
+def frame_slot(file_name):
+    """NC_H09_YYYYMMDD_HHMM_... -> 'YYYYMMDD_HHMM' (UTC observation slot)"""
+    return "_".join(file_name.split("_")[2:4])
+
+def list_recent_fldk(now, hours=1):
+    """[(remote_path, file_name), ...] of Full Disk files from the last `hours`, oldest first."""
+    days = sorted({(now - timedelta(hours=h)).strftime("%Y%m/%d") for h in (0, hours)})
+    oldest = (now - timedelta(hours=hours)).strftime("%Y%m%d_%H%M")
+    found = []
+    for day in days:
+        remote_path = f"{REMOTE_BASE_PATH}/{day}"
+        found += [(remote_path, f) for f in run_curl_list(remote_path)
+                  if FLDK_PATTERN.match(f) and frame_slot(f) >= oldest]
+    return sorted(found, key=lambda x: x[1])
+
+def ingest_file(remote_path, file_name, on_frame=None, keep_raw=True):
+    """
+    Download one Full Disk file, crop/resize it in memory (only the Singapore window is read)
+    and publish the 64x64 frame: processed_data/*.npy (atomic rename) and on_frame(slot, frame).
+    Returns the frame, or None on failure.
+    """
+    import numpy as np
+    import xarray as xr
+    from preprocess_images import extract_frame
+
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    local_path = os.path.join(DOWNLOAD_DIR, file_name)
+    if not os.path.exists(local_path):
+        # Unique temp name: another downloader never writes into the same partial file
+        fd, part_path = tempfile.mkstemp(dir=DOWNLOAD_DIR, prefix=f"{file_name}.", suffix=".part")
+        os.close(fd)
+        try:
+            if not run_curl_download(remote_path, file_name, part_path):
+                return None
+            os.replace(part_path, local_path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    try:
+        with xr.open_dataset(local_path, decode_timedelta=False) as ds:
+            frame = extract_frame(ds)
+    except Exception as e:
+        print(f"  > Failed to read {file_name}: {e}")
+        return None
+    if frame is None:
+        print(f"  > {file_name}: brightness temperature variable not found")
+        return None
+    frame = np.asarray(frame, dtype=np.float32)
+
+    # Serving first: in-process frame cache, then the on-disk store the API also reads
+    slot = frame_slot(file_name)
+    if on_frame is not None:
+        on_frame(slot, frame)
+    out_path = os.path.join(PROCESSED_DIR, file_name.replace(".nc", ".npy"))
+    fd, tmp_path = tempfile.mkstemp(dir=PROCESSED_DIR, prefix=f".{file_name}.", suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, frame)
+    os.replace(tmp_path, out_path)
+
+    if S3_BUCKET:
+        upload_to_s3(local_path, file_name)
+    if not keep_raw:
+        os.remove(local_path)
+    return frame
+
+def try_ingest_lock(path=INGEST_LOCK):
+    """Non-blocking flock on `path`: the open lock file (hold it to stay the ingester), or None."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    lock = open(path, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+def run_daemon(hours=1, interval=SAT_POLL_SECONDS, on_frame=None, keep_raw=True, stop_event=None):
+    """
+    Long-running live ingest: every `interval` seconds list the JAXA directory and ingest
+    Full Disk files not yet in processed_data, newest first, so the latest slot is servable
+    within seconds of release. Older gaps (within `hours`) are filled afterwards.
+
+    Only one process ingests: the one holding INGEST_LOCK. Other daemons (one per API worker)
+    keep retrying the lock and take over if the ingester exits; until then their workers
+    read the frames it writes to processed_data.
+    """
+    stop_event = stop_event or threading.Event()
+    lock = None
+    print(f"Live ingest: polling every {interval:g}s, publishing to {PROCESSED_DIR}")
+    while not stop_event.is_set():
+        if lock is None:
+            lock = try_ingest_lock()
+            if lock is None:
+                stop_event.wait(interval)
+                continue
+            print(f"Live ingest: holding {INGEST_LOCK}")
+        try:
+            pending = [(path, name) for path, name in list_recent_fldk(datetime.utcnow(), hours)
+                       if not os.path.exists(os.path.join(PROCESSED_DIR, name.replace(".nc", ".npy")))]
+            for remote_path, file_name in reversed(pending):
+                if stop_event.is_set():
+                    break
+                start = time.time()
+                if ingest_file(remote_path, file_name, on_frame, keep_raw) is not None:
+                    released = datetime.strptime(frame_slot(file_name), "%Y%m%d_%H%M")
+                    age = (datetime.utcnow() - released).total_seconds()
+                    print(f"  > Published {frame_slot(file_name)} in {time.time() - start:.1f}s "
+                          f"(slot age {age / 60:.1f} min)")
+        except Exception as e:
+            print(f"Live ingest error: {e}")
+        stop_event.wait(interval)
+    if lock is not None:
+        lock.close()
+
 def main():
     import argparse
     parser = argparse.ArgumentParser()
@@ -158,6 +284,8 @@ def main():
     parser.add_argument("--hours", type=int, default=1, help="Hours back to check (for daemon or simple batch)")
     parser.add_argument("--start", type=str, help="Start date YYYY-MM-DD (for batch)")
     parser.add_argument("--end", type=str, help="End date YYYY-MM-DD (for batch)")
+    parser.add_argument("--interval", type=float, default=SAT_POLL_SECONDS, help="Seconds between directory polls (daemon)")
+    parser.add_argument("--discard-raw", action="store_true", help="Delete the full-disk .nc after cropping (daemon)")
     
     args = parser.parse_args()
 
@@ -188,11 +316,12 @@ def main():
              s = e - timedelta(hours=args.hours)
              download_range(s, e)
     else:
-        # Daemon Mode (Not actively updated for S3 in this snippet for brevity, but follows same logic)
+        # Daemon Mode: poll for new Full Disk files, crop in memory, publish 64x64 frames
         print("Starting JAXA Satellite Downloader (Daemon)...")
-        # ... logic similar to batch ...
-        # (Placeholder for daemon logic)
-        download_latest_files(args.hours)
+        try:
+            run_daemon(args.hours, args.interval, keep_raw=not args.discard_raw)
+        except KeyboardInterrupt:
+            print("Stopped.")
 
 if __name__ == "__main__":
     main()
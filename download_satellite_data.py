@@ -1,7 +1,5 @@
-import boto3
-from botocore import UNSIGNED
-from botocore.config import Config
 import os
+from storage import get_s3_client, TRANSFER_CONFIG
 
 BUCKET_NAME = "noaa-himawari8"
 # Target path: noaa-himawari8/AHI-L1b-FLDK/2024/01/20/0400/
@@ -12,7 +10,7 @@ def download_with_boto3():
     print(f"Connecting to AWS S3 Bucket: {BUCKET_NAME} (Anonymous Mode)...")
     
     # Configure anonymous access (No keys needed)
-    s3 = boto3.client('s3', config=Config(signature_version=UNSIGNED))
+    s3 = get_s3_client(unsigned=True)
     
     try:
         print(f"Listing objects in prefix: {PREFIX}")
@@ -42,7 +40,7 @@ def download_with_boto3():
         print(f"Size: {response['Contents'][0]['Size'] / 1024 / 1024:.2f} MB")
         print(f"Downloading to: {local_filename} ...")
         
-        s3.download_file(BUCKET_NAME, target_key, local_filename)
+        s3.download_file(BUCKET_NAME, target_key, local_filename, Config=TRANSFER_CONFIG)
         print("\nDownload Complete!")
         
         # Verify with xarray
@@ -1,12 +1,14 @@
 import torch
 import torch.nn as nn
-from weather_fusion_model import WeatherFusionNet
-from weather_dataset import get_dataloaders
+from weather_fusion_model import WeatherFusionNet, prediction_dim_from_state_dict, horizon_minutes
+from weather_dataset import get_validation_loader, SPLIT_FILE
 import matplotlib
 matplotlib.use('Agg') # Headless mode for Cloud/Server
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import time
+from torch.utils.data import Subset
 
 # --- Config ---
 MODEL_PATH = "weather_fusion_model.pth"
@@ -14,59 +16,192 @@ CSV_PATH = "real_sensor_data.csv"
 SAT_DIR = "satellite_data"
 DEVICE = torch.device("cpu") # Eval on CPU is fine usually
 
+# Batched evaluation (override via env)
+EVAL_BATCH_SIZE = int(os.environ.get('EVAL_BATCH_SIZE', 256))
+EVAL_NUM_WORKERS = int(os.environ.get('EVAL_NUM_WORKERS', 0))
+RAIN_THRESHOLD = 0.1     # Rain vs No-Rain (mm)
+PLOT_SAMPLE_LIMIT = 5000 # Only the first N samples are kept for plotting
+LOCAL_TZ = "Asia/Singapore"  # per_hour buckets are local hours
+
+
+class StreamingMetrics:
+    """
+    Accumulates regression + rain-detection metrics batch by batch.
+    Memory is constant in the number of samples (only running sums are kept),
+    except for a bounded sample buffer used for plotting.
+    """
+    def __init__(self, sensor_ids, threshold=RAIN_THRESHOLD, plot_limit=PLOT_SAMPLE_LIMIT):
+        self.sensor_ids = list(sensor_ids)
+        self.threshold = threshold
+        self.plot_limit = plot_limit
+
+        self.count = 0
+        self.sum_abs = 0.0
+        self.sum_sq = 0.0
+        # Confusion matrix [[tn, fp], [fn, tp]] (rows: actual, cols: predicted)
+        self.confusion = np.zeros((2, 2), dtype=np.int64)
+
+        n_sensors = len(self.sensor_ids)
+        self.sensor_stats = np.zeros((3, n_sensors))  # count, sum_abs, sum_sq
+        self.hour_stats = np.zeros((3, 24))
+
+        self.plot_preds = []
+        self.plot_actuals = []
+
+    def update(self, preds, actuals, sensor_codes, hours):
+        """All arguments are 1-D numpy arrays of the same length."""
+        err = preds - actuals
+        abs_err = np.abs(err)
+        sq_err = err ** 2
+
+        self.count += len(preds)
+        self.sum_abs += float(abs_err.sum())
+        self.sum_sq += float(sq_err.sum())
+
+        pred_rain = (preds > self.threshold).astype(np.int64)
+        true_rain = (actuals > self.threshold).astype(np.int64)
+        self.confusion += np.bincount(true_rain * 2 + pred_rain, minlength=4).reshape(2, 2)
+
+        for stats, codes, size in ((self.sensor_stats, sensor_codes, len(self.sensor_ids)),
+                                   (self.hour_stats, hours, 24)):
+            stats[0] += np.bincount(codes, minlength=size)
+            stats[1] += np.bincount(codes, weights=abs_err, minlength=size)
+            stats[2] += np.bincount(codes, weights=sq_err, minlength=size)
+
+        room = self.plot_limit - len(self.plot_preds)
+        if room > 0:
+            self.plot_preds.extend(preds[:room].tolist())
+            self.plot_actuals.extend(actuals[:room].tolist())
+
+    @staticmethod
+    def _breakdown(stats, labels):
+        out = {}
+        for i, label in enumerate(labels):
+            n = stats[0, i]
+            if n == 0:
+                continue
+            out[str(label)] = {
+                'mae': float(stats[1, i] / n),
+                'rmse': float(np.sqrt(stats[2, i] / n)),
+                'num_samples': int(n)
+            }
+        return out
+
+    def results(self):
+        n = max(self.count, 1)
+        (tn, fp), (fn, tp) = self.confusion.tolist()
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        return {
+            'mae': self.sum_abs / n,
+            'rmse': float(np.sqrt(self.sum_sq / n)),
+            'accuracy': (tp + tn) / n,
+            'threshold': float(self.threshold),
+            'num_samples': self.count,
+            'confusion_matrix': {'tn': tn, 'fp': fp, 'fn': fn, 'tp': tp},
+            'precision': precision,
+            'recall': recall,
+            'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            'per_sensor': self._breakdown(self.sensor_stats, self.sensor_ids),
+            'per_hour': self._breakdown(self.hour_stats, range(24)),
+        }
+
+
+def local_hour(ts):
+    """Singapore-local hour of a sample timestamp (naive CSV timestamps are already local)."""
+    return ts.tz_convert(LOCAL_TZ).hour if ts.tzinfo is not None else ts.hour
+
+
+def sample_metadata(dataset, indices):
+    """Sensor id and local (first) target hour for each sample, in loader order."""
+    sensor_ids = sorted({dataset.samples[i]['sensor_id'] for i in indices})
+    sensor_code = {sid: c for c, sid in enumerate(sensor_ids)}
+    codes = np.empty(len(indices), dtype=np.int64)
+    hours = np.empty(len(indices), dtype=np.int64)
+    for j, i in enumerate(indices):
+        info = dataset.samples[i]
+        codes[j] = sensor_code[info['sensor_id']]
+        hours[j] = local_hour(info['first_target_ts'])
+    return sensor_ids, codes, hours
+
+
 def evaluate_model():
-    # Set seed for reproducibility relative to train.py (if train uses same seed)
-    torch.manual_seed(42)
-    
-    # 1. Load Data (Validation Set Only)
-    _, val_loader = get_dataloaders(CSV_PATH, SAT_DIR, batch_size=1, split=0.8)
-    
-    # 2. Load Model
-    model = WeatherFusionNet(sat_channels=1, sensor_features=3, prediction_dim=1)
-    if os.path.exists(MODEL_PATH):
-        model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
-        print(f"Loaded model from {MODEL_PATH}")
-    else:
+    # 1. Load Model (the checkpoint decides how many horizons to evaluate)
+    if not os.path.exists(MODEL_PATH):
         print("Model file not found! Train first.")
         return
+    state_dict = torch.load(MODEL_PATH, map_location=DEVICE)
+    num_horizons = prediction_dim_from_state_dict(state_dict)
+    model = WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=num_horizons)
+    model.load_state_dict(state_dict)
+    print(f"Loaded model from {MODEL_PATH} ({num_horizons} horizon(s))")
+    
+    # 2. Load Data (Validation Set Only, time-blocked holdout persisted by train.py)
+    val_loader = get_validation_loader(CSV_PATH, SAT_DIR, batch_size=EVAL_BATCH_SIZE,
+                                       split_file=SPLIT_FILE, num_horizons=num_horizons,
+                                       num_workers=EVAL_NUM_WORKERS)
+    val_ds = val_loader.dataset
+    if isinstance(val_ds, Subset):
+        sensor_ids, sensor_codes, hours = sample_metadata(val_ds.dataset, val_ds.indices)
+    else:
+        sensor_ids, sensor_codes, hours = sample_metadata(val_ds, range(len(val_ds)))
     
     model.to(DEVICE)
     model.eval()
     
-    predictions = []
-    actuals = []
+    metrics = StreamingMetrics(sensor_ids)
+    # Error sums per horizon (headline metrics below are for the first, 10-minute horizon)
+    horizon_abs = np.zeros(num_horizons)
+    horizon_sq = np.zeros(num_horizons)
     
-    print("Running evaluation...")
-    with torch.no_grad():
+    print(f"Running evaluation (batch size {EVAL_BATCH_SIZE})...")
+    start_time = time.perf_counter()
+    offset = 0
+    with torch.inference_mode():
         for sat, sensor, target in val_loader:
             sat, sensor = sat.to(DEVICE), sensor.to(DEVICE)
             output = model(sat, sensor)
             
             # Simple clamping to avoid negative rain
-            pred_val = max(0.0, output.item())
+            curve = output.clamp_min(0.0).view(-1, num_horizons).cpu().numpy().astype(np.float64)
+            actual_curve = target.view(-1, num_horizons).numpy().astype(np.float64)
+            horizon_abs += np.abs(curve - actual_curve).sum(axis=0)
+            horizon_sq += ((curve - actual_curve) ** 2).sum(axis=0)
+            preds, actuals = curve[:, 0], actual_curve[:, 0]
             
-            predictions.append(pred_val)
-            actuals.append(target.item())
+            n = len(preds)
+            metrics.update(preds, actuals, sensor_codes[offset:offset + n], hours[offset:offset + n])
+            offset += n
+    elapsed = time.perf_counter() - start_time
             
     # 3. Calculate Metrics
-    predictions = np.array(predictions)
-    actuals = np.array(actuals)
-    
-    mae = np.mean(np.abs(predictions - actuals))
-    rmse = np.sqrt(np.mean((predictions - actuals)**2))
-    
-    # Classification Metric (Rain vs No-Rain) threshold 0.1mm
-    threshold = 0.1
-    pred_rain = predictions > threshold
-    true_rain = actuals > threshold
-    accuracy = np.mean(pred_rain == true_rain)
+    results = metrics.results()
+    results['batch_size'] = EVAL_BATCH_SIZE
+    n = max(results['num_samples'], 1)
+    results['horizons'] = [
+        {'minutes': m, 'mae': float(horizon_abs[k] / n), 'rmse': float(np.sqrt(horizon_sq[k] / n))}
+        for k, m in enumerate(horizon_minutes(num_horizons))
+    ]
+    results['samples_per_sec'] = results['num_samples'] / elapsed if elapsed > 0 else 0.0
+    
+    mae, rmse, accuracy, threshold = results['mae'], results['rmse'], results['accuracy'], results['threshold']
+    cm = results['confusion_matrix']
     
     print("\n--- Evaluation Results ---")
     print(f"MAE  (Mean Abs Error):   {mae:.4f} mm")
     print(f"RMSE (Root Mean Sq Err): {rmse:.4f} mm")
     print(f"Rain Detection Acc:      {accuracy*100:.2f}% (Threshold {threshold}mm)")
+    print(f"Rain Precision/Recall:   {results['precision']:.3f} / {results['recall']:.3f} "
+          f"(TP {cm['tp']} FP {cm['fp']} FN {cm['fn']} TN {cm['tn']})")
+    print(f"Throughput:              {results['samples_per_sec']:.1f} samples/s ({results['num_samples']} samples)")
+    if num_horizons > 1:
+        print("Per-horizon MAE / RMSE:  " + ", ".join(
+            f"{h['minutes']}min {h['mae']:.3f}/{h['rmse']:.3f}" for h in results['horizons']))
     print("--------------------------")
     
+    predictions = np.array(metrics.plot_preds)
+    actuals = np.array(metrics.plot_actuals)
+    
     # 4. Plotting (2 Subplots)
     plt.figure(figsize=(12, 5))
     
@@ -80,7 +215,7 @@ def evaluate_model():
     plt.legend()
     plt.grid(True, alpha=0.3)
     
-    # Plot 2: Scatter (Pred vs Actual)
+    # Plot 2: Scatter (Pred vs Actual, first PLOT_SAMPLE_LIMIT samples)
     plt.subplot(1, 2, 2)
     plt.scatter(actuals, predictions, alpha=0.5, s=10)
     
@@ -103,14 +238,6 @@ def evaluate_model():
     
     # 5. 保存评估结果为JSON（供自动化流程使用）
     import json
-    results = {
-        'mae': float(mae),
-        'rmse': float(rmse),
-        'accuracy': float(accuracy),
-        'threshold': float(threshold),
-        'num_samples': len(predictions)
-    }
-    
     results_file = "evaluation_results.json"
     with open(results_file, 'w') as f:
         json.dump(results, f, indent=2)
@@ -4,6 +4,9 @@ import datetime
 import os
 import time
 
+from govdata_parser import ReadingColumns
+from sensor_store import IngestLedger, upsert_rows
+
 # --- Configuration ---
 # FETCH_CONFIG can contain:
 # 1. Single datetime.date objects: datetime.date(2026, 1, 22)
@@ -32,6 +35,10 @@ if os.environ.get('FETCH_START_DATE') and os.environ.get('FETCH_END_DATE'):
         print(f"Error parsing env dates: {err}")
 
 OUTPUT_FILE = "real_sensor_data.csv"
+
+# 🆕 Incremental ingest: skip days already recorded in the ingest ledger and
+# upsert new rows into OUTPUT_FILE instead of rewriting it.
+INCREMENTAL = os.environ.get('FETCH_INCREMENTAL', '0') == '1'
 # TODO: Replace with your actual .pem or .crt file path
 # CUSTOM_CERT_PATH = "/path/to/your/custom_root_ca.pem"
 CUSTOM_CERT_PATH = "${HOME}/.config/cloudflare/combined-bundle.pem"
@@ -69,11 +76,11 @@ def get_region_from_latlon(lat, lon):
     return best_region
 
 def fetch_data(date_str, type_key):
-    """Fetch one day of data for a specific type (e.g., rainfall)."""
+    """Fetch one day of data for a specific type (e.g., rainfall); date_str=None fetches the latest readings."""
     url = f"{BASE_URL}/{ENDPOINTS[type_key]}"
-    params = {"date": date_str}
+    params = {"date": date_str} if date_str else {}
     
-    print(f"  Fetching {type_key} for {date_str}...")
+    print(f"  Fetching {type_key} for {date_str or 'latest'}...")
     try:
         # Use custom cert path if it exists, otherwise default to True (Standard Trust Store)
         # Verify argument can trigger error if path is invalid, so ensure path is correct.
@@ -94,15 +101,8 @@ def fetch_data(date_str, type_key):
         print(f"    Error: {e}")
         return None
 
-def process_day(date_obj):
-    date_str = date_obj.strftime("%Y-%m-%d")
-    print(f"Processing {date_str}...")
-    
-    # 1. Fetch metadata first (to build station map)
-    # We use temperature call to get station metadata
-    print("    Fetching metadata from temperature endpoint...")
-    temp_data = fetch_data(date_str, "temperature")
-    
+def station_regions(temp_data):
+    """station_id -> PM2.5 region key, from the station metadata of a temperature response."""
     station_region_map = {} # station_id -> region_key
     
     if temp_data and 'metadata' in temp_data and 'stations' in temp_data['metadata']:
@@ -112,6 +112,25 @@ def process_day(date_obj):
                 lon = s['location']['longitude']
                 sid = s['id']
                 station_region_map[sid] = get_region_from_latlon(lat, lon)
+    return station_region_map
+
+def process_day(date_obj):
+    date_str = date_obj.strftime("%Y-%m-%d")
+    print(f"Processing {date_str}...")
+    return fetch_frame(date_str)
+
+def fetch_latest():
+    """Wide frame of the latest real-time readings (one poll of every endpoint)."""
+    return fetch_frame(None, pause=0)
+
+def fetch_frame(date_str, pause=0.5):
+    """Fetch every endpoint for one day (or the latest readings when date_str is None) as a wide frame."""
+    # 1. Fetch metadata first (to build station map)
+    # We use temperature call to get station metadata
+    print("    Fetching metadata from temperature endpoint...")
+    temp_data = fetch_data(date_str, "temperature")
+    
+    station_region_map = station_regions(temp_data)
     
     # 2. Fetch all types
     data_raw = {}
@@ -120,75 +139,32 @@ def process_day(date_obj):
     for key in ENDPOINTS:
         if key == 'temperature': continue
         data_raw[key] = fetch_data(date_str, key)
-        time.sleep(0.5)
+        time.sleep(pause)
 
     # 2. Flatten Data
     # structure: { metadata: {stations...}, items: [{timestamp, readings: [{station_id, value}]}] }
-    
-    records = []
-    
-    # We drive by Timestamp from one metric (e.g. Temperature) and try to match others
-    # Or better: Flatten everything into (Timestamp, StationID, Type, Value) then pivot.
-    
+    # Readings are written column-wise into typed arrays and reshaped into the wide
+    # [timestamp, sensor_id] -> [temperature, rainfall, humidity, pm25] table in one pass.
+    # Data.gov.sg timestamps are usually consistent per minute.
+    columns = ReadingColumns()
+
     for dtype, json_data in data_raw.items():
         if not json_data or 'items' not in json_data:
             continue
-            
+
         if dtype == 'pm25':
             # Structure: items -> [{timestamp, readings: {pm25_one_hourly: {west: X, ...}}}]
-            # Iterate through time steps
-            for item in json_data['items']:
-                timestamp = item['timestamp']
-                if 'readings' not in item or 'pm25_one_hourly' not in item['readings']:
-                    continue
-                    
-                regional_readings = item['readings']['pm25_one_hourly']
-                
-                # For every known station, assign the value of its region
-                for sid, region_key in station_region_map.items():
-                    if region_key in regional_readings:
-                        val = regional_readings[region_key]
-                        
-                        records.append({
-                            "timestamp": timestamp,
-                            "sensor_id": sid,
-                            "type": "pm25",
-                            "value": val
-                        })
+            # For every known station, assign the value of its region
+            columns.add(json_data, dtype, station_region_map)
         else:
             # Standard Structure: items -> [{timestamp, readings: [{station_id: ..., value: ...}]}]
-            for item in json_data['items']:
-                timestamp = item['timestamp']
-                for reading in item['readings']:
-                    sid = reading['station_id']
-                    val = reading['value']
-                    
-                    records.append({
-                        "timestamp": timestamp,
-                        "sensor_id": sid,
-                        "type": dtype,
-                        "value": val
-                    })
-
-    if not records:
+            columns.add(json_data, dtype)
+
+    if not len(columns):
         return pd.DataFrame()
 
-    df = pd.DataFrame(records)
-    
-    # 3. Pivot to wide format: [timestamp, sensor_id] -> [temperature, rainfall, humidity]
-    # Timestamp might slightly differ (seconds), so needs careful merge or rough rounding.
-    # Data.gov.sg timestamps are usually consistent per minute.
-    
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    
-    # Pivot
-    df_pivot = df.pivot_table(
-        index=['timestamp', 'sensor_id'], 
-        columns='type', 
-        values='value'
-    ).reset_index()
-    
-    return df_pivot
+    # Duplicate readings are averaged, as the old pivot_table did
+    return columns.to_frame(duplicates="mean")
 
 def main():
     all_dfs = []
@@ -217,10 +193,20 @@ def main():
 
     print(f"Scheduled to fetch {len(sorted_dates)} days: {[d.isoformat() for d in sorted_dates]}")
 
+    ledger = IngestLedger() if INCREMENTAL else None
+    ingested_dates = []
+
     for current_date in sorted_dates:
+        source_key = f"nea:{current_date.isoformat()}"
+        if ledger is not None and ledger.is_ingested(source_key):
+            print(f"Skipping {current_date} (already ingested)")
+            continue
         df_day = process_day(current_date)
         if not df_day.empty:
             all_dfs.append(df_day)
+            # Today's data is still growing, so only completed days are recorded
+            if current_date < datetime.date.today():
+                ingested_dates.append(source_key)
         
     if not all_dfs:
         print("No data fetched.")
@@ -244,8 +230,20 @@ def main():
     # Fill NaNs
     final_df = final_df.ffill().fillna(0.0)
 
-    print(f"Saving {len(final_df)} rows to {OUTPUT_FILE}...")
-    final_df.to_csv(OUTPUT_FILE, index=False)
+    if ledger is not None:
+        print(f"Upserting {len(final_df)} rows into {OUTPUT_FILE}...")
+        mode = upsert_rows(final_df, OUTPUT_FILE, ledger)
+        for source_key in ingested_dates:
+            ledger.mark(source_key)
+        ledger.save()
+        print(f"Incremental ingest: {mode}")
+    else:
+        print(f"Saving {len(final_df)} rows to {OUTPUT_FILE}...")
+        final_df.to_csv(OUTPUT_FILE, index=False)
+        # The CSV now holds only these days: a later FETCH_INCREMENTAL=1 run must not trust the old ledger
+        ledger = IngestLedger()
+        ledger.reset({key: {} for key in ingested_dates}, final_df['timestamp'].max())
+        ledger.save()
     print("Done! You can now use this file in train.py")
     print(f"Example:\n{final_df.head()}")
 
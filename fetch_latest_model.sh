@@ -27,10 +27,29 @@ if [ -f "$MODEL_FILE" ]; then
 fi
 
 echo "[$(timestamp)] Downloading model..."
-aws s3 cp "$S3_BUCKET/models/latest.pth" "$MODEL_FILE" $ENDPOINT_FLAG
+# 先下载到临时文件再原子替换，运行中的 API（模型热更新）不会读到写了一半的文件
+aws s3 cp "$S3_BUCKET/models/latest.pth" "${MODEL_FILE}.download" $ENDPOINT_FLAG && mv "${MODEL_FILE}.download" "$MODEL_FILE"
 
 if [ $? -eq 0 ]; then
     echo "[$(timestamp)] ✅ Successfully downloaded latest model."
+
+    # 导出推理后端文件（TorchScript / ONNX），使用本机的 torch / onnxruntime 版本
+    echo "[$(timestamp)] Exporting inference artifacts..."
+    if python3 inference_backend.py export; then
+        echo "[$(timestamp)] ✅ Inference artifacts exported."
+    else
+        echo "[$(timestamp)] ⚠️ Export failed, API will fall back to eager PyTorch."
+    fi
+    
+    # INFERENCE_BACKEND=quantized: 量化 + 验证集精度检查，通过后才导出 int8 模型
+    if [ "$INFERENCE_BACKEND" = "quantized" ]; then
+        echo "[$(timestamp)] Quantizing model (int8)..."
+        if python3 inference_backend.py quantize; then
+            echo "[$(timestamp)] ✅ Quantized model passed the accuracy check."
+        else
+            echo "[$(timestamp)] ⚠️ Quantization rejected, API will fall back to eager PyTorch."
+        fi
+    fi
     
     # 下载传感器数据
     echo "[$(timestamp)] Fetching sensor data..."
@@ -44,10 +63,10 @@ if [ $? -eq 0 ]; then
     echo "[$(timestamp)] 同步完成"
     echo "============================================"
     
-    # Optional: Restart API service
-    # sudo systemctl restart weather-api
+    # 运行中的 API 会自动热更新到新模型（MODEL_WATCH_INTERVAL），无需重启服务
 else
     echo "[$(timestamp)] ❌ Failed to download model."
+    rm -f "${MODEL_FILE}.download"
     # Restore backup if download failed
     if [ -f "${MODEL_FILE}.backup" ]; then
         mv "${MODEL_FILE}.backup" "$MODEL_FILE"
@@ -0,0 +1,182 @@
+"""
+govdata_parser.py
+NEA (data.gov.sg) JSON 列式解析
+
+将 items -> readings 结构直接写入预分配的 NumPy 数组（时间戳/站点以整数编码），
+再通过一次排序 + 重排生成 (timestamp, sensor_id) 宽表，
+替代「每条读数一个 dict + pivot_table」的做法。
+"""
+
+import numpy as np
+import pandas as pd
+
+# 宽表中的数据列（按字母顺序，与 real_sensor_data.csv 列顺序一致）
+SENSOR_TYPES = ["humidity", "pm25", "rainfall", "temperature"]
+
+
+def _code(table, key):
+    """字符串 -> 连续整数编码"""
+    code = table.get(key)
+    if code is None:
+        code = len(table)
+        table[key] = code
+    return code
+
+
+class ReadingColumns:
+    """
+    按列累积多个 NEA JSON 文档的读数
+
+    用法:
+        cols = ReadingColumns()
+        cols.add(json_data, "rainfall")
+        cols.add(pm25_json, "pm25", station_region_map)
+        wide_df = cols.to_frame()
+    """
+
+    def __init__(self):
+        self._ts_codes = {}   # timestamp 字符串 -> 编码
+        self._sid_codes = {}  # sensor_id -> 编码
+        self._chunks = []     # [(ts_code, sid_code, type_code, value), ...]
+        self.types_seen = set()
+
+    def __len__(self):
+        return sum(len(c[0]) for c in self._chunks)
+
+    def add(self, data, dtype, station_region_map=None):
+        """
+        解析单个 JSON 文档
+
+        Args:
+            data: 已解析的 JSON (dict)
+            dtype: SENSOR_TYPES 中的一种
+            station_region_map: 仅 PM2.5 使用。提供时把区域读数广播到该区域的每个站点；
+                                否则使用虚拟站点 PM25_{region}
+
+        Returns:
+            写入的读数条数
+        """
+        items = data.get("items", []) if data else []
+
+        # 第一遍：统计读数上限，预分配数组
+        capacity = 0
+        for item in items:
+            readings = item.get("readings")
+            if isinstance(readings, list):
+                capacity += len(readings)
+            elif isinstance(readings, dict):
+                if station_region_map is not None:
+                    capacity += len(station_region_map)
+                else:
+                    capacity += len(readings.get("pm25_one_hourly") or {})
+        if capacity == 0:
+            return 0
+
+        ts = np.empty(capacity, dtype=np.int64)
+        sid = np.empty(capacity, dtype=np.int64)
+        val = np.empty(capacity, dtype=np.float64)
+        n = 0
+
+        # 第二遍：直接写入数组
+        for item in items:
+            timestamp = item.get("timestamp")
+            readings = item.get("readings")
+            if timestamp is None or not readings:
+                continue
+            t = _code(self._ts_codes, timestamp)
+
+            if isinstance(readings, list):
+                # 标准格式：rainfall, temperature, humidity
+                for reading in readings:
+                    if not isinstance(reading, dict) or reading.get("station_id") is None:
+                        continue
+                    value = reading.get("value")
+                    # None -> NaN：缺失读数，见 to_frame 的缺失值说明
+                    ts[n] = t
+                    sid[n] = _code(self._sid_codes, reading["station_id"])
+                    val[n] = np.nan if value is None else value
+                    n += 1
+            elif isinstance(readings, dict):
+                # PM25 格式：readings 是 {pm25_one_hourly: {region: value}}
+                regional = readings.get("pm25_one_hourly") or {}
+                if station_region_map is not None:
+                    pairs = ((s, regional[r]) for s, r in station_region_map.items() if r in regional)
+                else:
+                    pairs = ((f"PM25_{r}", v) for r, v in regional.items())
+                for station_id, value in pairs:
+                    ts[n] = t
+                    sid[n] = _code(self._sid_codes, station_id)
+                    val[n] = np.nan if value is None else value
+                    n += 1
+
+        if n:
+            type_code = np.full(n, SENSOR_TYPES.index(dtype), dtype=np.int64)
+            self._chunks.append((ts[:n], sid[:n], type_code, val[:n]))
+            self.types_seen.add(dtype)
+        return n
+
+    def to_frame(self, duplicates="first"):
+        """
+        生成宽表: timestamp, sensor_id, <已出现的类型列>
+        行按 (timestamp, sensor_id) 排序
+
+        缺失值: 读数 value 为 None 时记为 NaN，不参与重复合并；单元格没有任何有效读数时为 NaN。
+        调用方负责最终填充（convert_govdata_to_csv: fillna(0)；
+        fetch_and_process_gov_data: 按站点 ffill().fillna(0)），因此 None 最终仍落为 0 或前值。
+
+        Args:
+            duplicates: 同一 (timestamp, sensor_id, type) 有多条有效读数时的取值
+                        "first" 取第一条（与 pivot_table(aggfunc="first") 一致）
+                        "mean"  取平均（与 pivot_table 默认 aggfunc 一致）
+        """
+        if duplicates not in ("first", "mean"):
+            raise ValueError(f"duplicates must be 'first' or 'mean', got {duplicates!r}")
+        columns = [t for t in SENSOR_TYPES if t in self.types_seen]
+        if not self._chunks:
+            return pd.DataFrame(columns=["timestamp", "sensor_id"] + columns)
+
+        ts = np.concatenate([c[0] for c in self._chunks])
+        sid = np.concatenate([c[1] for c in self._chunks])
+        type_code = np.concatenate([c[2] for c in self._chunks])
+        val = np.concatenate([c[3] for c in self._chunks])
+
+        # 编码 -> 排序名次（时间戳按解析后的时间排序，站点按 ID 排序）
+        timestamps = pd.to_datetime(pd.Index(list(self._ts_codes)))
+        ts_order = np.argsort(np.asarray(timestamps), kind="stable")
+        ts_rank = np.empty(len(ts_order), dtype=np.int64)
+        ts_rank[ts_order] = np.arange(len(ts_order))
+
+        sensor_ids = np.array(list(self._sid_codes), dtype=object)
+        sid_order = np.argsort(sensor_ids.astype(str), kind="stable")
+        sid_rank = np.empty(len(sid_order), dtype=np.int64)
+        sid_rank[sid_order] = np.arange(len(sid_order))
+
+        # 一次排序得到所有 (timestamp, sensor_id) 行
+        n_sid = len(sid_order)
+        row_key = ts_rank[ts] * n_sid + sid_rank[sid]
+        row_keys, row_idx = np.unique(row_key, return_inverse=True)
+
+        # 每个 (行, 类型) 单元只合并有效读数
+        n_types = len(SENSOR_TYPES)
+        n_cells = len(row_keys) * n_types
+        cell_key = row_idx * n_types + type_code
+        valid = ~np.isnan(val)
+        cell_key, val = cell_key[valid], val[valid]
+        wide = np.full(n_cells, np.nan)
+        if duplicates == "first":
+            cells, first = np.unique(cell_key, return_index=True)
+            wide[cells] = val[first]
+        else:
+            counts = np.bincount(cell_key, minlength=n_cells)
+            sums = np.bincount(cell_key, weights=val, minlength=n_cells)
+            has = counts > 0
+            wide[has] = sums[has] / counts[has]
+        wide = wide.reshape(len(row_keys), n_types)
+
+        out = pd.DataFrame({
+            "timestamp": timestamps[ts_order][row_keys // n_sid],
+            "sensor_id": sensor_ids[sid_order][row_keys % n_sid],
+        })
+        for col in columns:
+            out[col] = wide[:, SENSOR_TYPES.index(col)]
+        return out
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+inference_backend.py
+可插拔的推理后端（eager / TorchScript / ONNX Runtime）
+
+API 每个请求都在 CPU 上运行 eager PyTorch 模块。这里把训练好的权重导出为
+带动态 batch 维度的 TorchScript / ONNX 文件，API 启动时按配置加载:
+
+    eager        直接使用 load_system() 返回的 nn.Module
+    torchscript  weather_fusion_model.ts（torch.jit.trace + freeze）
+    onnx         weather_fusion_model.onnx（需要 onnxruntime；导出需要 onnx）
+    quantized    weather_fusion_model.int8.ts（int8：LSTM / Linear 动态量化，卫星卷积块静态量化）
+    auto         onnx -> torchscript -> eager，使用第一个可用的（不会自动选择 quantized）
+
+导出文件比 .pth 旧（模型已更新但未重新导出）或加载失败时，自动回退到 eager。
+热更新（model_watcher）时 refresh_exports() 先为所选后端重新导出过期的文件，多个 worker 通过
+文件锁只导出一次。量化模型只有在验证集精度检查通过后才会写出（quantize 命令 / 热更新相同），
+因此 quantized 不会绕过检查。
+所有后端都是可调用对象 backend(sat, sensor) -> torch.Tensor，与 nn.Module 用法相同。
+
+环境变量:
+    INFERENCE_BACKEND        auto | eager | torchscript | onnx | quantized (默认 auto)
+    INFERENCE_THREADS        intra-op 线程数 (默认 CPU 核数 / WEB_CONCURRENCY)
+    QUANT_MAX_MAE_INCREASE   量化模型验证集 MAE 相对浮点模型的最大增幅 (默认 0.05)
+
+用法:
+    python3 inference_backend.py export                      # 导出 TorchScript (+ ONNX，如已安装)
+    python3 inference_backend.py export --format torchscript
+    python3 inference_backend.py quantize                    # 量化 + 精度检查，通过后导出 int8 模型
+    python3 inference_backend.py quantize --no-static        # 只做动态量化（不需要校准帧）
+    python3 inference_backend.py info                        # 显示将被选用的后端
+"""
+
+import os
+import copy
+import fcntl
+import glob
+import json
+import time
+import logging
+from datetime import datetime
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = "weather_fusion_model.pth"
+TORCHSCRIPT_PATH = "weather_fusion_model.ts"
+ONNX_PATH = "weather_fusion_model.onnx"
+QUANTIZED_PATH = "weather_fusion_model.int8.ts"
+QUANT_REPORT_PATH = "quantization_report.json"
+CSV_PATH = "real_sensor_data.csv"
+SAT_DIR = "satellite_data"
+PROCESSED_DIR = "processed_data"
+
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "auto").lower()
+# 多个 uvicorn worker 时平分 CPU，避免线程过度订阅
+INFERENCE_THREADS = int(os.environ.get(
+    "INFERENCE_THREADS",
+    max(1, (os.cpu_count() or 1) // max(1, int(os.environ.get("WEB_CONCURRENCY", "1"))))))
+
+# 导出时的示例输入形状（与 predict.get_input_data 一致）
+SAT_SHAPE = (1, 64, 64)
+SEQ_LEN, SENSOR_FEATURES = 6, 4
+
+QUANT_MAX_MAE_INCREASE = float(os.environ.get("QUANT_MAX_MAE_INCREASE", "0.05"))
+RAIN_THRESHOLD = 0.1  # 与 evaluate.py 一致
+
+
+def configure_threads(threads=INFERENCE_THREADS):
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # 只能在首次并行计算前设置一次
+
+
+def example_inputs(batch=1):
+    return torch.zeros(batch, *SAT_SHAPE), torch.zeros(batch, SEQ_LEN, SENSOR_FEATURES)
+
+
+def _is_fresh(artifact_path, model_path=MODEL_PATH, warn=True):
+    """导出文件存在且不比权重文件旧"""
+    if not os.path.exists(artifact_path):
+        return False
+    if os.path.exists(model_path) and os.path.getmtime(artifact_path) < os.path.getmtime(model_path):
+        if warn:
+            logger.warning(f"{artifact_path} is older than {model_path}; re-run 'python3 inference_backend.py export'")
+        return False
+    return True
+
+
+class EagerBackend:
+    name = "eager"
+
+    def __init__(self, model):
+        self.model = model.eval()
+
+    def __call__(self, sat, sensor):
+        with torch.inference_mode():
+            return self.model(sat, sensor)
+
+
+class TorchScriptBackend:
+    name = "torchscript"
+
+    def __init__(self, path=TORCHSCRIPT_PATH, name=None):
+        self.name = name or self.name
+        self.path = path
+        self.module = torch.jit.load(path, map_location="cpu").eval()
+
+    def __call__(self, sat, sensor):
+        with torch.inference_mode():
+            return self.module(sat, sensor)
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, path=ONNX_PATH, threads=INFERENCE_THREADS):
+        import onnxruntime as ort  # 可选依赖
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, sat, sensor):
+        out = self.session.run(None, {
+            "sat": sat.detach().cpu().numpy(),
+            "sensor": sensor.detach().cpu().numpy(),
+        })[0]
+        return torch.from_numpy(out)
+
+
+def load_backend(model, backend=INFERENCE_BACKEND, model_path=MODEL_PATH,
+                 torchscript_path=TORCHSCRIPT_PATH, onnx_path=ONNX_PATH, quantized_path=QUANTIZED_PATH):
+    """
+    按配置返回推理后端；导出文件缺失/过期/加载失败时回退到 eager。
+    model: load_system() 返回的 nn.Module（回退用）
+    """
+    configure_threads()
+    candidates = {
+        "auto": ["onnx", "torchscript"],
+        "onnx": ["onnx"],
+        "torchscript": ["torchscript"],
+        "quantized": ["quantized"],
+    }.get(backend, [])
+    if backend not in ("auto", "eager", "onnx", "torchscript", "quantized"):
+        logger.warning(f"Unknown INFERENCE_BACKEND '{backend}', using eager")
+
+    paths = {"onnx": onnx_path, "torchscript": torchscript_path, "quantized": quantized_path}
+    for kind in candidates:
+        path = paths[kind]
+        if not _is_fresh(path, model_path):
+            if kind == "quantized":
+                logger.warning(f"No up-to-date {path}; run 'python3 inference_backend.py quantize'")
+            continue
+        try:
+            loaded = OnnxBackend(path) if kind == "onnx" else TorchScriptBackend(path, name=kind)
+            logger.info(f"Inference backend: {kind} ({path}, {INFERENCE_THREADS} threads)")
+            return loaded
+        except ImportError:
+            logger.info("onnxruntime not installed, skipping ONNX backend")
+        except Exception as e:
+            logger.warning(f"Failed to load {kind} backend from {path}: {e}")
+
+    logger.info(f"Inference backend: eager ({INFERENCE_THREADS} threads)")
+    return EagerBackend(model)
+
+
+def export_torchscript(model, path=TORCHSCRIPT_PATH):
+    """trace + freeze；batch 维度在 trace 后仍然是动态的"""
+    model = model.eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_inputs())
+        # freeze 折叠参数/常量；optimize_for_inference 生成的图无法 save/load，不使用
+        frozen = torch.jit.freeze(traced)
+    tmp_path = f"{path}.tmp"
+    frozen.save(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def export_onnx(model, path=ONNX_PATH):
+    """需要 onnx 包；sat / sensor / rain 的第 0 维为动态 batch"""
+    model = model.eval()
+    tmp_path = f"{path}.tmp"
+    torch.onnx.export(
+        model, example_inputs(), tmp_path,
+        input_names=["sat", "sensor"], output_names=["rain"],
+        dynamic_axes={"sat": {0: "batch"}, "sensor": {0: "batch"}, "rain": {0: "batch"}},
+    )
+    os.replace(tmp_path, path)
+    return path
+
+
+def verify_export(model, backend, batch=8, atol=1e-4):
+    """导出结果与 eager 输出一致（含 batch > 1）"""
+    sat, sensor = torch.randn(batch, *SAT_SHAPE), torch.randn(batch, SEQ_LEN, SENSOR_FEATURES)
+    with torch.no_grad():
+        expected = model.eval()(sat, sensor)
+    actual = backend(sat, sensor)
+    diff = (expected - actual).abs().max().item()
+    if diff > atol:
+        raise RuntimeError(f"{backend.name} export differs from eager model (max abs diff {diff:.2e})")
+    return diff
+
+
+def export_all(model, formats=("torchscript", "onnx"), torchscript_path=TORCHSCRIPT_PATH, onnx_path=ONNX_PATH):
+    """导出并校验；返回 {format: path}，失败的格式记录日志后跳过"""
+    exported = {}
+    for fmt in formats:
+        t0 = time.perf_counter()
+        try:
+            if fmt == "torchscript":
+                path = export_torchscript(model, torchscript_path)
+                diff = verify_export(model, TorchScriptBackend(path))
+            else:
+                path = export_onnx(model, onnx_path)
+                diff = verify_export(model, OnnxBackend(path))
+        except ImportError as e:
+            logger.warning(f"Skipping {fmt} export: {e}")
+            continue
+        except Exception as e:
+            logger.warning(f"{fmt} export failed: {e}")
+            continue
+        exported[fmt] = path
+        logger.info(f"Exported {fmt} -> {path} ({time.perf_counter() - t0:.1f}s, max diff {diff:.1e})")
+    return exported
+
+
+def calibration_frames(processed_dir=PROCESSED_DIR, limit=64):
+    """最近的缓存卫星帧 (.npy) -> 与推理相同归一化的 (N, 1, 64, 64) 张量；没有时返回 None"""
+    frames = []
+    for path in sorted(glob.glob(os.path.join(processed_dir, "*.npy")))[-limit:]:
+        try:
+            frame = torch.tensor(np.load(path), dtype=torch.float32)
+        except (OSError, ValueError):
+            continue
+        if frame.ndim == 2:
+            frame = frame.unsqueeze(0)
+        if tuple(frame.shape) == SAT_SHAPE:
+            frames.append((frame - 200) / 100.0)
+    return torch.stack(frames) if frames else None
+
+
+def quantize_model(model, frames=None):
+    """
+    int8 服务模型（不修改传入的浮点模型）
+    - SensorEncoder.lstm、各 fc、fusion_head: 动态量化（权重 int8，激活运行时量化）
+    - SatelliteEncoder 卷积块: 提供校准帧时静态量化（conv+bn+relu 融合，按帧校准激活范围）
+    """
+    from torch.ao.quantization import (quantize_dynamic, fuse_modules, QuantStub, DeQuantStub,
+                                       get_default_qconfig, prepare, convert)
+
+    quantized = copy.deepcopy(model).eval()
+    if frames is not None and len(frames):
+        conv = fuse_modules(quantized.sat_encoder.conv, [["0", "1", "2"], ["4", "5", "6"], ["8", "9", "10"]])
+        block = nn.Sequential(QuantStub(), conv, DeQuantStub())
+        block.qconfig = get_default_qconfig(torch.backends.quantized.engine)
+        prepare(block, inplace=True)
+        with torch.no_grad():
+            for batch in frames.split(16):
+                block(batch)
+        convert(block, inplace=True)
+        quantized.sat_encoder.conv = block
+    return quantize_dynamic(quantized, {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+
+
+def accuracy_check(model, quantized, loader, max_increase=QUANT_MAX_MAE_INCREASE):
+    """验证集上对比浮点 / 量化模型（所有 horizon）；MAE 增幅不超过 max_increase 视为通过"""
+    count = flips = 0
+    abs_float = abs_quant = max_diff = 0.0
+    with torch.inference_mode():
+        for sat, sensor, target in loader:
+            pred_float = model(sat, sensor).clamp_min(0.0)
+            pred_quant = quantized(sat, sensor).clamp_min(0.0)
+            target = target.view_as(pred_float)
+            abs_float += (pred_float - target).abs().sum().item()
+            abs_quant += (pred_quant - target).abs().sum().item()
+            max_diff = max(max_diff, (pred_float - pred_quant).abs().max().item())
+            flips += ((pred_float > RAIN_THRESHOLD) != (pred_quant > RAIN_THRESHOLD)).sum().item()
+            count += pred_float.numel()
+    if count == 0:
+        raise RuntimeError("Validation split is empty")
+
+    mae_float, mae_quant = abs_float / count, abs_quant / count
+    increase = (mae_quant - mae_float) / mae_float if mae_float > 0 else 0.0
+    return {
+        "num_predictions": count,
+        "mae_float": mae_float,
+        "mae_quantized": mae_quant,
+        "mae_increase": increase,
+        "max_abs_diff": max_diff,
+        "rain_flip_rate": flips / count,
+        "max_mae_increase": max_increase,
+        "passed": increase <= max_increase,
+    }
+
+
+def validation_loader(model, csv_path=CSV_PATH, sat_dir=SAT_DIR):
+    """精度检查用的验证集（train.py 持久化的时间切分），horizon 数跟随模型"""
+    from weather_dataset import get_validation_loader
+
+    return get_validation_loader(csv_path, sat_dir, num_horizons=model.fusion_head[-1].out_features)
+
+
+def quantize_and_gate(model, loader, frames=None, max_increase=QUANT_MAX_MAE_INCREASE, force=False,
+                      path=QUANTIZED_PATH, report_path=QUANT_REPORT_PATH, model_path=MODEL_PATH):
+    """量化 + 验证集精度检查（报告写入 report_path）；通过（或 force）时导出到 path。返回报告"""
+    quantized = quantize_model(model, frames)
+    report = accuracy_check(model, quantized, loader, max_increase)
+    report.update({
+        "created_at": datetime.now().isoformat(),
+        "model": model_path,
+        "static_conv": frames is not None,
+        "calibration_frames": len(frames) if frames is not None else 0,
+        "engine": torch.backends.quantized.engine,
+    })
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    if report["passed"] or force:
+        export_torchscript(quantized, path)
+    return report
+
+
+def refresh_exports(model, backend=INFERENCE_BACKEND, model_path=MODEL_PATH, torchscript_path=TORCHSCRIPT_PATH,
+                    onnx_path=ONNX_PATH, quantized_path=QUANTIZED_PATH, loader=None):
+    """
+    为所选后端重新导出比权重文件旧的导出文件（热更新时 .pth 由 S3 / 复制替换，导出文件不会跟着更新）。
+    quantized 走与 quantize 命令相同的精度检查，未通过时不写出（load_backend 回退到 eager）。
+    多个 worker 同时热更新时用 <model_path>.export.lock 串行化：第一个进程导出，其余进程拿到锁后
+    发现文件已是最新，直接返回。返回本次导出的 {format: path}
+    """
+    formats = {
+        "auto": ["torchscript", "onnx"],
+        "torchscript": ["torchscript"],
+        "onnx": ["onnx"],
+        "quantized": ["quantized"],
+    }.get(backend, [])
+    paths = {"torchscript": torchscript_path, "onnx": onnx_path, "quantized": quantized_path}
+    if all(_is_fresh(paths[fmt], model_path, warn=False) for fmt in formats):
+        return {}
+
+    with open(f"{model_path}.export.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # 随文件关闭释放
+        stale = [fmt for fmt in formats if not _is_fresh(paths[fmt], model_path, warn=False)]
+        exported = export_all(model, [fmt for fmt in stale if fmt != "quantized"], torchscript_path, onnx_path)
+        if "quantized" in stale:
+            try:
+                if loader is None:
+                    loader = validation_loader(model)
+                report = quantize_and_gate(model, loader, calibration_frames(), path=quantized_path,
+                                           model_path=model_path)
+            except Exception as e:
+                logger.warning(f"Quantization failed, serving the float model: {e}")
+            else:
+                if report["passed"]:
+                    exported["quantized"] = quantized_path
+                else:
+                    logger.warning(f"Quantized model failed the accuracy check "
+                                   f"(MAE {report['mae_increase']:+.1%}), serving the float model")
+    return exported
+
+
+def load_model(model_path=MODEL_PATH):
+    """只加载权重（不读传感器数据）"""
+    from weather_fusion_model import WeatherFusionNet, prediction_dim_from_state_dict
+
+    state_dict = torch.load(model_path, map_location="cpu", weights_only=True)
+    model = WeatherFusionNet(sat_channels=1, sensor_features=SENSOR_FEATURES,
+                             prediction_dim=prediction_dim_from_state_dict(state_dict))
+    model.load_state_dict(state_dict)
+    return model.eval()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="WeatherFusionNet 推理后端导出")
+    parser.add_argument("action", choices=["export", "quantize", "info"])
+    parser.add_argument("--format", action="append", choices=["torchscript", "onnx"],
+                        help="导出格式（可重复，默认全部）")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--no-static", action="store_true", help="quantize: 不做卫星卷积静态量化")
+    parser.add_argument("--calibration-frames", type=int, default=64, help="quantize: 校准帧数量")
+    parser.add_argument("--max-mae-increase", type=float, default=QUANT_MAX_MAE_INCREASE)
+    parser.add_argument("--force", action="store_true", help="quantize: 精度检查失败也导出")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        parser.error(f"{args.model} not found")
+    model = load_model(args.model)
+
+    if args.action == "export":
+        exported = export_all(model, args.format or ("torchscript", "onnx"))
+        print(f"📦 已导出: {', '.join(exported) or '无'}")
+    elif args.action == "quantize":
+        frames = None if args.no_static else calibration_frames(limit=args.calibration_frames)
+        if frames is None and not args.no_static:
+            logger.warning(f"No cached frames in {PROCESSED_DIR}/, dynamic quantization only")
+
+        loader = validation_loader(model)
+        report = quantize_and_gate(model, loader, frames, args.max_mae_increase, args.force, model_path=args.model)
+
+        print(f"📊 MAE float {report['mae_float']:.4f} -> int8 {report['mae_quantized']:.4f} "
+              f"({report['mae_increase']:+.1%}), max diff {report['max_abs_diff']:.4f}, "
+              f"rain flips {report['rain_flip_rate']:.2%}")
+        if report["passed"] or args.force:
+            print(f"📦 已导出量化模型: {QUANTIZED_PATH}")
+        else:
+            print(f"❌ MAE 增幅超过 {args.max_mae_increase:.0%}，未导出（报告: {QUANT_REPORT_PATH}）")
+            raise SystemExit(1)
+    else:
+        backend = load_backend(model, model_path=args.model)
+        print(f"🔧 INFERENCE_BACKEND={INFERENCE_BACKEND} -> {backend.name}, {INFERENCE_THREADS} threads")
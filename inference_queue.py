@@ -0,0 +1,164 @@
+"""
+inference_queue.py
+跨请求的微批处理推理队列
+
+并发的 /predict 请求各自运行一次很小的前向计算，高负载时 CPU 主要消耗在每次调用的 PyTorch 开销上。
+MicroBatcher 放在推理后端前面:
+- 调用方提交 (sat, sensor)（可以是多行），阻塞等待自己的结果
+- 后台线程从第一个输入到达起最多等待 window_ms，或凑满 max_batch 行后立即执行
+- 相同形状的输入拼成一个 batch 前向一次，再按行切分结果交还给各调用方（异常同样传递）
+
+MicroBatcher 与推理后端一样是可调用对象 batcher(sat, sensor) -> torch.Tensor，调用方无需修改。
+每次提交最多等待一个窗口，因此一个请求应把它的所有站点输入堆叠后只提交一次
+（/predict、/predict/path、/predict/batch 都通过 predict.batch_inference 一次提交）。
+close() 之后的提交直接在调用线程中执行（模型热更新后仍持有旧引用的请求不会卡住）。
+
+环境变量:
+    INFERENCE_BATCH_WINDOW_MS   收集窗口毫秒数 (默认 0 = 关闭微批处理)
+    INFERENCE_MAX_BATCH         单次前向最大行数 (默认 32)
+
+指标:
+    weather_api_inference_batch_size        每次前向的行数分布
+    weather_api_inference_queue_seconds     输入从提交到开始前向的等待时间
+    weather_api_inference_queue_depth       等待中的提交数
+"""
+
+import os
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+from metrics import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BATCH_WINDOW_MS = float(os.environ.get("INFERENCE_BATCH_WINDOW_MS", "0"))
+INFERENCE_MAX_BATCH = int(os.environ.get("INFERENCE_MAX_BATCH", "32"))
+
+BATCH_SIZE = Histogram(
+    "weather_api_inference_batch_size", "Rows per micro-batched forward pass.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+QUEUE_SECONDS = Histogram(
+    "weather_api_inference_queue_seconds", "Time from submission to the start of its forward pass.",
+    buckets=(0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+QUEUE_DEPTH = Gauge(
+    "weather_api_inference_queue_depth", "Submissions waiting for a forward pass.")
+
+
+class _Request:
+    __slots__ = ("sat", "sensor", "rows", "enqueued", "future")
+
+    def __init__(self, sat, sensor):
+        self.sat = sat
+        self.sensor = sensor
+        self.rows = sat.shape[0]
+        self.enqueued = time.perf_counter()
+        self.future = Future()
+
+
+class MicroBatcher:
+    """把并发提交的输入合并为一次前向"""
+
+    _STOP = object()
+
+    def __init__(self, backend, window_ms=INFERENCE_BATCH_WINDOW_MS, max_batch=INFERENCE_MAX_BATCH):
+        self.backend = backend
+        self.name = getattr(backend, "name", type(backend).__name__)
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="inference-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, sat, sensor):
+        """提交输入，返回 Future（结果为该输入对应的输出行）"""
+        request = _Request(sat, sensor)
+        with self._lock:
+            if not self._closed:
+                QUEUE_DEPTH.inc()
+                self._queue.put(request)
+                return request.future
+        self._run([request])
+        return request.future
+
+    def __call__(self, sat, sensor):
+        return self.submit(sat, sensor).result()
+
+    def close(self):
+        """停止后台线程；已排队的提交仍会执行"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(self._STOP)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch, rows = [first], first.rows
+        deadline = first.enqueued + self.window
+        while rows < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                self._queue.put(item)  # 先处理完当前 batch
+                break
+            batch.append(item)
+            rows += item.rows
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is self._STOP:
+                return
+            batch = self._collect(first)
+            QUEUE_DEPTH.dec(len(batch))
+
+            # 输入形状不同（例如历史长度不同）时分组执行
+            groups = {}
+            for request in batch:
+                key = (tuple(request.sat.shape[1:]), tuple(request.sensor.shape[1:]))
+                groups.setdefault(key, []).append(request)
+            for requests in groups.values():
+                self._run(requests)
+
+    def _run(self, requests):
+        start = time.perf_counter()
+        for request in requests:
+            QUEUE_SECONDS.observe(start - request.enqueued)
+        try:
+            if len(requests) == 1:
+                output = self.backend(requests[0].sat, requests[0].sensor)
+            else:
+                output = self.backend(torch.cat([r.sat for r in requests]),
+                                      torch.cat([r.sensor for r in requests]))
+            BATCH_SIZE.observe(sum(r.rows for r in requests))
+        except Exception as e:
+            logger.warning(f"Micro-batched forward failed ({len(requests)} requests): {e}")
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        offset = 0
+        for request in requests:
+            request.future.set_result(output[offset:offset + request.rows])
+            offset += request.rows
+
+
+def maybe_batched(backend, window_ms=INFERENCE_BATCH_WINDOW_MS, max_batch=INFERENCE_MAX_BATCH):
+    """window_ms > 0 时用 MicroBatcher 包装推理后端"""
+    if window_ms <= 0:
+        return backend
+    logger.info(f"Micro-batching enabled: window {window_ms}ms, max batch {max_batch}")
+    return MicroBatcher(backend, window_ms, max_batch)
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+live_ingest.py
+NEA 实时数据接入：每分钟轮询 data.gov.sg，写入预分配的逐站环形缓冲区
+
+API 原本不使用实时数据，而是把「现在」映射到静态 CSV 中前一天的同一时刻。开启 LIVE_INGEST 后:
+
+- LiveIngestor 在后台线程中每 LIVE_POLL_SECONDS 秒拉取一次各实时端点（解析复用
+  fetch_and_process_gov_data / govdata_parser），启动时（以及中断超过 BACKFILL_GAP_MINUTES 后）
+  按日期补齐窗口内的历史
+- LiveSensorBuffer 是固定大小的数组 (站点数上限, 窗口分钟数, 类型数)，每个槽位对应一分钟，
+  按 epoch 分钟取模循环覆盖。内存在启动时分配，之后不随运行时间增长
+- 「现在」的模型输入只需一次切片：取最近 70 分钟 → 前向填充（与 fetch_and_process_gov_data 的
+  ffill().fillna(0) 一致）→ 10 分钟分箱（与 predict.get_input_data 的 resample 一致）→ 归一化
+- 多 worker（SHARED_STATE=1）时缓冲区放在 SHARED_STATE_DIR/live 下的 .npy 内存映射文件中，
+  所有 worker 共用一份；只有持有 live/.ingest.lock 的 worker 轮询 data.gov.sg 并写入（退出后由
+  其他 worker 接手），其余 worker 只读。写入时递增序号（seqlock），读取方遇到写入中途会重读
+
+实时数据过期（最新读数早于 LIVE_MAX_AGE_MINUTES）时，API 回退到 CSV 参考日。
+
+环境变量:
+    LIVE_INGEST             1 = API 启动实时接入 (默认 0)
+    LIVE_POLL_SECONDS       轮询间隔秒数 (默认 60)
+    LIVE_WINDOW_MINUTES     环形缓冲区覆盖的分钟数 (默认 180)
+    LIVE_MAX_SENSORS        站点数上限 (默认 128)
+    LIVE_MAX_AGE_MINUTES    最新读数早于该分钟数时视为过期 (默认 15)
+
+指标:
+    weather_api_live_polls_total{result}            轮询次数 (success / empty / error)
+    weather_api_live_newest_reading_timestamp       缓冲区中最新读数的时间 (unix 秒)
+    weather_api_live_sensors                        缓冲区中的站点数
+
+用法:
+    python3 live_ingest.py              # 前台运行一次补齐 + 一次轮询，打印每个站点的最新读数
+"""
+
+import os
+import time
+import fcntl
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import torch
+
+from govdata_parser import SENSOR_TYPES
+from metrics import Counter, Gauge
+from predict import load_satellite_tensor, normalize_sensor_features
+
+logger = logging.getLogger(__name__)
+
+LIVE_INGEST = os.environ.get("LIVE_INGEST", "0") == "1"
+LIVE_POLL_SECONDS = float(os.environ.get("LIVE_POLL_SECONDS", "60"))
+LIVE_WINDOW_MINUTES = int(os.environ.get("LIVE_WINDOW_MINUTES", "180"))
+LIVE_MAX_SENSORS = int(os.environ.get("LIVE_MAX_SENSORS", "128"))
+LIVE_MAX_AGE_MINUTES = float(os.environ.get("LIVE_MAX_AGE_MINUTES", "15"))
+BACKFILL_GAP_MINUTES = 10
+SG_TZ = "Asia/Singapore"
+
+# 模型输入的特征顺序（与 predict.get_input_data 一致）
+FEATURES = ["temperature", "rainfall", "humidity", "pm25"]
+FEATURE_INDEX = [SENSOR_TYPES.index(f) for f in FEATURES]
+RAIN = FEATURES.index("rainfall")
+# get_input_data 取 [t - 70min, t] 重采样为 10 分钟
+HISTORY_MINUTES = 70
+BIN_MINUTES = 10
+
+LIVE_POLLS = Counter(
+    "weather_api_live_polls_total", "Live NEA polls by result.", labelnames=("result",))
+LIVE_NEWEST = Gauge(
+    "weather_api_live_newest_reading_timestamp", "Unix time of the newest live reading.")
+LIVE_SENSORS = Gauge(
+    "weather_api_live_sensors", "Sensors held in the live ring buffers.")
+
+
+def epoch_minute(t):
+    """时间 -> epoch 分钟；不带时区的时间按本机时区解释"""
+    t = pd.Timestamp(t)
+    if t.tz is None:
+        t = pd.Timestamp(t.to_pydatetime().astimezone())
+    return t.value // 60_000_000_000
+
+
+def _open_shared(path, arrays):
+    """
+    path 下的 {name: (shape, dtype, fill)} 内存映射数组；不存在或形状 / 类型不一致（配置变化）时
+    全部重建。返回 {name: np.memmap}
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".create.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # 同时启动的 worker 不会各自初始化
+        opened = {}
+        for name, (shape, dtype, _) in arrays.items():
+            try:
+                arr = np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="r+")
+            except (OSError, ValueError):
+                break
+            if arr.shape != shape or arr.dtype != np.dtype(dtype):
+                break
+            opened[name] = arr
+        else:
+            return opened
+        for name, (shape, dtype, fill) in arrays.items():
+            arr = np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+            arr[...] = fill
+            opened[name] = arr
+        return opened
+
+
+def local_time(minute):
+    """epoch 分钟 -> 新加坡本地时间（不带时区，与卫星文件名换算一致）"""
+    return pd.Timestamp(minute * 60_000_000_000, tz="UTC").tz_convert(SG_TZ).tz_localize(None).to_pydatetime()
+
+
+class LiveSensorBuffer:
+    """
+    逐站环形缓冲区：values[站点, 分钟槽位, 类型]，槽位 = epoch 分钟 % 窗口
+    path: 共享目录（多 worker），为 None 时数组在本进程内存中
+    """
+
+    # header: 写入序号（奇数 = 写入中）、最新分钟、站点数
+    SEQ, NEWEST, COUNT = range(3)
+
+    def __init__(self, window_minutes=LIVE_WINDOW_MINUTES, max_sensors=LIVE_MAX_SENSORS, path=None):
+        if window_minutes <= HISTORY_MINUTES:
+            raise ValueError(f"window_minutes must exceed {HISTORY_MINUTES}")
+        self.slots = int(window_minutes)
+        self.max_sensors = max_sensors
+        self.path = path
+        arrays = {
+            "values": ((max_sensors, self.slots, len(SENSOR_TYPES)), np.float64, np.nan),
+            "slot_minute": ((self.slots,), np.int64, -1),  # 每个槽位当前保存的分钟
+            "sensor_ids": ((max_sensors,), "<U64", ""),     # 行号 -> sensor_id
+            "header": ((3,), np.int64, [0, -1, 0]),
+        }
+        if path is None:
+            arrays = {name: np.full(shape, fill, dtype=dtype) for name, (shape, dtype, fill) in arrays.items()}
+        else:
+            arrays = _open_shared(path, arrays)
+        self.values, self.slot_minute = arrays["values"], arrays["slot_minute"]
+        self.sensor_ids, self.header = arrays["sensor_ids"], arrays["header"]
+        self._sensors = {}  # sensor_id -> 行号（sensor_ids 的本地索引）
+        self._lock = threading.Lock()
+        self._full_warned = False
+
+    @property
+    def newest(self):
+        return int(self.header[self.NEWEST])
+
+    @property
+    def sensors(self):
+        """sensor_id -> 行号；共享模式下其他进程新增的站点在这里同步"""
+        count = int(self.header[self.COUNT])
+        if count != len(self._sensors):
+            self._sensors = {str(sid): row for row, sid in enumerate(self.sensor_ids[:count])}
+        return self._sensors
+
+    def __len__(self):
+        return len(self.sensors)
+
+    def _row(self, sensor_id):
+        row = self.sensors.get(sensor_id)
+        if row is None:
+            if len(self._sensors) >= self.max_sensors:
+                if not self._full_warned:
+                    logger.warning(f"Live buffer full ({self.max_sensors} sensors); dropping new sensors")
+                    self._full_warned = True
+                return -1
+            row = len(self._sensors)
+            self.sensor_ids[row] = sensor_id
+            self.header[self.COUNT] = row + 1
+            self._sensors[sensor_id] = row
+        return row
+
+    def _read(self, fn, attempts=100):
+        """
+        在两次写入之间执行 fn()（seqlock：序号为奇数或读取期间变化时重读）。
+        写入进程在写入中途退出时序号一直是奇数，重试 attempts 次后直接读取
+        """
+        for _ in range(attempts):
+            seq = int(self.header[self.SEQ])
+            if seq % 2 == 0:
+                result = fn()
+                if int(self.header[self.SEQ]) == seq:
+                    return result
+            time.sleep(0.0005)
+        return fn()
+
+    def push(self, frame):
+        """写入宽表 (timestamp, sensor_id, <类型列>)；窗口之外的旧读数丢弃。返回写入的行数"""
+        if frame is None or frame.empty:
+            return 0
+        times = pd.DatetimeIndex(frame["timestamp"])
+        if times.tz is None:
+            times = times.tz_localize(datetime.now().astimezone().tzinfo)
+        row_minutes = times.as_unit("ns").asi8 // 60_000_000_000
+        sensor_ids, inverse = np.unique(frame["sensor_id"].astype(str).to_numpy(), return_inverse=True)
+
+        with self._lock:
+            self.header[self.SEQ] |= 1  # 奇数：写入中（上一个写入进程中途退出时已经是奇数）
+            try:
+                return self._push(frame, row_minutes, sensor_ids, inverse)
+            finally:
+                self.header[self.SEQ] += 1
+
+    def _push(self, frame, row_minutes, sensor_ids, inverse):
+        newest = max(self.newest, int(row_minutes.max()))
+        rows = np.array([self._row(sid) for sid in sensor_ids], dtype=np.int64)[inverse]
+        keep = (row_minutes > newest - self.slots) & (rows >= 0)
+        if not keep.any():
+            return 0
+        row_minutes, rows = row_minutes[keep], rows[keep]
+        positions = row_minutes % self.slots
+
+        # 槽位换到新的一分钟时清空（同一槽位的另一分钟必然已在窗口之外）
+        for minute in np.unique(row_minutes):
+            pos = minute % self.slots
+            if self.slot_minute[pos] != minute:
+                self.values[:, pos, :] = np.nan
+                self.slot_minute[pos] = minute
+
+        for k, dtype in enumerate(SENSOR_TYPES):
+            if dtype not in frame:
+                continue
+            vals = frame[dtype].to_numpy(dtype=np.float64)[keep]
+            ok = ~np.isnan(vals)
+            self.values[rows[ok], positions[ok], k] = vals[ok]
+
+        self.header[self.NEWEST] = newest
+        LIVE_NEWEST.set(newest * 60)
+        LIVE_SENSORS.set(len(self.sensors))
+        return int(keep.sum())
+
+    def is_fresh(self, now, max_age_minutes=LIVE_MAX_AGE_MINUTES):
+        return self.newest >= 0 and epoch_minute(now) - self.newest <= max_age_minutes
+
+    def _history(self, sensor_ids, end_minute):
+        """
+        整个窗口截至 end_minute 的读数 (S, 窗口, 类型)，前向填充后缺失补 0；
+        present (S, 窗口) 标记该分钟是否有任何读数（对应 CSV 中存在的行）
+        """
+        rows = np.array([self.sensors[sid] for sid in sensor_ids], dtype=np.int64)
+        wanted = np.arange(end_minute - self.slots + 1, end_minute + 1)
+        positions = wanted % self.slots
+        def snapshot():
+            return self.slot_minute[positions] == wanted, self.values[rows][:, positions, :]
+
+        with self._lock:
+            valid, hist = self._read(snapshot)
+        hist[:, ~valid, :] = np.nan
+        present = ~np.isnan(hist).all(axis=2)
+
+        # 沿时间前向填充（每个站点、每种类型独立）
+        steps = np.arange(self.slots)[None, :, None]
+        last_seen = np.where(np.isnan(hist), 0, steps)
+        np.maximum.accumulate(last_seen, axis=1, out=last_seen)
+        hist = np.take_along_axis(hist, last_seen, axis=1)
+        return np.nan_to_num(hist, nan=0.0), present
+
+    def station_inputs(self, sensor_ids, target_time, seq_len=6):
+        """
+        {sensor_id: (sat_tensor, sensor_tensor)}，与 predict.get_station_inputs 相同的返回形式；
+        历史不足 seq_len 个 10 分钟的站点不返回
+        """
+        sensor_ids = [sid for sid in dict.fromkeys(sensor_ids) if sid in self.sensors]
+        if not sensor_ids:
+            return {}
+        end = epoch_minute(target_time)
+        hist, present = self._history(sensor_ids, end)
+        hist = hist[:, -(HISTORY_MINUTES + 1):, FEATURE_INDEX]
+        present = present[:, -(HISTORY_MINUTES + 1):]
+
+        # 10 分钟分箱（与 resample('10min') 的 mean / sum 一致；窗口终点对齐到 10 分钟）
+        offset = (end - HISTORY_MINUTES) % BIN_MINUTES
+        bins = (np.arange(HISTORY_MINUTES + 1) + offset) // BIN_MINUTES
+        n_bins = bins[-1] + 1
+        counts = np.zeros((len(sensor_ids), n_bins))
+        sums = np.zeros((len(sensor_ids), n_bins, len(FEATURES)))
+        np.add.at(counts, (slice(None), bins), present)
+        np.add.at(sums, (slice(None), bins), hist * present[:, :, None])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            binned = sums / counts[:, :, None]
+        binned[:, :, RAIN] = sums[:, :, RAIN]
+
+        sat_tensor = None
+        inputs = {}
+        for i, sid in enumerate(sensor_ids):
+            steps = binned[i, counts[i] > 0][-seq_len:]
+            if len(steps) < seq_len:
+                continue
+            features = normalize_sensor_features(steps.astype(np.float32))
+            if sat_tensor is None:
+                # 当前槽位尚未发布时使用 SAT_MAX_FRAME_AGE_MINUTES 内最新的实时帧（predict.latest_recent_frame）
+                sat_tensor = load_satellite_tensor(local_time(end))
+            inputs[sid] = (sat_tensor, torch.tensor(features).unsqueeze(0))
+        return inputs
+
+    def latest_readings(self, sensor_ids, target_time):
+        """截至 target_time 的最新读数 {sensor_id: (temperature, humidity, pm25)}"""
+        sensor_ids = [sid for sid in dict.fromkeys(sensor_ids) if sid in self.sensors]
+        if not sensor_ids:
+            return {}
+        hist, present = self._history(sensor_ids, epoch_minute(target_time))
+        readings = {}
+        t, h, p = (SENSOR_TYPES.index(c) for c in ("temperature", "humidity", "pm25"))
+        for i, sid in enumerate(sensor_ids):
+            seen = np.flatnonzero(present[i])
+            if len(seen):
+                last = hist[i, seen[-1]]
+                readings[sid] = (float(last[t]), float(last[h]), float(last[p]))
+        return readings
+
+
+class LiveIngestor:
+    """
+    后台轮询线程：补齐窗口 + 每分钟拉取最新读数写入 LiveSensorBuffer
+    共享缓冲区（buffer.path）时只有持有 <path>/.ingest.lock 的进程轮询，其余进程每个间隔重试一次
+    """
+
+    def __init__(self, buffer, interval=LIVE_POLL_SECONDS, fetch_latest=None, fetch_day=None):
+        if fetch_latest is None or fetch_day is None:
+            import fetch_and_process_gov_data as gov
+            fetch_latest = fetch_latest or gov.fetch_latest
+            fetch_day = fetch_day or gov.process_day
+        self.buffer = buffer
+        self.interval = interval
+        self.fetch_latest = fetch_latest
+        self.fetch_day = fetch_day
+        self.last_success = None
+        self._ingest_lock = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="live-ingest", daemon=True)
+        self._thread.start()
+        logger.info(f"Live NEA ingestion every {self.interval:g}s "
+                    f"({self.buffer.slots} min x {self.buffer.max_sensors} sensors buffer)")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def backfill(self, now=None):
+        """按日期拉取覆盖整个窗口的历史（窗口跨午夜时包含前一天）"""
+        end = pd.Timestamp(now or datetime.now(timezone.utc)).tz_convert(SG_TZ)
+        start = end - timedelta(minutes=self.buffer.slots)
+        written = 0
+        for day in sorted({start.date(), end.date()}):
+            written += self.buffer.push(self.fetch_day(day))
+        logger.info(f"Live backfill: {written} rows")
+        return written
+
+    def poll(self):
+        """拉取一次最新读数；返回写入的行数"""
+        try:
+            gap = (self.last_success is None
+                   or time.time() - self.last_success > BACKFILL_GAP_MINUTES * 60)
+            written = self.backfill() if gap else 0
+            written += self.buffer.push(self.fetch_latest())
+        except Exception as e:
+            LIVE_POLLS.inc(result="error")
+            logger.warning(f"Live poll failed: {e}")
+            return 0
+        LIVE_POLLS.inc(result="success" if written else "empty")
+        if written:
+            self.last_success = time.time()
+        return written
+
+    def is_ingester(self):
+        """本进程是否负责轮询（非共享缓冲区时总是）；非阻塞地抢锁，抢到后一直持有到进程退出"""
+        if self.buffer.path is None or self._ingest_lock is not None:
+            return True
+        lock = open(os.path.join(self.buffer.path, ".ingest.lock"), "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._ingest_lock = lock
+        logger.info(f"Live ingestion: this process polls for {self.buffer.path}")
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if self.is_ingester():
+                self.poll()
+            self._stop.wait(self.interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    buffer = LiveSensorBuffer()
+    ingestor = LiveIngestor(buffer)
+    written = ingestor.poll()
+    now = datetime.now(timezone.utc)
+    print(f"✅ 写入 {written} 行，{len(buffer)} 个站点，缓冲区 {buffer.values.nbytes / 1e6:.2f} MB")
+    readings = buffer.latest_readings(list(buffer.sensors), now)
+    inputs = buffer.station_inputs(list(buffer.sensors), now.replace(minute=now.minute // 10 * 10, second=0, microsecond=0))
+    for sid, (t, h, p) in sorted(readings.items()):
+        print(f"   {sid}: 温度 {t:.1f} 湿度 {h:.1f} PM2.5 {p:.0f} {'(可预测)' if sid in inputs else ''}")
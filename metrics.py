@@ -0,0 +1,235 @@
+"""
+metrics.py
+轻量级进程内指标（Prometheus 文本格式导出）
+
+不依赖 prometheus_client，只实现 API 需要的三种类型:
+- Counter:   单调递增计数（请求数、缓存命中/未命中）
+- Gauge:     当前值（进行中的请求数）
+- Histogram: 延迟分布（各阶段耗时）
+
+用法:
+    from metrics import STAGE_SECONDS, stage_timer, record_cache, render
+
+    with stage_timer("geocode"):
+        geocode_location(...)
+
+    record_cache("delaunay", hit=True)
+
+    render()  # -> Prometheus 文本，供 /metrics 返回
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒；覆盖亚毫秒（IDW / 缓存命中）到 Overpass 超时（50s）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels):
+        """{'count', 'sum'}，未观测过时为 0"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return {"count": 0, "sum": 0.0}
+            return {"count": state["count"], "sum": state["sum"]}
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted((k, {"counts": list(v["counts"]), "sum": v["sum"], "count": v["count"]})
+                           for k, v in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, state["counts"]):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {state['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state['count']}")
+        return lines
+
+
+# --- API 指标 ---
+REQUESTS_TOTAL = Counter(
+    "weather_api_requests_total", "HTTP requests by route, method and status.",
+    ("route", "method", "status"))
+REQUEST_SECONDS = Histogram(
+    "weather_api_request_seconds", "HTTP request latency by route.", ("route", "method"))
+IN_FLIGHT = Gauge(
+    "weather_api_requests_in_flight", "Requests currently being handled.")
+STAGE_SECONDS = Histogram(
+    "weather_api_stage_seconds",
+    "Latency of individual hot-path stages (geocode, sensor_selection, input_prep, inference, idw, s3_read, sqlite_write, ...).",
+    ("stage",))
+CACHE_REQUESTS = Counter(
+    "weather_api_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ("cache", "result"))
+SATELLITE_FRAME_SLOT = Gauge(
+    "weather_api_satellite_newest_slot_timestamp", "Observation time (unix) of the newest live-ingested satellite frame.")
+SATELLITE_FRAME_AGE = Histogram(
+    "weather_api_satellite_frame_age_seconds", "Time from observation slot to the frame being servable.",
+    buckets=(60, 300, 600, 900, 1200, 1800, 2700, 3600))
+
+
+def stage_timer(stage):
+    """记录一个热路径阶段的耗时"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _cache_ratio_lines():
+    """由命中/未命中计数派生的命中率 gauge"""
+    totals = {}
+    with CACHE_REQUESTS._lock:
+        for (cache, result), value in CACHE_REQUESTS._values.items():
+            totals.setdefault(cache, {"hit": 0.0, "miss": 0.0})[result] = value
+    lines = ["# HELP weather_api_cache_hit_ratio Cache hit ratio since process start.",
+             "# TYPE weather_api_cache_hit_ratio gauge"]
+    for cache, t in sorted(totals.items()):
+        total = t["hit"] + t["miss"]
+        ratio = t["hit"] / total if total else 0.0
+        lines.append(f'weather_api_cache_hit_ratio{{cache="{_escape(cache)}"}} {_format_value(ratio)}')
+    return lines
+
+
+def render():
+    """所有已注册指标的 Prometheus 文本"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    lines.extend(_cache_ratio_lines())
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """清空所有指标（测试使用）"""
+    with _registry_lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        metric.reset()
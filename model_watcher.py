@@ -0,0 +1,207 @@
+"""
+model_watcher.py
+模型热更新（不重启 API）
+
+新模型由 fetch_latest_model.sh / sync_model_to_s3.sh 送到 API 主机，但 api.py 只在启动时加载一次
+weather_fusion_model.pth，更新模型需要重启服务并承担完整的冷启动。ModelWatcher 在后台线程中:
+
+1. 检测新模型
+   - 本地: 权重文件及导出文件（TorchScript / ONNX / int8）的 mtime + size 指纹
+   - S3（可选，MODEL_S3_KEY）: head_object 的 ETag 变化时下载到临时文件，原子替换本地权重文件
+     多 worker 时只有持有 <权重文件>.s3.lock 的一个进程拉取（进程退出后由其他 worker 接手），
+     其余 worker 通过本地指纹看到新文件；已下载的 ETag 记在 <权重文件>.etag，接手的进程不会重复下载
+2. 在后台加载并预热新模型（几次前向，首个真实请求不承担初始化开销）
+   - load 回调负责重新导出过期的 TorchScript / ONNX / int8 文件（inference_backend.refresh_exports），
+     加载后重新记录导出文件的指纹，自己写出的导出文件不会再触发一次热更新
+3. 原子替换服务引用（on_swap 回调），旧模型在进行中的请求结束后由 GC 回收
+   - 请求处理函数在开始时取一次模型引用，进行中的请求始终使用旧模型完成
+   - 切换只是一次引用赋值，不会给请求增加延迟
+
+文件刚写入（mtime 在 MODEL_SETTLE_SECONDS 内）时等待下一轮，避免读到写了一半的文件；
+加载或预热失败时保留当前模型，下一次指纹变化时再试。
+
+环境变量:
+    MODEL_WATCH_INTERVAL    检查间隔秒数 (默认 60，0 = 关闭)
+    MODEL_SETTLE_SECONDS    文件最后修改后至少等待的秒数 (默认 2)
+    MODEL_S3_KEY            S3 上的模型对象 (例如 models/latest.pth；为空则只监视本地文件)
+
+指标:
+    weather_api_model_reloads_total{result}     热更新次数 (success / error)
+    weather_api_model_loaded_timestamp          当前模型的加载时间 (unix 秒)
+"""
+
+import os
+import time
+import fcntl
+import logging
+import tempfile
+import threading
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", "60"))
+MODEL_SETTLE_SECONDS = float(os.environ.get("MODEL_SETTLE_SECONDS", "2"))
+MODEL_S3_KEY = os.environ.get("MODEL_S3_KEY", "")
+WARMUP_CALLS = 3
+
+MODEL_RELOADS = Counter(
+    "weather_api_model_reloads_total", "Model hot reloads by result.", labelnames=("result",))
+MODEL_LOADED = Gauge(
+    "weather_api_model_loaded_timestamp", "Unix time the serving model was loaded.")
+
+
+def fingerprint(paths):
+    """{path: (mtime, size)}，不存在的文件为 None"""
+    result = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            result[path] = (st.st_mtime, st.st_size)
+        except OSError:
+            result[path] = None
+    return result
+
+
+class ModelWatcher:
+    """
+    paths: 监视的本地文件（第一个是权重文件，S3 下载目标）
+    load: 无参函数，返回新的服务模型（可调用对象）
+    on_swap(new_model, old_model): 原子替换服务引用
+    warmup: 可选，warmup(model) 对新模型做几次前向
+    """
+
+    def __init__(self, paths, load, on_swap, warmup=None, interval=MODEL_WATCH_INTERVAL,
+                 settle_seconds=MODEL_SETTLE_SECONDS, s3_bucket=None, s3_key=MODEL_S3_KEY,
+                 endpoint_url=None):
+        self.paths = list(paths)
+        self.load = load
+        self.on_swap = on_swap
+        self.warmup = warmup
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self.s3_bucket = s3_bucket
+        self.s3_key = s3_key
+        self.endpoint_url = endpoint_url
+        # 启动时已加载的版本
+        self.loaded = fingerprint(self.paths)
+        self.etag = self._read_etag()
+        self._leader_lock = None
+        self.current = None
+        self._stop = threading.Event()
+        self._thread = None
+        MODEL_LOADED.set(time.time())
+
+    def start(self, current):
+        self.current = current
+        if self.interval <= 0:
+            return self
+        self._thread = threading.Thread(target=self._loop, name="model-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.paths[0]} for new models every {self.interval:g}s"
+                    + (f" (s3://{self.s3_bucket}/{self.s3_key})" if self.s3_bucket and self.s3_key else ""))
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning(f"Model watcher error: {e}")
+
+    def _read_etag(self):
+        try:
+            with open(f"{self.paths[0]}.etag") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _is_s3_leader(self):
+        """非阻塞地抢 <权重文件>.s3.lock，抢到后一直持有到进程退出"""
+        if self._leader_lock is not None:
+            return True
+        lock = open(f"{self.paths[0]}.s3.lock", "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._leader_lock = lock
+        self.etag = self._read_etag()  # 上一个拉取进程可能已经下载过
+        return True
+
+    def pull_s3(self):
+        """S3 对象 ETag 变化时下载并原子替换本地权重文件；返回是否下载了新文件"""
+        from storage import get_s3_client, download_file
+
+        if not self._is_s3_leader():
+            return False
+
+        head = get_s3_client(self.endpoint_url).head_object(Bucket=self.s3_bucket, Key=self.s3_key)
+        etag = head["ETag"].strip('"')
+        if etag == self.etag:
+            return False
+
+        target = self.paths[0]
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target)), suffix=".download")
+        os.close(fd)
+        try:
+            download_file(self.s3_bucket, self.s3_key, tmp_path, endpoint_url=self.endpoint_url)
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.etag = etag
+        with open(f"{target}.etag", "w") as f:
+            f.write(etag)
+        logger.info(f"Downloaded s3://{self.s3_bucket}/{self.s3_key} (ETag {etag})")
+        return True
+
+    def check(self):
+        """检查一次；有新模型时加载、预热并切换。返回是否切换"""
+        if self.s3_bucket and self.s3_key:
+            self.pull_s3()
+
+        seen = fingerprint(self.paths)
+        if seen == self.loaded or seen[self.paths[0]] is None:
+            return False
+        newest = max(fp[0] for fp in seen.values() if fp is not None)
+        if time.time() - newest < self.settle_seconds:
+            return False  # 可能还在写入，下一轮再看
+
+        start = time.perf_counter()
+        try:
+            new_model = self.load()
+            if self.warmup is not None:
+                self.warmup(new_model)
+        except Exception as e:
+            MODEL_RELOADS.inc(result="error")
+            logger.error(f"Model reload failed, keeping the current model: {e}")
+            self.loaded = seen  # 同一份文件不再重试，等待下一次变化
+            return False
+
+        old_model, self.current = self.current, new_model
+        self.on_swap(new_model, old_model)
+        # 加载时重新导出的文件取新指纹；权重文件保留加载前的指纹，加载期间又被替换时下一轮重新加载
+        self.loaded = {**fingerprint(self.paths[1:]), self.paths[0]: seen[self.paths[0]]}
+        MODEL_RELOADS.inc(result="success")
+        MODEL_LOADED.set(time.time())
+        logger.info(f"Model hot-reloaded in {time.perf_counter() - start:.2f}s")
+        return True
+
+
+def warmup_model(model, calls=WARMUP_CALLS):
+    """对新模型做几次前向（TorchScript 的首次调用会做图优化）"""
+    import torch
+    from inference_backend import example_inputs
+
+    sat, sensor = example_inputs()
+    with torch.no_grad():
+        for _ in range(calls):
+            model(sat, sensor)
@@ -109,7 +109,7 @@ function DownloadTab({
                 <td>{row.satelliteFiles} / {row.satelliteTotal}</td>
                 <td>{row.neaFiles} / {row.neaTotal}</td>
                 <td>
-                  {row.status === 'completed' && <span className="status-icon success">{Icons.check}</span>}
+                  {(row.status === 'completed' || row.status === 'trained') && <span className="status-icon success">{Icons.check}</span>}
                   {row.status === 'running' && <span className="status-icon running">{Icons.running}</span>}
                   {row.status === 'pending' && <span className="status-icon pending">{Icons.pending}</span>}
                 </td>
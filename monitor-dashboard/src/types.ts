@@ -6,7 +6,7 @@ export interface DateProgress {
     satelliteTotal: number;
     neaFiles: number;
     neaTotal: number;
-    status: 'pending' | 'running' | 'completed';
+    status: 'pending' | 'running' | 'completed' | 'trained';
 }
 
 export interface DownloadStatus {
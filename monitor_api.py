@@ -12,12 +12,19 @@ import os
 import json
 import subprocess
 import logging
+import threading
+import time
 from datetime import datetime
 from typing import Optional, List
 from fastapi import APIRouter
-import boto3
+from botocore.exceptions import ClientError
 from pydantic import BaseModel
 
+import storage
+from metrics import stage_timer, record_cache
+from singleflight import SingleFlight
+from s3_manifest import NEA_APIS, TERMINAL_STATUSES, build_day_manifest, read_manifest_index
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/monitor", tags=["monitor"])
@@ -26,6 +33,13 @@ router = APIRouter(prefix="/monitor", tags=["monitor"])
 S3_BUCKET = os.environ.get("S3_BUCKET", "weather-ai-models-de08370c")
 DOWNLOAD_SERVER = os.environ.get("DOWNLOAD_SERVER", "18.142.90.30")
 TRAINING_SERVER = os.environ.get("TRAINING_SERVER", "46.137.236.8")
+# 监控快照刷新间隔（秒）
+MONITOR_REFRESH_INTERVAL = int(os.environ.get("MONITOR_REFRESH_INTERVAL", "60"))
+# 快照构建失败后的首次重试间隔（秒），之后翻倍，最长 MONITOR_REFRESH_INTERVAL
+MONITOR_RETRY_SECONDS = float(os.environ.get("MONITOR_RETRY_SECONDS", "5"))
+
+TRAINING_STATE_KEY = "state/training_state.json"
+TRAINING_HISTORY_KEY = "history/training_history.json"
 
 # ========================
 # 数据模型
@@ -38,7 +52,7 @@ class DateProgress(BaseModel):
     satelliteTotal: int = 144
     neaFiles: int = 0
     neaTotal: int = 4
-    status: str = "pending"  # pending, running, completed
+    status: str = "pending"  # pending, running, completed, trained
 
 
 class DownloadStatus(BaseModel):
@@ -46,7 +60,7 @@ class DownloadStatus(BaseModel):
     currentDate: Optional[str] = None
     completedDays: int = 0
     totalDays: int = 119
-    filesDownloaded: int = 0
+    filesDownloaded: int = 0  # 各日已下载的卫星 .nc 文件数之和（含已训练/归档的日期）
     parallelProcesses: int = 0
     status: str = "unknown"  # running, idle, error
     lastUpdate: Optional[str] = None
@@ -107,107 +121,267 @@ class OverviewStatus(BaseModel):
 # ========================
 
 def get_s3_client():
-    """获取 S3 客户端"""
-    return boto3.client('s3')
+    """获取 S3 客户端（共享连接池）"""
+    return storage.get_s3_client()
 
 
-def count_s3_files(prefix: str) -> int:
-    """统计 S3 中的文件数"""
-    try:
-        s3 = get_s3_client()
-        paginator = s3.get_paginator('list_objects_v2')
-        count = 0
-        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix):
-            count += page.get('KeyCount', 0)
-        return count
-    except Exception as e:
-        logger.error(f"Failed to count S3 files: {e}")
-        return 0
+def _day_status(satellite_files: int, has_complete: bool) -> str:
+    if has_complete:
+        return "completed"
+    if satellite_files > 0:
+        return "running"
+    return "pending"
 
 
-def count_completed_days() -> int:
-    """统计已完成的天数（通过 .complete 标记）"""
-    try:
-        s3 = get_s3_client()
-        prefix = "satellite/"
-        count = 0
-        paginator = s3.get_paginator('list_objects_v2')
-        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix):
-            for obj in page.get('Contents', []):
-                if obj['Key'].endswith('.complete'):
-                    count += 1
-        return count
-    except Exception as e:
-        logger.error(f"Failed to count completed days: {e}")
-        return 0
+def collect_days_from_listing(s3):
+    """
+    一次遍历 satellite/ 和 govdata/ 列表统计每日数据（无清单索引时使用）
 
+    Returns:
+        {"20251001": {"satellite": .nc 文件数, "nea": n, "status": str}}
+    """
+    paginator = s3.get_paginator('list_objects_v2')
+
+    per_date = {}
+
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix="satellite/"):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+
+            # 提取日期 e.g. satellite/20251001/xxx.nc -> 20251001
+            parts = key.split('/')
+            if len(parts) < 3 or not (parts[1].isdigit() and len(parts[1]) == 8):
+                continue
+            day = per_date.setdefault(parts[1], {"satellite": 0, "complete": False})
+            if key.endswith('.complete'):
+                day["complete"] = True
+            elif key.endswith('.nc'):
+                day["satellite"] += 1
+
+    # NEA 数据: govdata/{api}_{YYYY-MM-DD}.json
+    nea_counts = {}
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix="govdata/"):
+        for obj in page.get('Contents', []):
+            name = obj['Key'].rsplit('/', 1)[-1]
+            if not name.endswith('.json'):
+                continue
+            api, _, formatted_date = name[:-5].rpartition('_')
+            if api in NEA_APIS:
+                date_str = formatted_date.replace('-', '')
+                nea_counts[date_str] = nea_counts.get(date_str, 0) + 1
+
+    days = {
+        date_str: {
+            "satellite": day["satellite"],
+            "nea": nea_counts.get(date_str, 0),
+            "status": _day_status(day["satellite"], day["complete"]),
+        }
+        for date_str, day in per_date.items()
+    }
+    return days
 
-def get_date_progress() -> List[DateProgress]:
-    """获取每日下载进度详情"""
-    try:
-        s3 = get_s3_client()
-        progress_list = []
-        
-        # 列出所有日期目录
-        paginator = s3.get_paginator('list_objects_v2')
-        date_dirs = set()
-        
-        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix="satellite/", Delimiter='/'):
-            for prefix in page.get('CommonPrefixes', []):
-                # 提取日期 e.g. satellite/20251001/ -> 20251001
-                date_str = prefix['Prefix'].split('/')[1]
-                if date_str.isdigit() and len(date_str) == 8:
-                    date_dirs.add(date_str)
-        
-        # 对每个日期目录统计文件数（显示最新20天）
-        sorted_dates = sorted(date_dirs, reverse=True)[:20]  # 取最新20天
-        for date_str in sorted(sorted_dates):  # 按日期顺序显示
-            satellite_count = 0
-            has_complete = False
-            
-            # 统计卫星文件
-            for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=f"satellite/{date_str}/"):
-                for obj in page.get('Contents', []):
-                    if obj['Key'].endswith('.complete'):
-                        has_complete = True
-                    elif obj['Key'].endswith('.nc'):
-                        satellite_count += 1
-            
-            # 统计 NEA 数据
-            formatted_date = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
-            nea_count = 0
-            for api in ['rainfall', 'temperature', 'humidity', 'pm25']:
+
+def collect_days_from_manifests(s3, index: dict):
+    """
+    终态日期（completed / trained）直接读取清单索引，
+    其余仍在 satellite/ 下的日期逐日实时统计（通常只有正在下载的 1-2 天）
+
+    返回格式与 collect_days_from_listing 相同；已训练的日期状态为 "trained"
+    """
+    days = {}
+    for formatted_date, entry in index.get("days", {}).items():
+        if entry.get("status") not in TERMINAL_STATUSES:
+            continue
+        days[formatted_date.replace('-', '')] = {
+            "satellite": entry.get("satellite_files", 0),
+            "nea": entry.get("nea_files", 0),
+            "status": entry["status"],
+        }
+
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix="satellite/", Delimiter='/'):
+        for prefix in page.get('CommonPrefixes', []):
+            date_str = prefix['Prefix'].split('/')[1]
+            if not (date_str.isdigit() and len(date_str) == 8) or date_str in days:
+                continue
+            manifest = build_day_manifest(s3, f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}", bucket=S3_BUCKET)
+            days[date_str] = {
+                "satellite": manifest["satellite"]["files"],
+                "nea": sum(1 for v in manifest["nea"].values() if v["present"]),
+                "status": manifest["status"],
+            }
+    return days
+
+
+def build_download_snapshot(s3) -> DownloadStatus:
+    """
+    生成完整下载状态：优先使用 S3 清单索引，没有索引时一次遍历 bucket 列表
+    （替代每次请求的多次全量分页列表 + 每日 head_object）
+    """
+    index = read_manifest_index(s3, bucket=S3_BUCKET)
+    if index:
+        days = collect_days_from_manifests(s3, index)
+    else:
+        days = collect_days_from_listing(s3)
+
+    # 两种来源使用同一口径：下载已完成（含已训练）的日期数、各日卫星 .nc 文件数之和
+    completed_days = sum(1 for day in days.values() if day["status"] in TERMINAL_STATUSES)
+    total_files = sum(day["satellite"] for day in days.values())
+
+    # 每日进度（显示最新20天，按日期顺序）
+    date_progress = []
+    for date_str in sorted(sorted(days, reverse=True)[:20]):
+        day = days[date_str]
+        # 已完成时，total = 实际下载数；进行中使用估计值 144
+        satellite_total = day["satellite"] if day["status"] in TERMINAL_STATUSES else 144
+        date_progress.append(DateProgress(
+            date=f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}",
+            satelliteFiles=day["satellite"],
+            satelliteTotal=satellite_total,
+            neaFiles=day["nea"],
+            status=day["status"]
+        ))
+
+    # 获取当前日期（第一个 running 状态的日期）
+    current_date = next((dp.date for dp in date_progress if dp.status == "running"), None)
+
+    return DownloadStatus(
+        currentDate=current_date,
+        completedDays=completed_days,
+        totalDays=119,
+        filesDownloaded=total_files,
+        status="running" if completed_days < 119 else "completed",
+        lastUpdate=datetime.now().isoformat(),
+        dateProgress=date_progress
+    )
+
+
+class MonitorSnapshotCache:
+    """
+    监控快照缓存（stale-while-revalidate）
+
+    - 后台线程每 interval 秒重建一次快照（一次遍历 bucket 列表）
+    - JSON 状态对象使用 ETag (If-None-Match) 跳过未变化的下载
+    - 请求始终直接返回内存中的快照；过期时触发后台刷新，不阻塞请求
+    - 只有首次请求（尚无快照）会同步构建；并发的首次请求共享同一次构建（single-flight）
+    - 构建失败后指数退避（MONITOR_RETRY_SECONDS 起，最长 interval），退避期间不访问 S3
+    """
+
+    def __init__(self, interval: int, retry_seconds: float = MONITOR_RETRY_SECONDS):
+        self.interval = interval
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("monitor_snapshot")
+        self._download: Optional[DownloadStatus] = None
+        self._objects = {}  # key -> (etag, parsed json)
+        self._built_at = 0.0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._refreshing = False
+        self._thread = None
+
+    def _fetch_json(self, s3, key):
+        """读取 S3 JSON 对象，ETag 未变化时复用缓存"""
+        with self._lock:
+            etag, _ = self._objects.get(key, (None, None))
+        kwargs = {"IfNoneMatch": etag} if etag else {}
+        try:
+            with stage_timer("s3_read"):
+                obj = s3.get_object(Bucket=S3_BUCKET, Key=key, **kwargs)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in ('304', 'NotModified'):
+                record_cache("monitor_s3_etag", hit=True)
+                return
+            if code in ('NoSuchKey', '404'):
+                with self._lock:
+                    self._objects.pop(key, None)
+                return
+            raise
+        data = json.loads(obj['Body'].read().decode('utf-8'))
+        with self._lock:
+            self._objects[key] = (obj.get('ETag'), data)
+        if etag:
+            record_cache("monitor_s3_etag", hit=False)
+
+    def _backing_off(self):
+        return time.monotonic() < self._retry_at
+
+    def _rebuild(self):
+        if self._backing_off():
+            return
+        try:
+            s3 = get_s3_client()
+            with stage_timer("monitor_snapshot"):
+                download = build_download_snapshot(s3)
+            for key in (TRAINING_STATE_KEY, TRAINING_HISTORY_KEY):
                 try:
-                    s3.head_object(Bucket=S3_BUCKET, Key=f"govdata/{api}_{formatted_date}.json")
-                    nea_count += 1
-                except:
-                    pass
-            
-            # 确定状态和 total
-            if has_complete:
-                status = "completed"
-                # 已完成时，total = 实际下载数
-                satellite_total = satellite_count
-            elif satellite_count > 0:
-                status = "running"
-                # 进行中，使用估计值 144
-                satellite_total = 144
-            else:
-                status = "pending"
-                satellite_total = 144
-            
-            progress_list.append(DateProgress(
-                date=formatted_date,
-                satelliteFiles=satellite_count,
-                satelliteTotal=satellite_total,
-                neaFiles=nea_count,
-                status=status
-            ))
-        
-        return progress_list
-    except Exception as e:
-        logger.error(f"Failed to get date progress: {e}")
-        return []
+                    self._fetch_json(s3, key)
+                except Exception as e:
+                    logger.warning(f"Failed to refresh {key}: {e}")
+            with self._lock:
+                self._download = download
+                self._built_at = time.monotonic()
+                self._failures = 0
+                self._retry_at = 0.0
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+                delay = min(self.interval, self.retry_seconds * 2 ** (self._failures - 1))
+                self._retry_at = time.monotonic() + delay
+            logger.error(f"Failed to refresh monitor snapshot (retry in {delay:.0f}s): {e}")
+
+    def refresh(self):
+        """重建快照；并发调用只执行一次，失败时保留旧快照并退避"""
+        self._flight.do("snapshot", self._rebuild)
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.refresh()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+
+    def _ensure_fresh(self):
+        self._ensure_started()
+        if self._backing_off():
+            return
+        if self._download is None:
+            # 首次请求：同步构建（并发请求等待同一次构建）
+            self.refresh()
+        elif time.monotonic() - self._built_at > self.interval:
+            self._refresh_async()
+
+    def download_status(self) -> Optional[DownloadStatus]:
+        self._ensure_fresh()
+        return self._download
+
+    def get_json(self, key):
+        self._ensure_fresh()
+        with self._lock:
+            return self._objects.get(key, (None, None))[1]
+
+
+snapshot_cache = MonitorSnapshotCache(MONITOR_REFRESH_INTERVAL)
 
 
 def read_log_file(log_path: str, lines: int = 100) -> str:
@@ -224,22 +398,21 @@ def read_log_file(log_path: str, lines: int = 100) -> str:
 
 
 def get_training_state() -> dict:
-    """获取训练状态文件"""
-    try:
-        s3 = get_s3_client()
-        obj = s3.get_object(Bucket=S3_BUCKET, Key="state/training_state.json")
-        return json.loads(obj['Body'].read().decode('utf-8'))
-    except Exception as e:
-        logger.warning(f"Training state not found: {e}")
+    """获取训练状态文件（来自快照缓存）"""
+    state = snapshot_cache.get_json(TRAINING_STATE_KEY)
+    if state is None:
+        logger.debug("Training state not found")
         return {}
+    return state
 
 
 def get_training_history() -> List[TrainingHistoryItem]:
-    """获取训练历史记录"""
+    """获取训练历史记录（来自快照缓存）"""
     try:
-        s3 = get_s3_client()
-        obj = s3.get_object(Bucket=S3_BUCKET, Key="history/training_history.json")
-        data = json.loads(obj['Body'].read().decode('utf-8'))
+        data = snapshot_cache.get_json(TRAINING_HISTORY_KEY)
+        if data is None:
+            logger.debug("Training history not found")
+            return []
         
         history = []
         for item in data[-10:]:  # 只返回最近10条
@@ -304,36 +477,11 @@ def get_overview():
 
 @router.get("/download", response_model=DownloadStatus)
 def get_download_status():
-    """获取下载状态"""
-    try:
-        # 统计已完成天数
-        completed_days = count_completed_days()
-        
-        # 统计总文件数
-        total_files = count_s3_files("satellite/")
-        
-        # 获取每日进度
-        date_progress = get_date_progress()
-        
-        # 获取当前日期（最后一个 running 状态的日期）
-        current_date = None
-        for dp in date_progress:
-            if dp.status == "running":
-                current_date = dp.date
-                break
-        
-        return DownloadStatus(
-            currentDate=current_date,
-            completedDays=completed_days,
-            totalDays=119,
-            filesDownloaded=total_files,
-            status="running" if completed_days < 119 else "completed",
-            lastUpdate=datetime.now().isoformat(),
-            dateProgress=date_progress
-        )
-    except Exception as e:
-        logger.error(f"Failed to get download status: {e}")
+    """获取下载状态（来自快照缓存）"""
+    download = snapshot_cache.download_status()
+    if download is None:
         return DownloadStatus(status="error", lastUpdate=datetime.now().isoformat())
+    return download
 
 
 @router.get("/training", response_model=TrainingStatus)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+path_cache.py
+OSM 路径几何与采样点的磁盘缓存
+
+/predict/path 每次都向公共 Overpass API 查询并重新采样，而 Rail Corridor 这类路径几乎不变。
+这里按查询缓存过滤后的几何（{'elements': [...]}），并按 sample_dist_km 缓存采样点:
+
+    <OSM_PATH_CACHE_DIR>/<sha1(规范化查询)>.json
+    {
+      "query": "rail corridor",
+      "source": "overpass" | "extract",
+      "fetched_at": 1760000000.0,
+      "geometry": {"elements": [...]},
+      "samples": {"v3:2": [[lat, lon], ...]}
+    }
+
+命中时路径请求不做任何网络 I/O；多个 uvicorn worker 共享同一目录（原子写入）。
+OSM_OFFLINE=1 时从不访问 Overpass，只使用缓存（适合预加载离线数据后运行）。
+
+环境变量:
+    OSM_PATH_CACHE_DIR      缓存目录 (默认 cache/osm_paths)
+    OSM_PATH_CACHE_DAYS     Overpass 条目过期天数 (默认 90，0 = 永不过期)；
+                            离线导出预加载的条目 (source=extract) 和 OSM_OFFLINE=1 时的所有条目不过期，
+                            因为没有途径刷新它们
+    OSM_OFFLINE             1 = 不访问 Overpass
+
+用法:
+    # 从离线 Overpass JSON 导出（out geom tags）预加载
+    python3 path_cache.py preload --extract singapore_paths.json --query "Rail Corridor" --query "Park Connector"
+    python3 path_cache.py preload --extract singapore_paths.json --all-names
+    # 通过 Overpass 预热
+    python3 path_cache.py fetch --query "Rail Corridor"
+    python3 path_cache.py list
+    python3 path_cache.py purge [--expired]
+
+离线导出示例（在可联网的机器上执行一次）:
+    [out:json][timeout:300];
+    ( way["name"]["highway"~"cycleway|path|footway|pedestrian|track|steps"](1.15,103.55,1.48,104.1);
+      relation["name"]["route"~"hiking|foot|bicycle"](1.15,103.55,1.48,104.1); );
+    out geom tags;
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+OSM_PATH_CACHE_DIR = os.environ.get("OSM_PATH_CACHE_DIR", os.path.join("cache", "osm_paths"))
+OSM_PATH_CACHE_DAYS = float(os.environ.get("OSM_PATH_CACHE_DAYS", "90"))
+OSM_OFFLINE = os.environ.get("OSM_OFFLINE", "0") == "1"
+
+
+def normalize_query(query):
+    return " ".join(query.strip().lower().split())
+
+
+# 采样算法版本；算法变化后旧的采样点自动失效（几何仍复用）
+SAMPLER_VERSION = 3
+
+
+def _sample_key(sample_dist_km):
+    return f"v{SAMPLER_VERSION}:{float(sample_dist_km):g}"
+
+
+class PathCache:
+    """磁盘路径缓存（带进程内副本）"""
+
+    def __init__(self, cache_dir=OSM_PATH_CACHE_DIR, ttl_days=OSM_PATH_CACHE_DAYS, offline=OSM_OFFLINE):
+        self.cache_dir = cache_dir
+        self.ttl = ttl_days * 86400 if ttl_days > 0 else None
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._memory = {}  # key -> entry
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _expired(self, entry):
+        # 离线预加载的条目只能由 preload 刷新；离线模式下过期条目也无法重新获取
+        if self.ttl is None or self.offline or entry.get("source") == "extract":
+            return False
+        return time.time() - entry.get("fetched_at", 0) > self.ttl
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is None:
+            path = self._path(key)
+            if not os.path.exists(path):
+                return None
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Corrupt path cache file {path}: {e}")
+                return None
+            with self._lock:
+                self._memory[key] = entry
+        if self._expired(entry):
+            return None
+        return entry
+
+    def _save(self, key, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._memory[key] = entry
+
+    def get_geometry(self, query):
+        entry = self._load(normalize_query(query))
+        return entry["geometry"] if entry else None
+
+    def get_samples(self, query, sample_dist_km):
+        entry = self._load(normalize_query(query))
+        if not entry:
+            return None
+        return entry.get("samples", {}).get(_sample_key(sample_dist_km))
+
+    def put_geometry(self, query, geometry, source="overpass"):
+        """写入几何（覆盖旧条目，并丢弃旧的采样点）"""
+        key = normalize_query(query)
+        self._save(key, {
+            "query": key,
+            "source": source,
+            "fetched_at": time.time(),
+            "geometry": geometry,
+            "samples": {},
+        })
+
+    def put_samples(self, query, sample_dist_km, samples):
+        key = normalize_query(query)
+        entry = self._load(key)
+        if entry is None:
+            return
+        entry = dict(entry)
+        entry["samples"] = dict(entry.get("samples", {}))
+        entry["samples"][_sample_key(sample_dist_km)] = [[float(p[0]), float(p[1])] for p in samples]
+        self._save(key, entry)
+
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        out = []
+        for name in sorted(os.listdir(self.cache_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, name)) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            out.append((name, entry))
+        return out
+
+    def purge(self, expired_only=False):
+        removed = 0
+        for name, entry in self.entries():
+            if not expired_only or self._expired(entry):
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+        with self._lock:
+            self._memory.clear()
+        return removed
+
+
+path_cache = PathCache()
+
+
+def load_path_samples(query, sample_dist_km, fetch, sample, cache=None):
+    """
+    路径几何 + 采样点，优先读缓存
+
+    Args:
+        fetch:  query -> geometry 或 None（例如 predict.fetch_osm_path）
+        sample: (geometry, sample_dist_km) -> 采样点列表（例如 predict.process_and_sample_path）
+    Returns:
+        (geometry, samples)；geometry 为 None 表示找不到路径
+    """
+    cache = cache or path_cache
+    samples = cache.get_samples(query, sample_dist_km)
+    geometry = cache.get_geometry(query)
+    if samples is not None and geometry is not None:
+        return geometry, samples
+
+    if geometry is None:
+        if cache.offline:
+            logger.info(f"OSM_OFFLINE: '{query}' not in path cache")
+            return None, []
+        geometry = fetch(query)
+        if not geometry:
+            return None, []
+        cache.put_geometry(query, geometry, source="overpass")
+
+    samples = sample(geometry, sample_dist_km=sample_dist_km)
+    samples = [[float(p[0]), float(p[1])] for p in samples]
+    if samples:
+        cache.put_samples(query, sample_dist_km, samples)
+    return geometry, samples
+
+
+def preload_extract(extract_path, queries=None, all_names=False, sample_dist_km=2.0, cache=None):
+    """从离线 Overpass JSON 导出预加载（几何 + 采样点），返回写入的查询数"""
+    from predict import match_named_elements, filter_path_elements, process_and_sample_path
+
+    cache = cache or path_cache
+    with open(extract_path) as f:
+        elements = json.load(f).get("elements", [])
+
+    if all_names:
+        # 按名称精确分组（名称中可能含正则特殊字符）
+        groups = {}
+        for el in elements:
+            name = el.get("tags", {}).get("name")
+            if name:
+                groups.setdefault(name, []).append(el)
+    else:
+        groups = {query: match_named_elements(elements, query) for query in queries or []}
+
+    written = 0
+    for query, matched in groups.items():
+        geometry = filter_path_elements(matched, query)
+        if geometry:
+            cache.put_geometry(query, geometry, source="extract")
+            load_path_samples(query, sample_dist_km, lambda q: None, process_and_sample_path, cache=cache)
+            written += 1
+        else:
+            logger.warning(f"No path elements for '{query}' in {extract_path}")
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="OSM 路径磁盘缓存")
+    parser.add_argument("action", choices=["preload", "fetch", "list", "purge"])
+    parser.add_argument("--extract", help="离线 Overpass JSON 导出文件")
+    parser.add_argument("--query", action="append", default=[], help="路径名称（可重复）")
+    parser.add_argument("--all-names", action="store_true", help="预加载导出中的所有名称")
+    parser.add_argument("--sample-dist", type=float, default=2.0, help="同时预计算的采样间距 (km)")
+    parser.add_argument("--expired", action="store_true", help="purge 时只删除过期条目")
+    args = parser.parse_args()
+
+    if args.action == "preload":
+        if not args.extract or not (args.query or args.all_names):
+            parser.error("preload requires --extract and --query/--all-names")
+        n = preload_extract(args.extract, args.query, args.all_names, args.sample_dist)
+        print(f"📦 已预加载 {n} 条路径 -> {path_cache.cache_dir}")
+    elif args.action == "fetch":
+        if not args.query:
+            parser.error("fetch requires --query")
+        from predict import fetch_osm_path, process_and_sample_path
+        for q in args.query:
+            geometry, samples = load_path_samples(q, args.sample_dist, fetch_osm_path, process_and_sample_path)
+            print(f"{'✅' if geometry else '❌'} {q}: {len(samples)} 采样点")
+    elif args.action == "list":
+        for name, entry in path_cache.entries():
+            age_days = (time.time() - entry.get("fetched_at", 0)) / 86400
+            print(f"{entry.get('query')!r:40} {entry.get('source'):9} "
+                  f"{len(entry.get('geometry', {}).get('elements', [])):5} 段  "
+                  f"samples={sorted(entry.get('samples', {}))}  {age_days:.1f} 天")
+    else:
+        n = path_cache.purge(expired_only=args.expired)
+        print(f"🗑️  已删除 {n} 条缓存")
@@ -3,11 +3,15 @@ import pandas as pd
 import xarray as xr
 import os
 import glob
+import threading
 import numpy as np
-from scipy.spatial import Delaunay
+from collections import OrderedDict
+from scipy.spatial import Delaunay, cKDTree
 from datetime import datetime, timedelta
-from weather_fusion_model import WeatherFusionNet
+from weather_fusion_model import WeatherFusionNet, FORECAST_HORIZONS, prediction_dim_from_state_dict
 from weather_dataset import latlon2xy # We reuse the projection tool
+from metrics import record_cache
+from singleflight import coalesce
 
 # --- Config ---
 MODEL_PATH = "weather_fusion_model.pth"
@@ -21,14 +25,36 @@ C1, L1 = latlon2xy(SG_LAT_MAX, SG_LON_MIN)
 SG_LAT_MIN, SG_LON_MAX = 1.15, 104.1
 C2, L2 = latlon2xy(SG_LAT_MIN, SG_LON_MAX)
 
+# Upstream (Nominatim / Overpass) result caching, seconds. Concurrent identical calls
+# are always coalesced into one request; 0 disables caching only.
+GEOCODE_CACHE_TTL = int(os.environ.get("GEOCODE_CACHE_TTL", "86400"))
+OSM_PATH_CACHE_TTL = int(os.environ.get("OSM_PATH_CACHE_TTL", "3600"))
+
+# Satellite frames published to shared memory (shared_state.FrameStore), looked up by
+# .npy file name before falling back to disk. None when not attached.
+FRAME_STORE = None
+
+# Newest satellite frames published in-process by the live Himawari ingest
+# (download_jaxa_data.run_daemon): {'YYYYMMDD_HHMM' (UTC slot): (64, 64) array}
+RECENT_FRAMES = OrderedDict()
+RECENT_FRAMES_MAX = int(os.environ.get("RECENT_FRAMES_MAX", "36"))
+_recent_frames_lock = threading.Lock()
+# JAXA publishes a slot several minutes after it starts; until then requests for the
+# current slot use the newest live frame at most this old instead of zeros
+SAT_MAX_FRAME_AGE_MINUTES = int(os.environ.get("SAT_MAX_FRAME_AGE_MINUTES", "30"))
+
 def load_system():
     print("Loading Model...")
-    model = WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=1)
+    # Output size (number of forecast horizons) follows the checkpoint
+    model = WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=FORECAST_HORIZONS)
     if not os.path.exists(MODEL_PATH):
         print(f"Warning: Model file {MODEL_PATH} not found. Starting with initialized model (random weights).")
     else:
         try:
             state_dict = torch.load(MODEL_PATH, map_location=DEVICE, weights_only=True)
+            num_horizons = prediction_dim_from_state_dict(state_dict)
+            if num_horizons != FORECAST_HORIZONS:
+                model = WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=num_horizons)
             model.load_state_dict(state_dict)
             print("Model loaded successfully.")
         except Exception as e:
@@ -43,61 +69,71 @@ def load_system():
     df['timestamp'] = pd.to_datetime(df['timestamp'])
     return model, df
 
-def get_input_data(df, sensor_id, target_time, seq_len=6):
+def publish_frame(utc_slot, frame):
+    """Make a freshly ingested frame servable without touching disk; keeps the newest RECENT_FRAMES_MAX."""
+    with _recent_frames_lock:
+        RECENT_FRAMES[utc_slot] = frame
+        RECENT_FRAMES.move_to_end(utc_slot)
+        while len(RECENT_FRAMES) > RECENT_FRAMES_MAX:
+            RECENT_FRAMES.popitem(last=False)
+
+def _oldest_slot(utc_slot, max_age_minutes=None):
+    if max_age_minutes is None:
+        max_age_minutes = SAT_MAX_FRAME_AGE_MINUTES
+    return (datetime.strptime(utc_slot, '%Y%m%d_%H%M') - timedelta(minutes=max_age_minutes)).strftime('%Y%m%d_%H%M')
+
+def latest_recent_frame(utc_slot, max_age_minutes=None):
+    """Newest live frame at or before `utc_slot` ('YYYYMMDD_HHMM') and at most max_age_minutes older: (slot, frame) or (None, None)."""
+    oldest = _oldest_slot(utc_slot, max_age_minutes)
+    with _recent_frames_lock:
+        # Slot strings sort chronologically
+        slot = max((s for s in RECENT_FRAMES if oldest <= s <= utc_slot), default=None)
+        return (slot, RECENT_FRAMES[slot]) if slot is not None else (None, None)
+
+def latest_processed_frame(utc_slot, processed_dir="processed_data", max_age_minutes=None):
     """
-    Prepare inputs for the model for a specific sensor at a specific time.
-    We need:
-    1. Past sensor sequence (target_time - seq_len*10min to target_time)
-    2. Satellite image at target_time
+    Same bound as latest_recent_frame, but over processed .npy files: (slot, path) or (None, None).
+    Covers frames ingested by another process (the worker running the satellite daemon,
+    or a standalone download_jaxa_data.py), which never reach this process's RECENT_FRAMES.
     """
-    
-    # 1. Fetch Sensor Sequence
-    # Currently dummy data is 10 min interval, real gov data is 1 min.
-    # We should resample if needed, but for prototype let's extract last `seq_len` points.
-    
-    sensor_group = df[df['sensor_id'] == sensor_id].sort_values('timestamp')
-    
-    # --- RESAMPLING LOGIC (Match Training) ---
-    # We need 6 steps of 10-minutes = 60 minutes history
-    required_minutes = seq_len * 10
-    
-    # Extract slightly more to be safe (e.g. 70 mins)
-    window_start = target_time - timedelta(minutes=required_minutes + 10)
-    window_end = target_time
-    
-    mask = (sensor_group['timestamp'] >= window_start) & (sensor_group['timestamp'] <= window_end)
-    recent_raw = sensor_group[mask].copy()
-    
-    if recent_raw.empty:
-         print(f"Warning: No recent data for {sensor_id}")
-         return None, None
-         
-    # Resample to 10min
-    recent_resampled = recent_raw.set_index('timestamp').resample('10min').agg({
-        'temperature': 'mean',
-        'humidity': 'mean',
-        'rainfall': 'sum',
-        'pm25': 'mean'
-    }).dropna()
-    
-    # We need exactly the last `seq_len` steps
-    recent_data = recent_resampled.tail(seq_len)
-    
-    if len(recent_data) < seq_len:
-        print(f"Warning: Not enough history (after resampling) for {sensor_id}. Found {len(recent_data)} steps (Need {seq_len}).")
-        return None, None
+    oldest = _oldest_slot(utc_slot, max_age_minutes)
+    best = (None, None)
+    try:
+        entries = os.scandir(processed_dir)
+    except FileNotFoundError:
+        return best
+    with entries:
+        for entry in entries:
+            name = entry.name
+            if not (name.startswith("NC_H09_") and name.endswith(".npy")):
+                continue
+            slot = name[7:20]
+            if oldest <= slot <= utc_slot and (best[0] is None or slot > best[0]):
+                best = (slot, entry.path)
+    return best
 
-    features = recent_data[['temperature', 'rainfall', 'humidity', 'pm25']].values.astype(np.float32)
-    
-    # NORMALIZATION (Must match weather_dataset.py)
+def load_frame(path):
+    """Processed satellite frame (.npy), from the shared frame store if attached."""
+    if FRAME_STORE is not None:
+        data = FRAME_STORE.get(os.path.basename(path))
+        if data is not None:
+            return data
+    return np.load(path)
+
+def normalize_sensor_features(features):
+    """In-place normalization of [temperature, rainfall, humidity, pm25] rows (must match weather_dataset.py)."""
     features[:, 0] = (features[:, 0] - 28.0) / 5.0  
     features[:, 1] = features[:, 1] / 10.0          
     features[:, 2] = (features[:, 2] - 80.0) / 20.0 
     features[:, 3] = (features[:, 3] - 20.0) / 20.0 
-    
-    sensor_tensor = torch.tensor(features, dtype=torch.float32).unsqueeze(0) # Batch dim
-    
-    # 2. Fetch Satellite Image
+    return features
+
+def load_satellite_tensor(target_time):
+    """
+    Satellite input (1, 1, 64, 64) for the 10-minute slot of `target_time` (local time):
+    processed .npy if available, else the newest live or processed frame within
+    SAT_MAX_FRAME_AGE_MINUTES (the slot isn't published yet), else the raw .nc, else zeros.
+    """
     # Match minute to nearest 10
     minute = (target_time.minute // 10) * 10
     sat_ts = target_time.replace(minute=minute, second=0)
@@ -115,8 +151,19 @@ def get_input_data(df, sensor_id, target_time, seq_len=6):
     # (Assuming sat_ts is Local Time from CSV, which is usually UTC+8)
     utc_str = (sat_ts - timedelta(hours=8)).strftime('%Y%m%d_%H%M')
     
+    # 0. Frame published in-process by the live ingest (no directory scan)
+    recent = RECENT_FRAMES.get(utc_str)
+    
     npy_pattern = f"NC_H09_{utc_str}_*.npy"
-    npy_files = glob.glob(os.path.join(processed_dir, npy_pattern))
+    npy_files = [f"memory:{utc_str}"] if recent is not None else glob.glob(os.path.join(processed_dir, npy_pattern))
+    if not npy_files:
+        # Slot not published yet: newest frame within SAT_MAX_FRAME_AGE_MINUTES, in memory or on disk
+        recent_slot, recent = latest_recent_frame(utc_str)
+        disk_slot, disk_path = latest_processed_frame(utc_str, processed_dir)
+        if disk_slot is not None and (recent_slot is None or disk_slot > recent_slot):
+            recent, npy_files = None, [disk_path]
+        elif recent is not None:
+            npy_files = [f"memory:{recent_slot}"]
     
     files = []
     use_npy = False
@@ -144,7 +191,7 @@ def get_input_data(df, sensor_id, target_time, seq_len=6):
         try:
             if use_npy:
                 # FAST PATH
-                data = np.load(files[0])
+                data = recent if recent is not None else load_frame(files[0])
                 sat_tensor = torch.tensor(data, dtype=torch.float32)
                 if sat_tensor.ndim == 2:
                     sat_tensor = sat_tensor.unsqueeze(0).unsqueeze(0)
@@ -183,6 +230,61 @@ def get_input_data(df, sensor_id, target_time, seq_len=6):
     else:
         print(f"Satellite image missing for {sat_ts}")
 
+    return sat_tensor
+
+def get_input_data(df, sensor_id, target_time, seq_len=6):
+    """
+    Prepare inputs for the model for a specific sensor at a specific time.
+    We need:
+    1. Past sensor sequence (target_time - seq_len*10min to target_time)
+    2. Satellite image at target_time
+    """
+    
+    # 1. Fetch Sensor Sequence
+    # Currently dummy data is 10 min interval, real gov data is 1 min.
+    # We should resample if needed, but for prototype let's extract last `seq_len` points.
+    
+    sensor_group = df[df['sensor_id'] == sensor_id].sort_values('timestamp')
+    
+    # --- RESAMPLING LOGIC (Match Training) ---
+    # We need 6 steps of 10-minutes = 60 minutes history
+    required_minutes = seq_len * 10
+    
+    # Extract slightly more to be safe (e.g. 70 mins)
+    window_start = target_time - timedelta(minutes=required_minutes + 10)
+    window_end = target_time
+    
+    mask = (sensor_group['timestamp'] >= window_start) & (sensor_group['timestamp'] <= window_end)
+    recent_raw = sensor_group[mask].copy()
+    
+    if recent_raw.empty:
+         print(f"Warning: No recent data for {sensor_id}")
+         return None, None
+         
+    # Resample to 10min
+    recent_resampled = recent_raw.set_index('timestamp').resample('10min').agg({
+        'temperature': 'mean',
+        'humidity': 'mean',
+        'rainfall': 'sum',
+        'pm25': 'mean'
+    }).dropna()
+    
+    # We need exactly the last `seq_len` steps
+    recent_data = recent_resampled.tail(seq_len)
+    
+    if len(recent_data) < seq_len:
+        print(f"Warning: Not enough history (after resampling) for {sensor_id}. Found {len(recent_data)} steps (Need {seq_len}).")
+        return None, None
+
+    features = recent_data[['temperature', 'rainfall', 'humidity', 'pm25']].values.astype(np.float32)
+    
+    normalize_sensor_features(features)
+    
+    sensor_tensor = torch.tensor(features, dtype=torch.float32).unsqueeze(0) # Batch dim
+    
+    # 2. Fetch Satellite Image
+    sat_tensor = load_satellite_tensor(target_time)
+
     return sat_tensor, sensor_tensor
 
 def predict(sensor_id=None, time_str=None):
@@ -210,7 +312,7 @@ def predict(sensor_id=None, time_str=None):
 
     with torch.no_grad():
         prediction = model(sat_in.to(DEVICE), sensor_in.to(DEVICE))
-        pred_val = prediction.item()
+        pred_val = prediction[0, 0].item()  # first (10-minute) horizon
         
     print(f"\n>>> PREDICTED RAINFALL (Next 10 mins): {pred_val:.4f} mm")
     
@@ -223,12 +325,15 @@ def predict(sensor_id=None, time_str=None):
         print("Weather Outlook: Heavy Rain / Storm")
 
 import argparse
+import re
 import requests
 import difflib
 import numpy as np
 import pandas as pd
 
 # --- Helper: Geocoding ---
+@coalesce("geocode", key=lambda address: address.strip().lower(), ttl=GEOCODE_CACHE_TTL,
+          cache_if=lambda result: result[0] is not None)
 def geocode_location(address):
     """
     Convert address string to (lat, lon) using OpenStreetMap Nominatim API.
@@ -264,6 +369,8 @@ def geocode_location(address):
         print(f"Geocoding error: {e}")
         return None, None
 
+@coalesce("reverse_geocode", key=lambda lat, lon: (round(lat, 4), round(lon, 4)), ttl=GEOCODE_CACHE_TTL,
+          cache_if=lambda result: result is not None)
 def reverse_geocode(lat, lon):
     """
     Convert (lat, lon) to address string using OpenStreetMap Nominatim API.
@@ -325,6 +432,8 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
     return R * c
 
+@coalesce("osm_path", key=lambda query: query.strip().lower(), ttl=OSM_PATH_CACHE_TTL,
+          cache_if=lambda result: result is not None)
 def fetch_osm_path(query):
     print(f"Querying Overpass API for: {query}")
     overpass_url = "http://overpass-api.de/api/interpreter"
@@ -348,98 +457,202 @@ def fetch_osm_path(query):
         
         if not data or 'elements' not in data:
             return None
-
-        # --- INTELLIGENT FILTERING ---
-        # Only accept if it looks like a hiking/cycling path
-        valid_path_elements = []
         
-        # Keywords that FORCE path mode (override tag checks)
-        path_keywords = ["corridor", "trail", "connector", "pcn", "track", "walk", "greenway"]
-        force_path = any(k in query.lower() for k in path_keywords)
-        
-        print(f"Path Logic: Force={force_path}")
-
-        for el in data['elements']:
-            tags = el.get('tags', {})
-            highway = tags.get('highway', '')
-            leisure = tags.get('leisure', '')
-            route = tags.get('route', '')
-            
-            # Acceptance Criteria
-            is_cycleway = highway in ['cycleway', 'path', 'footway', 'pedestrian', 'track', 'steps']
-            is_route = route in ['hiking', 'foot', 'bicycle']
-            is_leisure_track = leisure == 'track'
-            
-            # Rejection Criteria (Vehicle Roads)
-            # e.g. Commonwealth Ave is primary/residential
-            is_vehicle = highway in ['motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'residential', 'service', 'unclassified']
-            
-            if force_path:
-                # If user typed "Rail Corridor", accept it even if some segments are weird, 
-                # but assume Overpass returned mostly correct things.
-                # Just avoid obvious huge roads if possible, or accept if it's the only match.
-                 valid_path_elements.append(el)
-            else:
-                # Strict Mode for generic queries like "Sentosa"
-                if (is_cycleway or is_route or is_leisure_track) and not is_vehicle:
-                    valid_path_elements.append(el)
-                    
-        if not valid_path_elements:
-            print("Path Filtering: No elements matched 'Recreational Path' criteria.")
-            return None
-            
-        print(f"Path Filtering: Found {len(valid_path_elements)} valid path segments.")
-        # Return filtered data structure
-        return {'elements': valid_path_elements}
+        return filter_path_elements(data['elements'], query)
         
     except Exception as e:
         print(f"Overpass Error: {e}")
         return None
 
-def process_and_sample_path(data, sample_dist_km=2.0):
-    if not data or 'elements' not in data:
-        return []
-        
-    all_points = []
+def match_named_elements(elements, query):
+    """Offline equivalent of the Overpass `name~query,i` filter (ways and relations)."""
+    try:
+        pattern = re.compile(query, re.IGNORECASE)
+    except re.error:
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
+    return [el for el in elements
+            if el.get('type', 'way') in ('way', 'relation')
+            and pattern.search(el.get('tags', {}).get('name', ''))]
+
+def filter_path_elements(elements, query):
+    """Keep only elements that look like hiking/cycling paths. Returns {'elements': [...]} or None."""
+    # --- INTELLIGENT FILTERING ---
+    # Only accept if it looks like a hiking/cycling path
+    valid_path_elements = []
+    
+    # Keywords that FORCE path mode (override tag checks)
+    path_keywords = ["corridor", "trail", "connector", "pcn", "track", "walk", "greenway"]
+    force_path = any(k in query.lower() for k in path_keywords)
     
-    for el in data['elements']:
+    print(f"Path Logic: Force={force_path}")
+
+    for el in elements:
+        tags = el.get('tags', {})
+        highway = tags.get('highway', '')
+        leisure = tags.get('leisure', '')
+        route = tags.get('route', '')
+        
+        # Acceptance Criteria
+        is_cycleway = highway in ['cycleway', 'path', 'footway', 'pedestrian', 'track', 'steps']
+        is_route = route in ['hiking', 'foot', 'bicycle']
+        is_leisure_track = leisure == 'track'
+        
+        # Rejection Criteria (Vehicle Roads)
+        # e.g. Commonwealth Ave is primary/residential
+        is_vehicle = highway in ['motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'residential', 'service', 'unclassified']
+        
+        if force_path:
+            # If user typed "Rail Corridor", accept it even if some segments are weird, 
+            # but assume Overpass returned mostly correct things.
+            # Just avoid obvious huge roads if possible, or accept if it's the only match.
+             valid_path_elements.append(el)
+        else:
+            # Strict Mode for generic queries like "Sentosa"
+            if (is_cycleway or is_route or is_leisure_track) and not is_vehicle:
+                valid_path_elements.append(el)
+                
+    if not valid_path_elements:
+        print("Path Filtering: No elements matched 'Recreational Path' criteria.")
+        return None
+        
+    print(f"Path Filtering: Found {len(valid_path_elements)} valid path segments.")
+    # Return filtered data structure
+    return {'elements': valid_path_elements}
+
+# Segment endpoints closer than this are treated as connected when chaining polylines
+PATH_JOIN_TOLERANCE_KM = 0.05
+
+def extract_path_segments(data):
+    """
+    Overpass elements -> list of (N, 2) [lat, lon] arrays, one per way / relation member.
+    Overpass returns both the ways and the relations containing them, so relation members
+    whose way is already present are skipped, and any remaining segment whose geometry
+    (rounded to ~10 m, either direction) was already seen is dropped.
+    """
+    elements = data.get('elements', [])
+    way_ids = {el['id'] for el in elements if el.get('type') == 'way' and 'id' in el}
+    segments = []
+    seen = set()
+    for el in elements:
         if 'geometry' in el:
-            for pt in el['geometry']:
-                all_points.append([pt['lat'], pt['lon']])
-        elif 'members' in el:
-            for member in el['members']:
-                if 'geometry' in member:
-                    for pt in member['geometry']:
-                        all_points.append([pt['lat'], pt['lon']])
-
-    if not all_points:
+            geometries = [el['geometry']]
+        else:
+            geometries = [m['geometry'] for m in el.get('members', [])
+                          if 'geometry' in m and not (m.get('type') == 'way' and m.get('ref') in way_ids)]
+        for geom in geometries:
+            pts = np.array([[pt['lat'], pt['lon']] for pt in geom], dtype=np.float64)
+            if len(pts) == 0:
+                continue
+            # Drop consecutive duplicate vertices (zero-length steps)
+            keep = np.ones(len(pts), dtype=bool)
+            keep[1:] = np.any(np.diff(pts, axis=0) != 0, axis=1)
+            pts = pts[keep]
+            rounded = pts.round(decimals=4)
+            key = min(rounded.tobytes(), rounded[::-1].tobytes())
+            if key in seen:
+                continue
+            seen.add(key)
+            segments.append(pts)
+    return segments
+
+def _endpoint_xy(points):
+    """[lat, lon] -> approximate local km (equirectangular; only used to find join candidates)."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return np.column_stack([points[:, 0] * 111.32, points[:, 1] * 111.32 * np.cos(np.radians(points[:, 0]))])
+
+def chain_segments(segments, tol_km=PATH_JOIN_TOLERANCE_KM):
+    """
+    Greedily join segments whose endpoints touch into ordered polylines.
+    Starts from the longest remaining segment and extends head/tail with the
+    closest free endpoint (reversing segments as needed). Endpoints are held in
+    a KD-tree, so each extension only looks at endpoints within `tol_km`.
+    """
+    order = sorted(range(len(segments)), key=lambda i: len(segments[i]), reverse=True)
+    if not order:
         return []
-        
-    points = np.array(all_points)
+    # Endpoint 2*i is the start of segment i, 2*i+1 its end
+    endpoints = np.array([[seg[0], seg[-1]] for seg in segments]).reshape(-1, 2)
+    tree = cKDTree(_endpoint_xy(endpoints))
+    # Slack for the planar approximation; candidates are re-checked with haversine
+    radius = tol_km * 1.01 + 1e-6
+    used = np.zeros(len(segments), dtype=bool)
     
-    # 1. Remove duplicates
-    _, unique_idx = np.unique(points.round(decimals=4), axis=0, return_index=True)
-    points = points[unique_idx]
+    def closest(point):
+        best = None
+        for e in tree.query_ball_point(_endpoint_xy(point)[0], radius):
+            if used[e // 2]:
+                continue
+            d = haversine(point[0], point[1], endpoints[e, 0], endpoints[e, 1])
+            if d <= tol_km and (best is None or d < best[0]):
+                best = (d, e)
+        return best
     
-    # 2. Sort by Latitude (Heuristic for simple linear features like Rail Corridor)
-    # This is not perfect for complex shapes but works for the specific user request.
-    sorted_points = points[np.argsort(points[:, 0])[::-1]] # North to South
+    chains = []
+    for first in order:
+        if used[first]:
+            continue
+        used[first] = True
+        # Pieces are collected on both sides and stacked once
+        head_pieces, tail_pieces = [], [segments[first]]
+        head, tail = segments[first][0], segments[first][-1]
+        while True:
+            at_tail, at_head = closest(tail), closest(head)
+            if at_tail is None and at_head is None:
+                break
+            if at_head is None or (at_tail is not None and at_tail[0] <= at_head[0]):
+                e = at_tail[1]
+                seg = segments[e // 2]
+                # Tail meets a start: append as-is; tail meets an end: append reversed
+                piece = seg[1:] if e % 2 == 0 else seg[::-1][1:]
+                tail_pieces.append(piece)
+                tail = piece[-1] if len(piece) else tail
+            else:
+                e = at_head[1]
+                seg = segments[e // 2]
+                # Head meets an end: prepend as-is; head meets a start: prepend reversed
+                piece = seg[:-1] if e % 2 == 1 else seg[::-1][:-1]
+                head_pieces.append(piece)
+                head = piece[0] if len(piece) else head
+            used[e // 2] = True
+        chains.append(np.vstack(head_pieces[::-1] + tail_pieces))
+    return chains
+
+def resample_polyline(points, sample_dist_km):
+    """Points every `sample_dist_km` of arc length along the polyline (starting at its first vertex)."""
+    if len(points) < 2:
+        return points[:1]
+    step = haversine(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+    cum = np.concatenate([[0.0], np.cumsum(step)])
+    targets = np.arange(0.0, cum[-1] + 1e-9, sample_dist_km)
     
-    if len(sorted_points) == 0:
+    idx = np.clip(np.searchsorted(cum, targets, side='right') - 1, 0, len(step) - 1)
+    seg_len = step[idx]
+    frac = np.divide(targets - cum[idx], seg_len, out=np.zeros_like(targets), where=seg_len > 0)
+    return points[idx] + frac[:, None] * (points[idx + 1] - points[idx])
+
+def process_and_sample_path(data, sample_dist_km=2.0):
+    """
+    Sample points at fixed arc-length spacing along the path geometry.
+    Segments are chained into polylines, each oriented north -> south and
+    sampled independently; polylines are returned northernmost first.
+    """
+    if not data or 'elements' not in data:
         return []
-        
-    final_samples = [sorted_points[0]]
     
-    for i in range(1, len(sorted_points)):
-        curr = sorted_points[i]
-        last = final_samples[-1]
-        
-        # Dist in km
-        dist = haversine(last[0], last[1], curr[0], curr[1])
-        
-        if dist >= sample_dist_km:
-            final_samples.append(curr)
-            
+    segments = extract_path_segments(data)
+    if not segments:
+        return []
+    
+    polylines = []
+    for chain in chain_segments(segments):
+        if chain[-1, 0] > chain[0, 0]:
+            chain = chain[::-1]
+        polylines.append(chain)
+    polylines.sort(key=lambda c: c[0, 0], reverse=True)
+    
+    final_samples = []
+    for chain in polylines:
+        final_samples.extend(resample_polyline(chain, sample_dist_km))
     return final_samples
 
 # --- Helper: Get Station Metadata ---
@@ -510,7 +723,9 @@ def get_delaunay_mesh(stations):
     # Check if we need to rebuild (if stations changed or first run)
     # Simple check: count
     if _delaunay_mesh is not None and len(stations) == len(_delaunay_stations):
+        record_cache("delaunay", hit=True)
         return _delaunay_mesh, _delaunay_stations
+    record_cache("delaunay", hit=False)
         
     coords = []
     valid_stations = []
@@ -614,28 +829,127 @@ def find_nearest_n_sensors(target_lat, target_lon, stations, n=3):
     if not final_list:
         return []
         
-    closest_dist = final_list[0][1]
-    filtered_list = [final_list[0]] # Always keep best
+    filtered_list = prune_sensors(final_list, n)
+    print(f"Sensor Pruning: {len(final_list)} -> {len(filtered_list)} (Nearest: {final_list[0][1]:.2f}km)")
     
-    for i in range(1, len(final_list)):
-        sid, dist = final_list[i]
-        
+    return filtered_list
+
+def prune_sensors(candidates, n=3):
+    """
+    Distance pruning shared by single and batch sensor selection.
+    candidates: [(sensor_id, dist_km), ...] sorted by distance.
+    """
+    if not candidates:
+        return []
+    closest_dist = candidates[0][1]
+    filtered_list = [candidates[0]] # Always keep best
+
+    for sid, dist in candidates[1:]:
         # 1. Absolute Cutoff (Singapore is small, >15km is irrelevant)
         if dist > 15.0:
             continue
-            
+
         # 2. Relative Cutoff
         # If it's 3x further than the nearest, AND strictly > 3km away.
         # (The >3km check prevents pruning when everything is super close like 0.5km vs 1.6km)
         if dist > (closest_dist * 3.0) and dist > 3.0:
             continue
-            
+
         filtered_list.append((sid, dist))
-        
-    print(f"Sensor Pruning: {len(final_list)} -> {len(filtered_list)} (Nearest: {closest_dist:.2f}km)")
-    
+
     return filtered_list[:n]
 
+def find_nearest_n_sensors_batch(points, stations, n=3):
+    """
+    Vectorized find_nearest_n_sensors for many points at once.
+    points: (P, 2) array-like of [lat, lon]
+    Returns one [(sensor_id, dist_km), ...] list per point, using the same rules as the
+    single-point version: enclosing Delaunay triangle if any, else K-nearest, then pruning.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not stations or len(points) == 0:
+        return [[] for _ in range(len(points))]
+
+    mesh, valid_stations = get_delaunay_mesh(stations)
+    if not valid_stations:
+        # Too few stations for a mesh: distance-only selection
+        valid_stations = [s for s in stations
+                          if 'latitude' in s.get('location', {}) and 'longitude' in s.get('location', {})]
+    if not valid_stations:
+        return [[] for _ in range(len(points))]
+
+    ids = [s['id'] for s in valid_stations]
+    coords = np.array([[s['location']['latitude'], s['location']['longitude']] for s in valid_stations])
+
+    # (P, S) distance matrix, same approximation as calculate_distance * 111
+    dist_km = np.sqrt(((points[:, None, :] - coords[None, :, :]) ** 2).sum(axis=-1)) * 111.0
+    simplex = mesh.find_simplex(points) if mesh else np.full(len(points), -1)
+    nearest = np.argsort(dist_km, axis=1, kind='stable')[:, :n]
+
+    results = []
+    for i in range(len(points)):
+        idx = mesh.simplices[simplex[i]] if simplex[i] != -1 else nearest[i]
+        candidates = sorted(((ids[j], float(dist_km[i, j])) for j in idx), key=lambda x: x[1])
+        results.append(prune_sensors(candidates, n))
+
+    inside = int((simplex != -1).sum())
+    print(f"Batch Sensor Selection: {len(points)} points ({inside} inside triangles), "
+          f"{len({sid for r in results for sid, _ in r})} unique stations")
+    return results
+
+def get_station_inputs(df, sensor_ids, target_time):
+    """
+    Model inputs for several stations: {sensor_id: (sat_tensor, sensor_tensor)}.
+    The dataframe is split by sensor once instead of filtered per call. Stations without
+    usable history at `target_time` fall back to their closest available timestamp
+    (same as /predict) and are omitted if that fails too.
+    """
+    sensor_ids = list(dict.fromkeys(sensor_ids))
+    groups = dict(tuple(df[df['sensor_id'].isin(sensor_ids)].groupby('sensor_id', observed=True)))
+
+    inputs = {}
+    for sid in sensor_ids:
+        group = groups.get(sid)
+        if group is None:
+            continue
+        sat_in, sensor_in = get_input_data(group, sid, target_time)
+        if sat_in is None or sensor_in is None:
+            try:
+                deltas = abs(group['timestamp'] - target_time)
+                closest_ts = group['timestamp'].iloc[deltas.argmin()]
+                sat_in, sensor_in = get_input_data(group, sid, closest_ts)
+            except Exception:
+                pass
+        if sat_in is not None and sensor_in is not None:
+            inputs[sid] = (sat_in, sensor_in)
+    return inputs
+
+def batch_inference(model, inputs):
+    """
+    One forward pass for {sensor_id: (sat, sensor)}.
+    Returns {sensor_id: [rainfall per horizon]} (a single-element list for a 1-horizon model).
+    """
+    if not inputs:
+        return {}
+    sids = list(inputs)
+    sat = torch.cat([inputs[sid][0] for sid in sids]).to(DEVICE)
+    sensor = torch.cat([inputs[sid][1] for sid in sids]).to(DEVICE)
+    with torch.no_grad():
+        preds = model(sat, sensor).reshape(len(sids), -1).tolist()
+    return dict(zip(sids, preds))
+
+def latest_readings(df, sensor_ids, target_time):
+    """Last reading at or before `target_time` per station: {sensor_id: (temperature, humidity, pm25)}."""
+    sub = df[df['sensor_id'].isin(list(sensor_ids)) & (df['timestamp'] <= target_time)]
+    if sub.empty:
+        return {}
+    rows = sub.loc[sub.groupby('sensor_id', observed=True)['timestamp'].idxmax()]
+    pm25 = rows['pm25'] if 'pm25' in rows else pd.Series(0.0, index=rows.index)
+    return {
+        sid: (float(t), float(h), float(p))
+        for sid, t, h, p in zip(rows['sensor_id'], rows['temperature'], rows['humidity'], pm25)
+    }
+
 def find_sensor_id(query, df, stations_metadata):
     """
     Find sensor ID by logic chain:
@@ -738,7 +1052,7 @@ if __name__ == "__main__":
             else:
                  with torch.no_grad():
                      prediction = model(sat_in.to(DEVICE), sensor_in.to(DEVICE))
-                     pred_val = prediction.item()
+                     pred_val = prediction[0, 0].item()  # first (10-minute) horizon
                      
                  print(f">>> PREDICTED RAINFALL (Next 10 mins): {pred_val:.4f} mm")
                  if pred_val < 0.1: print("Weather Outlook: Clear / No Rain")
@@ -19,6 +19,57 @@ SG_LAT_MIN, SG_LON_MAX = 1.15, 104.1
 C2, L2 = latlon2xy(SG_LAT_MIN, SG_LON_MAX)
 
 
+def extract_frame(ds):
+    """
+    Crop a Himawari dataset to the Singapore box and resize to TARGET_SIZE.
+    Returns a float32 array of raw Kelvin values, or None if the variable is missing.
+    Only the crop window is read, so full-disk files are never loaded whole.
+    """
+    # Determine variable name
+    var_name = 'tbb'
+    if 'tbb_13' in ds:
+        var_name = 'tbb_13'
+        
+    if var_name not in ds:
+        return None
+
+    # Check dimensions (Full Disk vs Dummy)
+    if ds[var_name].shape[0] > 1000:
+        # FULL DISK -> CROP
+        # Ensure indices are ordered
+        r_min, r_max = min(L1, L2), max(L1, L2)
+        c_min, c_max = min(C1, C2), max(C1, C2)
+        
+        # Extract
+        data = ds[var_name][r_min:r_max, c_min:c_max].values
+        
+        # Resize
+        # Input to interpolate must be (Batch, Channel, H, W) -> (1, 1, H, W)
+        tensor = torch.tensor(data, dtype=torch.float32).unsqueeze(0).unsqueeze(0)
+        resized = F.interpolate(tensor, size=TARGET_SIZE, mode='bilinear', align_corners=False)
+        
+        # Squeeze back to (64, 64)
+        final_arr = resized.squeeze().numpy()
+        
+    else:
+        # DUMMY -> Just load
+        data = ds[var_name].values
+        # Ensure 64x64
+        if data.shape != TARGET_SIZE:
+             tensor = torch.tensor(data, dtype=torch.float32).unsqueeze(0).unsqueeze(0)
+             resized = F.interpolate(tensor, size=TARGET_SIZE, mode='bilinear', align_corners=False)
+             final_arr = resized.squeeze().numpy()
+        else:
+             final_arr = data
+
+    # Normalize here? 
+    # Better to normalize in Dataset (runtime) or here (storage)?
+    # Storing raw Kelvin values (float) is more flexible. 
+    # But converting to float16 could save space.
+    # Let's keep as float32 raw Kelvin values for consistency with original script.
+    return final_arr
+
+
 def preprocess(input_dirs):
     if not os.path.exists(PROCESSED_DIR):
         os.makedirs(PROCESSED_DIR)
@@ -55,50 +106,11 @@ def preprocess(input_dirs):
             
         try:
             ds = xr.open_dataset(fpath, decode_timedelta=False)
-            
-            # Determine variable name
-            var_name = 'tbb'
-            if 'tbb_13' in ds:
-                var_name = 'tbb_13'
-                
-            if var_name not in ds:
+            final_arr = extract_frame(ds)
+            if final_arr is None:
                 print(f"Skipping {fname}: Variable not found.")
+                ds.close()
                 continue
-
-            # Check dimensions (Full Disk vs Dummy)
-            if ds[var_name].shape[0] > 1000:
-                # FULL DISK -> CROP
-                # Ensure indices are ordered
-                r_min, r_max = min(L1, L2), max(L1, L2)
-                c_min, c_max = min(C1, C2), max(C1, C2)
-                
-                # Extract
-                data = ds[var_name][r_min:r_max, c_min:c_max].values
-                
-                # Resize
-                # Input to interpolate must be (Batch, Channel, H, W) -> (1, 1, H, W)
-                tensor = torch.tensor(data, dtype=torch.float32).unsqueeze(0).unsqueeze(0)
-                resized = F.interpolate(tensor, size=TARGET_SIZE, mode='bilinear', align_corners=False)
-                
-                # Squeeze back to (64, 64)
-                final_arr = resized.squeeze().numpy()
-                
-            else:
-                # DUMMY -> Just load
-                data = ds[var_name].values
-                # Ensure 64x64
-                if data.shape != TARGET_SIZE:
-                     tensor = torch.tensor(data, dtype=torch.float32).unsqueeze(0).unsqueeze(0)
-                     resized = F.interpolate(tensor, size=TARGET_SIZE, mode='bilinear', align_corners=False)
-                     final_arr = resized.squeeze().numpy()
-                else:
-                     final_arr = data
-
-            # Normalize here? 
-            # Better to normalize in Dataset (runtime) or here (storage)?
-            # Storing raw Kelvin values (float) is more flexible. 
-            # But converting to float16 could save space.
-            # Let's keep as float32 raw Kelvin values for consistency with original script.
             
             np.save(out_path, final_arr)
             ds.close()
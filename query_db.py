@@ -7,9 +7,13 @@ import sqlite3
 import pandas as pd
 from datetime import datetime, timedelta
 
+import search_log
+
 def connect_db():
-    """连接数据库"""
-    return sqlite3.connect('weather.db')
+    """连接数据库（确保汇总表存在，旧库首次打开时回填）"""
+    conn = sqlite3.connect('weather.db')
+    search_log.ensure_rollups(conn)
+    return conn
 
 def show_recent_searches(limit=20):
     """显示最近的搜索记录"""
@@ -29,16 +33,9 @@ def show_recent_searches(limit=20):
     print()
 
 def show_popular_searches(limit=10):
-    """显示热门搜索"""
+    """显示热门搜索（汇总表索引，只读 limit 行）"""
     conn = connect_db()
-    query = f"""
-        SELECT query, COUNT(*) as count 
-        FROM search_history 
-        GROUP BY query 
-        ORDER BY count DESC 
-        LIMIT {limit}
-    """
-    df = pd.read_sql_query(query, conn)
+    df = pd.DataFrame(search_log.top_searches(conn, limit), columns=["query", "count"])
     conn.close()
     
     print(f"\n🔥 热门搜索 TOP {limit}:")
@@ -49,14 +46,7 @@ def show_popular_searches(limit=10):
 def show_ip_stats():
     """显示IP统计"""
     conn = connect_db()
-    query = """
-        SELECT ip_address, COUNT(*) as search_count 
-        FROM search_history 
-        WHERE ip_address IS NOT NULL
-        GROUP BY ip_address 
-        ORDER BY search_count DESC
-    """
-    df = pd.read_sql_query(query, conn)
+    df = pd.DataFrame(search_log.top_ips(conn), columns=["ip_address", "search_count"])
     conn.close()
     
     print("\n🌐 IP地址统计:")
@@ -68,21 +58,15 @@ def show_today_stats():
     """显示今日统计"""
     conn = connect_db()
     today = datetime.now().date()
-    query = f"""
-        SELECT COUNT(*) as total_searches,
-               COUNT(DISTINCT ip_address) as unique_ips,
-               COUNT(DISTINCT query) as unique_queries
-        FROM search_history 
-        WHERE DATE(timestamp) = '{today}'
-    """
-    df = pd.read_sql_query(query, conn)
+    # 按天汇总行，day 与 DATE(timestamp) 同一口径
+    total_searches, unique_ips, unique_queries = search_log.day_stats(conn, str(today))
     conn.close()
     
     print(f"\n📅 今日统计 ({today}):")
     print("=" * 80)
-    print(f"总搜索次数: {df['total_searches'][0]}")
-    print(f"独立IP数: {df['unique_ips'][0]}")
-    print(f"独立查询数: {df['unique_queries'][0]}")
+    print(f"总搜索次数: {total_searches}")
+    print(f"独立IP数: {unique_ips}")
+    print(f"独立查询数: {unique_queries}")
     print()
 
 def custom_query(sql):
@@ -110,10 +94,11 @@ def main():
         print("3. 查看IP统计")
         print("4. 查看今日统计")
         print("5. 执行自定义SQL")
+        print("6. 重建搜索汇总表")
         print("0. 退出")
         print("=" * 80)
         
-        choice = input("\n请选择 (0-5): ").strip()
+        choice = input("\n请选择 (0-6): ").strip()
         
         if choice == "1":
             limit = input("显示多少条? (默认20): ").strip()
@@ -129,6 +114,11 @@ def main():
             sql = input("输入SQL查询: ").strip()
             if sql:
                 custom_query(sql)
+        elif choice == "6":
+            conn = connect_db()
+            search_log.rebuild_rollups(conn)
+            conn.close()
+            print("✅ 汇总表已从 search_history 重建")
         elif choice == "0":
             print("\n👋 再见！")
             break
@@ -0,0 +1,119 @@
+"""
+response_cache.py
+/predict 响应缓存（按 10 分钟时间槽）
+
+predict_weather 会把当前时间向下取整到 10 分钟，同一时间槽内同一位置的结果完全相同，
+因此按 (位置键, 时间槽) 缓存整份响应:
+- 位置键: 规范化的地名，或四舍五入到 ROUND_DIGITS 位的经纬度
+- TTL:    到时间槽结束为止（键中包含槽起点，新槽自然未命中，旧槽条目惰性清除）
+- 容量:   LRU，超过 max_entries 时淘汰最久未使用的条目
+- 合并:   同一键的并发未命中只计算一次，其余请求等待同一结果（异常也一并传递，不缓存）
+
+环境变量:
+    PREDICT_CACHE_SIZE   最大条目数 (默认 2048，0 = 关闭缓存)
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from metrics import record_cache
+from singleflight import SingleFlight
+
+SLOT_MINUTES = 10
+ROUND_DIGITS = 3  # ~110m，远小于传感器间距
+PREDICT_CACHE_SIZE = int(os.environ.get("PREDICT_CACHE_SIZE", "2048"))
+
+
+def current_slot(now=None):
+    """当前 10 分钟时间槽的起点"""
+    now = now or datetime.now()
+    return now.replace(minute=(now.minute // SLOT_MINUTES) * SLOT_MINUTES, second=0, microsecond=0)
+
+
+def location_key(location=None, lat=None, lon=None):
+    """规范化的位置键；经纬度优先（与 predict_weather 的分支顺序一致）"""
+    if lat is not None and lon is not None:
+        return ("latlon", round(float(lat), ROUND_DIGITS), round(float(lon), ROUND_DIGITS))
+    if location:
+        return ("location", re.sub(r"\s+", " ", location.strip().lower()))
+    return None
+
+
+class SlotCache:
+    """按时间槽过期的 LRU 缓存，带并发未命中合并"""
+
+    def __init__(self, name, max_entries=PREDICT_CACHE_SIZE):
+        self.name = name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (key, slot) -> value
+        self._flight = SingleFlight(name)
+        self._slot = None
+
+    def _evict_expired(self, slot):
+        """进入新时间槽时丢弃旧槽条目（调用方持有锁）"""
+        if self._slot == slot:
+            return
+        self._slot = slot
+        for k in [k for k in self._entries if k[1] != slot]:
+            del self._entries[k]
+
+    def get(self, key, slot):
+        with self._lock:
+            self._evict_expired(slot)
+            value = self._entries.get((key, slot))
+            if value is not None:
+                self._entries.move_to_end((key, slot))
+            return value
+
+    def put(self, key, slot, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._evict_expired(slot)
+            if slot != self._slot:
+                return  # 计算跨越了槽边界，结果已过期
+            self._entries[(key, slot)] = value
+            self._entries.move_to_end((key, slot))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, slot, compute):
+        """命中则返回缓存；否则只让一个调用方执行 compute()，其余等待其结果"""
+        if self.max_entries <= 0 or key is None:
+            return compute()
+
+        value = self.get(key, slot)
+        if value is not None:
+            record_cache(self.name, hit=True)
+            return value
+        record_cache(self.name, hit=False)
+
+        def run():
+            # 上一个计算者可能刚刚写入
+            result = self.get(key, slot)
+            if result is not None:
+                return result
+            result = compute()
+            self.put(key, slot, result)
+            return result
+
+        result, _ = self._flight.do((key, slot), run)
+        return result
+
+    def clear(self):
+        """模型或数据重新加载后调用"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def seconds_until_next_slot(now=None):
+    now = now or datetime.now()
+    return (current_slot(now) + timedelta(minutes=SLOT_MINUTES) - now).total_seconds()
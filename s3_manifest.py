@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+s3_manifest.py
+S3 每日数据清单 (manifest)
+
+下载器和训练器在每天数据状态变化时写入一个小的 JSON 清单，
+监控和调度只需读取清单（或汇总索引），不再实时列出 satellite/ 并 head_object 标记文件。
+
+S3 布局:
+    manifests/days/YYYYMMDD.json   单日清单
+    manifests/index.json           汇总索引 {"days": {"YYYY-MM-DD": {...}}}
+
+单日清单格式:
+    {
+      "date": "2025-10-01",
+      "status": "completed",          # pending | running | completed | trained
+      "satellite": {"files": 144, "bytes": 123456789},
+      "nea": {"rainfall": {"present": true, "bytes": 1234}, ...},
+      "updated_at": "...",
+      "updated_by": "downloader"
+    }
+
+用法:
+    python3 s3_manifest.py write --date 2025-10-01 [--by downloader]
+    python3 s3_manifest.py status --date 2025-10-01 --status trained [--by trainer]
+    python3 s3_manifest.py show [--date 2025-10-01]
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from storage import get_s3_client
+
+logger = logging.getLogger(__name__)
+
+S3_BUCKET = os.environ.get("S3_BUCKET", "weather-ai-models-de08370c")
+SATELLITE_PREFIX = "satellite"
+GOVDATA_PREFIX = "govdata"
+MANIFEST_PREFIX = "manifests/days"
+INDEX_KEY = "manifests/index.json"
+
+NEA_APIS = ["rainfall", "temperature", "humidity", "pm25"]
+# 终态：不会再变化，监控无需实时列出
+TERMINAL_STATUSES = ("completed", "trained")
+INDEX_UPDATE_RETRIES = 5
+
+
+def _date_fmt(date_str):
+    """2025-10-01 -> 20251001"""
+    return date_str.replace("-", "")
+
+
+def day_manifest_key(date_str):
+    return f"{MANIFEST_PREFIX}/{_date_fmt(date_str)}.json"
+
+
+def _is_missing(error):
+    return error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound")
+
+
+def _read_json(s3, bucket, key):
+    """读取 JSON 对象，返回 (data, etag)；不存在时返回 (None, None)"""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if _is_missing(e):
+            return None, None
+        raise
+    return json.loads(obj["Body"].read().decode("utf-8")), obj.get("ETag")
+
+
+def build_day_manifest(s3, date_str, bucket=None):
+    """列出单日卫星目录并检查 NEA 数据，生成清单（不写入 S3）"""
+    bucket = bucket or S3_BUCKET
+    date_fmt = _date_fmt(date_str)
+
+    files = 0
+    size = 0
+    has_complete = False
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{SATELLITE_PREFIX}/{date_fmt}/"):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".complete"):
+                has_complete = True
+            elif obj["Key"].endswith(".nc"):
+                files += 1
+                size += obj.get("Size", 0)
+
+    nea = {}
+    for api in NEA_APIS:
+        try:
+            head = s3.head_object(Bucket=bucket, Key=f"{GOVDATA_PREFIX}/{api}_{date_str}.json")
+            nea[api] = {"present": True, "bytes": head.get("ContentLength", 0)}
+        except ClientError:
+            nea[api] = {"present": False, "bytes": 0}
+
+    if has_complete:
+        status = "completed"
+    elif files > 0:
+        status = "running"
+    else:
+        status = "pending"
+
+    return {
+        "date": date_str,
+        "status": status,
+        "satellite": {"files": files, "bytes": size},
+        "nea": nea,
+        "updated_at": datetime.now().isoformat(),
+    }
+
+
+def _index_entry(manifest):
+    return {
+        "status": manifest["status"],
+        "satellite_files": manifest["satellite"]["files"],
+        "satellite_bytes": manifest["satellite"]["bytes"],
+        "nea_files": sum(1 for v in manifest["nea"].values() if v.get("present")),
+        "updated_at": manifest["updated_at"],
+    }
+
+
+def _update_index(s3, bucket, manifest):
+    """乐观并发更新汇总索引（ETag 条件写入，冲突时重试）"""
+    for _ in range(INDEX_UPDATE_RETRIES):
+        index, etag = _read_json(s3, bucket, INDEX_KEY)
+        index = index or {"days": {}}
+        index["days"][manifest["date"]] = _index_entry(manifest)
+        index["updated_at"] = manifest["updated_at"]
+
+        condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            s3.put_object(
+                Bucket=bucket,
+                Key=INDEX_KEY,
+                Body=json.dumps(index, indent=2, ensure_ascii=False),
+                ContentType="application/json",
+                **condition
+            )
+            return True
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+                continue
+            raise
+    logger.warning(f"清单索引更新冲突，放弃: {manifest['date']}")
+    return False
+
+
+def write_day_manifest(s3, manifest, bucket=None):
+    """写入单日清单并更新汇总索引"""
+    bucket = bucket or S3_BUCKET
+    s3.put_object(
+        Bucket=bucket,
+        Key=day_manifest_key(manifest["date"]),
+        Body=json.dumps(manifest, indent=2, ensure_ascii=False),
+        ContentType="application/json"
+    )
+    _update_index(s3, bucket, manifest)
+    return manifest
+
+
+def refresh_day_manifest(s3, date_str, bucket=None, updated_by=None):
+    """重新统计单日数据并写入清单（下载器使用）"""
+    manifest = build_day_manifest(s3, date_str, bucket=bucket)
+    if updated_by:
+        manifest["updated_by"] = updated_by
+    return write_day_manifest(s3, manifest, bucket=bucket)
+
+
+def mark_day_status(s3, date_str, status, bucket=None, updated_by=None):
+    """
+    只更新单日状态（训练器使用）
+    归档后 satellite/ 已清空，因此保留原有统计，不重新列出
+    """
+    bucket = bucket or S3_BUCKET
+    manifest, _ = _read_json(s3, bucket, day_manifest_key(date_str))
+    if manifest is None:
+        manifest = build_day_manifest(s3, date_str, bucket=bucket)
+    manifest["status"] = status
+    manifest["updated_at"] = datetime.now().isoformat()
+    if updated_by:
+        manifest["updated_by"] = updated_by
+    return write_day_manifest(s3, manifest, bucket=bucket)
+
+
+def read_day_manifest(s3, date_str, bucket=None):
+    """读取单日清单，不存在时返回 None"""
+    manifest, _ = _read_json(s3, bucket or S3_BUCKET, day_manifest_key(date_str))
+    return manifest
+
+
+def read_manifest_index(s3, bucket=None):
+    """读取汇总索引，不存在时返回 None"""
+    index, _ = _read_json(s3, bucket or S3_BUCKET, INDEX_KEY)
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="S3 每日数据清单")
+    parser.add_argument("action", choices=["write", "status", "show"])
+    parser.add_argument("--date", help="日期 YYYY-MM-DD")
+    parser.add_argument("--status", choices=["pending", "running", "completed", "trained"])
+    parser.add_argument("--by", default=None, help="写入方 (downloader / trainer)")
+    parser.add_argument("--bucket", default=S3_BUCKET)
+    args = parser.parse_args()
+
+    s3 = get_s3_client()
+
+    if args.action == "show":
+        data = read_day_manifest(s3, args.date, args.bucket) if args.date else read_manifest_index(s3, args.bucket)
+        print(json.dumps(data, indent=2, ensure_ascii=False))
+    elif not args.date:
+        parser.error("--date is required")
+    elif args.action == "write":
+        manifest = refresh_day_manifest(s3, args.date, bucket=args.bucket, updated_by=args.by)
+        print(f"📋 清单已更新: {args.date} ({manifest['status']}, {manifest['satellite']['files']} 文件)")
+    else:
+        if not args.status:
+            parser.error("--status is required")
+        mark_day_status(s3, args.date, args.status, bucket=args.bucket, updated_by=args.by)
+        print(f"📋 状态已更新: {args.date} -> {args.status}")
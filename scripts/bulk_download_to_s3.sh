@@ -130,6 +130,10 @@ while [[ "$current" < "$END_DATE" ]] || [[ "$current" == "$END_DATE" ]]; do
     # 创建完成标记
     echo "$current" | aws s3 cp - "s3://$S3_BUCKET/$SATELLITE_PREFIX/$date_fmt/.complete" --quiet
     
+    # 更新每日清单
+    python3 "$(dirname "$0")/../s3_manifest.py" write --date "$current" --by downloader --bucket "$S3_BUCKET" || \
+        echo "   ⚠️ 清单更新失败: $current"
+    
     echo "   ✅ 日期完成"
     
     # 下一天 (Linux 兼容)
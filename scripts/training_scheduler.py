@@ -10,13 +10,18 @@ training_scheduler.py
 """
 
 import os
+import sys
 import json
 import subprocess
-import boto3
 from datetime import datetime, timedelta
 from pathlib import Path
 import logging
 
+# 以 scripts/training_scheduler.py 运行时让仓库根目录的 storage.py / s3_manifest.py 可导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from s3_manifest import read_day_manifest, mark_day_status
+from storage import get_s3_client
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -61,19 +66,27 @@ def save_state(state):
 def check_data_available(date_str):
     """
     检查指定日期的数据是否在 S3 中就绪
-    通过 .complete 标记文件判断
+    优先读取每日清单 (manifests/days/YYYYMMDD.json)，没有清单时回退到 .complete 标记文件
     """
     date_fmt = date_str.replace("-", "")
     complete_key = f"{SATELLITE_PREFIX}/{date_fmt}/.complete"
     
     try:
-        s3 = boto3.client('s3')
-        s3.head_object(Bucket=S3_BUCKET, Key=complete_key)
-        logger.info(f"✅ 数据就绪: {date_str}")
-        return True
+        s3 = get_s3_client()
+        manifest = read_day_manifest(s3, date_str, bucket=S3_BUCKET)
+        if manifest is not None:
+            ready = manifest.get("status") == "completed"
+        else:
+            s3.head_object(Bucket=S3_BUCKET, Key=complete_key)
+            ready = True
     except Exception:
+        ready = False
+    
+    if ready:
+        logger.info(f"✅ 数据就绪: {date_str}")
+    else:
         logger.info(f"⏳ 数据未就绪: {date_str}")
-        return False
+    return ready
 
 
 def download_from_s3(date_str):
@@ -214,6 +227,15 @@ def archive_s3_data(date_str):
         ], capture_output=True)
 
 
+def mark_day_trained(date_str):
+    """在每日清单中标记已训练（归档后 satellite/ 已清空）"""
+    try:
+        s3 = get_s3_client()
+        mark_day_status(s3, date_str, "trained", bucket=S3_BUCKET, updated_by="trainer")
+    except Exception as e:
+        logger.warning(f"清单更新失败: {e}")
+
+
 def send_notification(success, date_str, error_msg=None):
     """发送邮件通知"""
     try:
@@ -322,6 +344,7 @@ def run_scheduler(max_batches=None, wait_for_data=True):
             
             # 6. 归档 S3 数据
             archive_s3_data(next_date)
+            mark_day_trained(next_date)
             
             # 更新状态
             state["last_processed_date"] = next_date
@@ -0,0 +1,313 @@
+"""
+search_log.py
+搜索记录的后台批量写入（write-behind）
+
+原来每次 POST /log-search 都在请求线程里 sqlite3.connect → INSERT → commit → close，
+并发搜索在 SQLite 写锁和 fsync 上串行。SearchLogWriter:
+
+- 请求线程只做一次非阻塞入队（队列满时丢弃并计数，不阻塞请求）
+- 后台线程持有一个长连接（WAL 模式，synchronous=NORMAL），每 flush_ms 毫秒或凑满 batch_size 行
+  在一个事务中 executemany 写入
+- 时间戳在入队时记录（与 CURRENT_TIMESTAMP 相同的 UTC 格式），批量写入不改变记录时间
+- WAL 模式下 /popular-searches、query_db.py 等读取不会阻塞写入
+
+新记录最多延迟 flush_ms 才对读取可见；API 关闭时 close() 会写完队列中剩余的记录。
+
+汇总表 search_rollup（与明细在同一事务中增量更新）:
+    (kind, day, key) → count, score
+    kind = 'query' / 'ip'；day = 'YYYY-MM-DD'（与 DATE(timestamp) 一致）或 '' 表示全部时间
+    score 为前向衰减计数 Σ 2^((t - 2025-01-01) / 半衰期)：旧记录的分数不需要回写，
+    按 score 排序即按时间衰减后的热度排序，读取时再乘回 2^(-(now - 2025-01-01) / 半衰期)
+
+    (kind, day, count) 和 (kind, day, score) 上有索引，热门 Top-k 只读 k 行；
+    今日统计、IP 统计按 day 前缀读取汇总行，不再 DATE(timestamp) 全表扫描。
+    已有数据库第一次打开时从 search_history 回填（rebuild_rollups）。多个 worker 同时导入 api 时
+    由 <数据库>.rollup.lock 串行化：第一个进程回填，其余进程在文件锁上等待（而不是在 SQLite 的
+    5 秒写锁超时上失败），拿到锁后发现汇总表已有数据直接返回。
+
+环境变量:
+    SEARCH_LOG_FLUSH_MS     批量写入间隔毫秒数 (默认 200)
+    SEARCH_LOG_BATCH        单个事务最多行数 (默认 500)
+    SEARCH_LOG_QUEUE_MAX    队列上限，超过后丢弃新记录 (默认 10000)
+    SEARCH_DECAY_HOURS      热度衰减半衰期小时数 (默认 168)
+
+指标:
+    weather_api_search_log_rows_total{result}   written / dropped
+    weather_api_search_log_batch_rows           每个事务的行数分布
+    weather_api_search_log_queue_depth          等待写入的记录数
+"""
+
+import os
+import fcntl
+import queue
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from metrics import Counter, Gauge, Histogram, stage_timer
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = "weather.db"
+SEARCH_LOG_FLUSH_MS = float(os.environ.get("SEARCH_LOG_FLUSH_MS", "200"))
+SEARCH_LOG_BATCH = int(os.environ.get("SEARCH_LOG_BATCH", "500"))
+SEARCH_LOG_QUEUE_MAX = int(os.environ.get("SEARCH_LOG_QUEUE_MAX", "10000"))
+SEARCH_DECAY_HOURS = float(os.environ.get("SEARCH_DECAY_HOURS", "168"))
+# 前向衰减的固定起点；2^((now - 起点) / 半衰期) 在半衰期 7 天时几十年内不会溢出
+DECAY_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+ROWS = Counter(
+    "weather_api_search_log_rows_total", "Search log rows by result (written/dropped).", ("result",))
+BATCH_ROWS = Histogram(
+    "weather_api_search_log_batch_rows", "Rows per search log transaction.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+QUEUE_DEPTH = Gauge(
+    "weather_api_search_log_queue_depth", "Search log rows waiting to be written.")
+
+INSERT_SQL = "INSERT INTO search_history (query, ip_address, timestamp) VALUES (?, ?, ?)"
+
+ROLLUP_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS search_rollup (
+        kind TEXT NOT NULL,
+        day TEXT NOT NULL,
+        key TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (kind, day, key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_search_rollup_count ON search_rollup (kind, day, count DESC);
+    CREATE INDEX IF NOT EXISTS idx_search_rollup_score ON search_rollup (kind, day, score DESC);
+"""
+
+UPSERT_SQL = """
+    INSERT INTO search_rollup (kind, day, key, count, score) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (kind, day, key) DO UPDATE SET
+        count = count + excluded.count,
+        score = score + excluded.score
+"""
+
+
+def connect(db_path=DB_PATH):
+    """长连接：WAL 模式 + synchronous=NORMAL（WAL 下只在检查点 fsync）"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _decay_weight(timestamp):
+    """记录时刻的前向衰减权重 2^((t - 起点) / 半衰期)"""
+    t = datetime.fromisoformat(timestamp[:19]).replace(tzinfo=timezone.utc)
+    return 2.0 ** ((t - DECAY_EPOCH).total_seconds() / 3600.0 / SEARCH_DECAY_HOURS)
+
+
+def apply_rollups(conn, rows):
+    """把一批 (query, ip_address, timestamp) 累加进 search_rollup（调用方负责事务）"""
+    deltas = defaultdict(lambda: [0, 0.0])
+    for query, ip_address, timestamp in rows:
+        if not timestamp:
+            continue
+        day = timestamp[:10]
+        weight = _decay_weight(timestamp)
+        keys = [("query", day, query), ("query", "", query)]
+        if ip_address is not None:
+            keys += [("ip", day, ip_address), ("ip", "", ip_address)]
+        for k in keys:
+            deltas[k][0] += 1
+            deltas[k][1] += weight
+    conn.executemany(UPSERT_SQL, [(*k, count, score) for k, (count, score) in deltas.items()])
+
+
+REBUILD_SQL = """
+    INSERT INTO search_rollup (kind, day, key, count, score)
+    SELECT '{kind}', {day}, {column}, COUNT(*),
+           SUM(pow(2.0, (julianday(timestamp) - julianday(?)) * 24.0 / ?))
+    FROM search_history
+    WHERE {column} IS NOT NULL AND timestamp IS NOT NULL
+    GROUP BY {day}, {column}
+"""
+
+
+def rebuild_rollups(conn, chunk_size=10000):
+    """从 search_history 全量重建汇总表（一次性回填 / 修复用）"""
+    epoch = DECAY_EPOCH.strftime(TIMESTAMP_FORMAT)
+    with conn:
+        conn.execute("DELETE FROM search_rollup")
+        try:
+            # 一条 GROUP BY 完成，比逐行 upsert 快一个数量级（需要 SQLite 数学函数 pow）
+            for kind, column in (("query", "query"), ("ip", "ip_address")):
+                for day in ("substr(timestamp, 1, 10)", "''"):
+                    conn.execute(REBUILD_SQL.format(kind=kind, day=day, column=column),
+                                 (epoch, SEARCH_DECAY_HOURS))
+            return
+        except sqlite3.OperationalError:
+            conn.execute("DELETE FROM search_rollup")
+        cursor = conn.execute("SELECT query, ip_address, timestamp FROM search_history")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            apply_rollups(conn, rows)
+
+
+def ensure_rollups(conn):
+    """创建汇总表；已有明细但汇总表为空时回填（同一数据库文件的进程间只回填一次）"""
+    db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    lock = open(f"{db_path}.rollup.lock", "w") if db_path else None
+    try:
+        if lock is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        conn.executescript(ROLLUP_SCHEMA)
+        if conn.execute("SELECT 1 FROM search_rollup LIMIT 1").fetchone() is None \
+                and conn.execute("SELECT 1 FROM search_history LIMIT 1").fetchone() is not None:
+            logger.info("Backfilling search_rollup from search_history")
+            rebuild_rollups(conn)
+    finally:
+        if lock is not None:
+            lock.close()
+
+
+def top_searches(conn, limit=6, days=None, decayed=False, now=None):
+    """
+    热门搜索 [(query, count)]
+    - 默认: 全部时间计数，走 (kind, day, count) 索引只读 limit 行
+    - decayed=True: 按衰减热度排序，count 为衰减后的有效次数
+    - days=N: 最近 N 天（含今天，UTC）的按天汇总相加
+    """
+    if days:
+        since = ((now or datetime.now(timezone.utc)) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        return conn.execute(
+            "SELECT key, SUM(count) AS total FROM search_rollup "
+            "WHERE kind = 'query' AND day >= ? AND TRIM(key) != '' "
+            "GROUP BY key ORDER BY total DESC LIMIT ?", (since, limit)
+        ).fetchall()
+    if decayed:
+        now = now or datetime.now(timezone.utc)
+        scale = 2.0 ** (-(now - DECAY_EPOCH).total_seconds() / 3600.0 / SEARCH_DECAY_HOURS)
+        rows = conn.execute(
+            "SELECT key, score FROM search_rollup WHERE kind = 'query' AND day = '' AND TRIM(key) != '' "
+            "ORDER BY score DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [(key, round(score * scale, 2)) for key, score in rows]
+    return conn.execute(
+        "SELECT key, count FROM search_rollup WHERE kind = 'query' AND day = '' AND TRIM(key) != '' "
+        "ORDER BY count DESC LIMIT ?", (limit,)
+    ).fetchall()
+
+
+def top_ips(conn, limit=None, day=""):
+    """IP 搜索次数排行 [(ip_address, count)]；day 为空表示全部时间"""
+    return conn.execute(
+        "SELECT key, count FROM search_rollup WHERE kind = 'ip' AND day = ? "
+        "ORDER BY count DESC LIMIT ?", (day, -1 if limit is None else limit)
+    ).fetchall()
+
+
+def day_stats(conn, day):
+    """某天的 (总搜索次数, 独立IP数, 独立查询数)"""
+    total, unique_queries = conn.execute(
+        "SELECT COALESCE(SUM(count), 0), COUNT(*) FROM search_rollup WHERE kind = 'query' AND day = ?", (day,)
+    ).fetchone()
+    unique_ips = conn.execute(
+        "SELECT COUNT(*) FROM search_rollup WHERE kind = 'ip' AND day = ?", (day,)
+    ).fetchone()[0]
+    return total, unique_ips, unique_queries
+
+
+class SearchLogWriter:
+    """非阻塞入队 + 后台批量事务写入 search_history"""
+
+    _STOP = object()
+
+    def __init__(self, db_path=DB_PATH, flush_ms=SEARCH_LOG_FLUSH_MS, batch_size=SEARCH_LOG_BATCH,
+                 max_queue=SEARCH_LOG_QUEUE_MAX):
+        self.db_path = db_path
+        self.flush_interval = flush_ms / 1000.0
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="search-log-writer", daemon=True)
+                    self._thread.start()
+
+    def log(self, query, ip_address=None):
+        """入队一条搜索记录；队列满时丢弃并返回 False"""
+        self._ensure_started()
+        row = (query, ip_address, datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT))
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            ROWS.inc(result="dropped")
+            return False
+        QUEUE_DEPTH.inc()
+        return True
+
+    def flush(self):
+        """阻塞直到已入队的记录全部提交"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """写完剩余记录并停止后台线程"""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _collect(self, first):
+        rows = [first]
+        deadline = time.monotonic() + self.flush_interval
+        stop = False
+        while len(rows) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                stop = True
+                break
+            rows.append(item)
+        return rows, stop
+
+    def _write(self, conn, rows):
+        try:
+            with stage_timer("sqlite_write"), conn:
+                conn.executemany(INSERT_SQL, rows)
+                apply_rollups(conn, rows)
+            ROWS.inc(len(rows), result="written")
+            BATCH_ROWS.observe(len(rows))
+        except sqlite3.Error as e:
+            ROWS.inc(len(rows), result="dropped")
+            logger.error(f"Failed to write {len(rows)} search log rows: {e}")
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            ensure_rollups(conn)
+            while True:
+                first = self._queue.get()
+                if first is self._STOP:
+                    self._queue.task_done()
+                    return
+                rows, stop = self._collect(first)
+                self._write(conn, rows)
+                QUEUE_DEPTH.dec(len(rows))
+                for _ in range(len(rows) + stop):
+                    self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            conn.close()
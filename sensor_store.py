@@ -0,0 +1,139 @@
+"""
+sensor_store.py
+传感器宽表 (real_sensor_data.csv) 增量写入
+
+- IngestLedger: 记录已导入的数据源（govdata 文件名 + mtime + size，或 NEA 日期），
+  增量模式下只解析新增/变化的源
+- upsert_rows: 按 (timestamp, sensor_id) 将新行 upsert 到 CSV
+    * 新数据全部晚于已有数据 → 直接追加，开销只与新数据量相关
+    * 有重叠（补数据 / 同一天的其他类型文件）→ 读取整个 CSV、按列合并、整体重写
+      （开销与 CSV 总大小成正比；日常增量只走追加路径）
+"""
+
+import json
+import os
+
+import pandas as pd
+
+SENSOR_COLUMNS = ["timestamp", "sensor_id", "humidity", "pm25", "rainfall", "temperature"]
+LEDGER_FILE = "govdata_ingest_state.json"
+KEY_COLUMNS = ["timestamp", "sensor_id"]
+
+
+def file_fingerprint(path):
+    """文件指纹：mtime + size"""
+    st = os.stat(path)
+    return {"mtime": st.st_mtime, "size": st.st_size}
+
+
+class IngestLedger:
+    """已导入数据源记录（JSON 文件）"""
+
+    def __init__(self, path=LEDGER_FILE):
+        self.path = path
+        self.sources = {}
+        self.max_timestamp = None
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.sources = data.get("sources", {})
+            if data.get("max_timestamp"):
+                self.max_timestamp = pd.Timestamp(data["max_timestamp"])
+
+    def is_ingested(self, key, fingerprint=None):
+        """源已导入且指纹未变化"""
+        if key not in self.sources:
+            return False
+        return fingerprint is None or self.sources[key] == fingerprint
+
+    def mark(self, key, fingerprint=None):
+        self.sources[key] = fingerprint or {}
+
+    def reset(self, sources, max_timestamp):
+        """
+        CSV 被整体重写（非增量导入）后调用：只保留写入它的源，max_timestamp 取新数据的最大值，
+        否则下一次增量导入会按旧的 max_timestamp 走追加路径，重复写入已有的行
+        """
+        self.sources = dict(sources)
+        self.max_timestamp = pd.Timestamp(max_timestamp) if max_timestamp is not None else None
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "sources": self.sources,
+                "max_timestamp": self.max_timestamp.isoformat() if self.max_timestamp is not None else None,
+            }, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def _align_tz(ts, reference):
+    """让新数据的时区与已有 CSV 一致（CSV 为 naive 时按新加坡本地时间存储）"""
+    if ts.dt.tz is not None and reference.tz is None:
+        return ts.dt.tz_convert("Asia/Singapore").dt.tz_localize(None)
+    if ts.dt.tz is None and reference.tz is not None:
+        return ts.dt.tz_localize(reference.tz)
+    return ts
+
+
+def _write_atomic(df, output_file):
+    tmp_path = f"{output_file}.tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, output_file)
+
+
+def upsert_rows(new_df, output_file, ledger=None, fill_value=0.0):
+    """
+    将 new_df 按 (timestamp, sensor_id) upsert 到 output_file
+
+    new_df 只需包含本次解析到的数据列；缺失列/NaN 不会覆盖已有值。
+    新数据全部晚于已有数据时直接追加；否则读取整个 CSV 合并后整体重写，
+    开销与 CSV 总大小而不是新数据量成正比。
+
+    Returns:
+        "created" | "appended" | "merged" | "empty"
+    """
+    if new_df.empty:
+        return "empty"
+
+    new_df = new_df.copy()
+    new_df["timestamp"] = pd.to_datetime(new_df["timestamp"])
+
+    if not os.path.exists(output_file):
+        out = new_df.reindex(columns=SENSOR_COLUMNS).fillna(fill_value)
+        out = out.sort_values(KEY_COLUMNS)
+        _write_atomic(out, output_file)
+        mode = "created"
+    else:
+        columns = pd.read_csv(output_file, nrows=0).columns.tolist()
+
+        max_existing = ledger.max_timestamp if ledger is not None else None
+        if max_existing is None:
+            # 首次增量导入：只读取时间戳列
+            existing_ts = pd.to_datetime(pd.read_csv(output_file, usecols=["timestamp"])["timestamp"])
+            max_existing = existing_ts.max() if len(existing_ts) else None
+
+        if max_existing is not None:
+            new_df["timestamp"] = _align_tz(new_df["timestamp"], max_existing)
+
+        if max_existing is None or new_df["timestamp"].min() > max_existing:
+            # 快速路径：全部为新时间段，直接追加
+            out = new_df.reindex(columns=columns).fillna(fill_value)
+            out = out.sort_values(KEY_COLUMNS)
+            out.to_csv(output_file, mode="a", header=False, index=False)
+            mode = "appended"
+        else:
+            # 重叠：按列合并，新值优先
+            existing = pd.read_csv(output_file)
+            existing["timestamp"] = pd.to_datetime(existing["timestamp"])
+            merged = new_df.set_index(KEY_COLUMNS).combine_first(existing.set_index(KEY_COLUMNS))
+            merged = merged.reset_index().reindex(columns=columns).fillna(fill_value)
+            merged = merged.sort_values(KEY_COLUMNS)
+            _write_atomic(merged, output_file)
+            mode = "merged"
+
+    if ledger is not None:
+        new_max = new_df["timestamp"].max()
+        if ledger.max_timestamp is None or new_max > ledger.max_timestamp:
+            ledger.max_timestamp = new_max
+    return mode
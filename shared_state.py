@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+shared_state.py
+多 worker 共享的模型 / 传感器 / 卫星帧状态（共享内存 mmap）
+
+多个 uvicorn worker 各自调用 load_system() 时，每个进程都会解析一遍 CSV、持有一份完整的传感器
+DataFrame 和模型权重，内存和启动时间随 worker 数线性增长。共享模式下:
+
+- publish()（加载进程，启动 worker 之前执行一次）把状态写成 .npy / .pth 文件:
+    sensors/<列>.npy    数值列、timestamp (int64 ns)、sensor_id (分类编码 + categories)
+    frames.npy          processed_data 中最近 SHARED_FRAME_DAYS 天的卫星帧 (N, 64, 64)
+    model.pth           模型权重
+  文件写在 SHARED_STATE_DIR（默认 /dev/shm 下，即内存文件系统）的新版本目录中，最后原子替换 current.json
+- attach()（每个 worker 启动时）以只读 mmap 方式挂载:
+    DataFrame 的列直接引用 mmap 数组（零拷贝），卫星帧按文件名查表，
+    权重用 torch.load(mmap=True) + load_state_dict(assign=True) 挂载
+  所有 worker 共用同一份物理页，RSS 和启动时间不再随 worker 数增长
+- live/（LIVE_INGEST=1 时）: 实时 NEA 环形缓冲区，一个 worker 写入、所有 worker 映射读取
+
+CSV 或模型文件在 publish 之后变化（指纹不一致）时 attach() 返回 None，调用方回退到 load_system()。
+不在帧表中的卫星帧（publish 之后新到的）照常从磁盘读取。
+
+环境变量:
+    SHARED_STATE        1 = worker 启动时挂载共享状态 (api.py 多 worker 启动时自动设置)
+    SHARED_STATE_DIR    共享状态目录 (默认 /dev/shm/weather-ai，无 /dev/shm 时为 shared_state)
+    SHARED_FRAME_DAYS   发布最近几天的卫星帧 (默认 3)
+
+用法:
+    python3 shared_state.py publish                   # 发布当前 CSV / 卫星帧 / 模型
+    SHARED_STATE=1 uvicorn api:app --workers 4        # worker 挂载共享状态
+    python3 shared_state.py info                      # 显示已发布的版本和大小
+"""
+
+import os
+import glob
+import json
+import shutil
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import torch
+
+import predict
+from predict import CSV_PATH, MODEL_PATH, load_system
+from weather_fusion_model import WeatherFusionNet, prediction_dim_from_state_dict
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE = os.environ.get("SHARED_STATE", "0") == "1"
+SHARED_STATE_DIR = os.environ.get(
+    "SHARED_STATE_DIR", "/dev/shm/weather-ai" if os.path.isdir("/dev/shm") else "shared_state")
+SHARED_FRAME_DAYS = float(os.environ.get("SHARED_FRAME_DAYS", "3"))
+PROCESSED_DIR = "processed_data"
+MANIFEST = "current.json"
+# 实时 NEA 环形缓冲区（live_ingest.LiveSensorBuffer 的内存映射文件），不随 publish 的版本轮换
+LIVE_DIR = "live"
+
+
+def fingerprint(path):
+    """源文件指纹：mtime + size（文件不存在为 None）"""
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return {"mtime": st.st_mtime, "size": st.st_size}
+
+
+def frame_time(name):
+    """NC_H09_YYYYMMDD_HHMM_*.npy -> datetime (UTC)"""
+    try:
+        return datetime.strptime("_".join(name.split("_")[2:4]), "%Y%m%d_%H%M")
+    except ValueError:
+        return None
+
+
+class FrameStore:
+    """卫星帧查表：文件名 -> (64, 64) 数组（mmap 的一行）"""
+
+    def __init__(self, frames, names):
+        self.frames = frames
+        self.index = {name: i for i, name in enumerate(names)}
+
+    def get(self, name):
+        i = self.index.get(name)
+        return None if i is None else self.frames[i]
+
+    def __len__(self):
+        return len(self.index)
+
+
+# --- publish ---
+
+def _write_sensors(df, out_dir):
+    os.makedirs(out_dir)
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col == "timestamp":
+            tz = series.dt.tz
+            values = series.dt.tz_convert("UTC").dt.tz_localize(None) if tz is not None else series
+            np.save(os.path.join(out_dir, f"{col}.npy"), values.to_numpy("datetime64[ns]").view(np.int64))
+            columns[col] = {"kind": "datetime", "tz": str(tz) if tz is not None else None}
+        elif pd.api.types.is_numeric_dtype(series):
+            np.save(os.path.join(out_dir, f"{col}.npy"), series.to_numpy())
+            columns[col] = {"kind": "numeric"}
+        else:
+            # 字符串列（sensor_id）存为分类编码；编码 dtype 与 pandas 一致，挂载时零拷贝
+            cat = pd.Categorical(series)
+            np.save(os.path.join(out_dir, f"{col}.npy"), cat.codes)
+            columns[col] = {"kind": "category", "categories": [str(c) for c in cat.categories]}
+    return columns
+
+
+def _write_frames(out_path, processed_dir=PROCESSED_DIR, days=SHARED_FRAME_DAYS):
+    files = sorted(glob.glob(os.path.join(processed_dir, "*.npy")))
+    dated = [(f, frame_time(os.path.basename(f))) for f in files]
+    dated = [(f, t) for f, t in dated if t is not None]
+    if not dated:
+        return []
+    newest = max(t for _, t in dated)
+    recent = [f for f, t in dated if t >= newest - timedelta(days=days)]
+
+    names, frames = [], []
+    for path in recent:
+        try:
+            data = np.load(path).astype(np.float32).reshape(64, 64)
+        except Exception as e:
+            # 形状不符或损坏的帧不进共享表，推理时照常从磁盘读取
+            logger.warning(f"Skipping frame {path}: {e}")
+            continue
+        names.append(os.path.basename(path))
+        frames.append(data)
+    if frames:
+        np.save(out_path, np.stack(frames))
+    return names
+
+
+def publish(state_dir=SHARED_STATE_DIR, csv_path=CSV_PATH, model_path=MODEL_PATH,
+            processed_dir=PROCESSED_DIR, frame_days=SHARED_FRAME_DAYS):
+    """加载一次并发布到共享目录，返回 manifest"""
+    version = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    out_dir = os.path.join(state_dir, version)
+    os.makedirs(out_dir)
+
+    # 记录加载前的指纹：加载期间源文件变化时，挂载方会判定为过期
+    sources = {"csv": fingerprint(csv_path), "model": fingerprint(model_path)}
+    df = pd.read_csv(csv_path)
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    columns = _write_sensors(df, os.path.join(out_dir, "sensors"))
+
+    frames = _write_frames(os.path.join(out_dir, "frames.npy"), processed_dir, frame_days)
+
+    has_model = os.path.exists(model_path)
+    if has_model:
+        state_dict = torch.load(model_path, map_location="cpu", weights_only=True)
+        torch.save(state_dict, os.path.join(out_dir, "model.pth"))
+
+    manifest = {
+        "version": version,
+        "created": datetime.now().isoformat(),
+        "sources": sources,
+        "rows": len(df),
+        "columns": columns,
+        "frames": frames,
+        "model": has_model,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    tmp_path = os.path.join(state_dir, f"{MANIFEST}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"version": version}, f)
+    os.replace(tmp_path, os.path.join(state_dir, MANIFEST))
+
+    # 旧版本：已挂载的 worker 持有 mmap，删除目录不影响它们
+    for name in os.listdir(state_dir):
+        path = os.path.join(state_dir, name)
+        if name not in (version, LIVE_DIR) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+    logger.info(f"Published shared state {version}: {len(df)} rows, {len(frames)} frames")
+    return manifest
+
+
+# --- attach ---
+
+def read_manifest(state_dir=SHARED_STATE_DIR):
+    try:
+        with open(os.path.join(state_dir, MANIFEST)) as f:
+            version = json.load(f)["version"]
+        with open(os.path.join(state_dir, version, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _attach_sensors(sensor_dir, columns):
+    data = {}
+    for col, meta in columns.items():
+        values = np.load(os.path.join(sensor_dir, f"{col}.npy"), mmap_mode="r")
+        if meta["kind"] == "datetime":
+            series = pd.Series(values.view("datetime64[ns]"), copy=False)
+            if meta["tz"]:
+                # 带时区的时间戳需要转换（每个 worker 一份拷贝）
+                series = series.dt.tz_localize("UTC").dt.tz_convert(meta["tz"])
+            data[col] = series
+        elif meta["kind"] == "category":
+            data[col] = pd.Categorical.from_codes(values, categories=meta["categories"], validate=False)
+        else:
+            data[col] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def _attach_model(path):
+    if path is None:
+        # 与 load_system 一致：没有权重文件时使用随机初始化的模型
+        return WeatherFusionNet(sat_channels=1, sensor_features=4).eval()
+    state_dict = torch.load(path, map_location="cpu", weights_only=True, mmap=True)
+    model = WeatherFusionNet(sat_channels=1, sensor_features=4,
+                             prediction_dim=prediction_dim_from_state_dict(state_dict))
+    model.load_state_dict(state_dict, assign=True)
+    return model.eval()
+
+
+def attach(state_dir=SHARED_STATE_DIR, csv_path=CSV_PATH, model_path=MODEL_PATH):
+    """
+    挂载已发布的共享状态，返回 (model, df)；同时安装卫星帧表 predict.FRAME_STORE。
+    未发布、已过期或挂载失败时返回 None。
+    """
+    manifest = read_manifest(state_dir)
+    if manifest is None:
+        logger.info(f"No shared state in {state_dir}")
+        return None
+    current = {"csv": fingerprint(csv_path), "model": fingerprint(model_path)}
+    if manifest["sources"] != current:
+        logger.warning(f"Shared state {manifest['version']} is stale (source files changed); not attaching")
+        return None
+
+    version_dir = os.path.join(state_dir, manifest["version"])
+    try:
+        df = _attach_sensors(os.path.join(version_dir, "sensors"), manifest["columns"])
+        model = _attach_model(os.path.join(version_dir, "model.pth") if manifest["model"] else None)
+        if manifest["frames"]:
+            frames = np.load(os.path.join(version_dir, "frames.npy"), mmap_mode="r")
+            predict.FRAME_STORE = FrameStore(frames, manifest["frames"])
+    except Exception as e:
+        logger.warning(f"Failed to attach shared state {manifest['version']}: {e}")
+        return None
+
+    logger.info(f"Attached shared state {manifest['version']}: "
+                f"{manifest['rows']} rows, {len(manifest['frames'])} frames")
+    return model, df
+
+
+def live_buffer_dir(state_dir=SHARED_STATE_DIR):
+    """多 worker 共用的实时传感器缓冲区目录"""
+    return os.path.join(state_dir, LIVE_DIR)
+
+
+def load_shared_or_local():
+    """SHARED_STATE=1 时优先挂载共享状态，否则（或挂载失败）调用 load_system()"""
+    if SHARED_STATE:
+        attached = attach()
+        if attached is not None:
+            return attached
+    return load_system()
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="发布 / 查看多 worker 共享状态")
+    parser.add_argument("action", choices=["publish", "info"])
+    parser.add_argument("--dir", default=SHARED_STATE_DIR, help="共享状态目录")
+    parser.add_argument("--frame-days", type=float, default=SHARED_FRAME_DAYS, help="发布最近几天的卫星帧")
+    args = parser.parse_args()
+
+    if args.action == "publish":
+        manifest = publish(args.dir, frame_days=args.frame_days)
+        size = directory_size(os.path.join(args.dir, manifest["version"]))
+        print(f"✅ 已发布 {manifest['version']}: {manifest['rows']} 行传感器数据, "
+              f"{len(manifest['frames'])} 帧卫星图, {size / 1e6:.1f} MB -> {args.dir}")
+        return
+
+    manifest = read_manifest(args.dir)
+    if manifest is None:
+        print(f"❌ {args.dir} 中没有已发布的共享状态")
+        return
+    fresh = manifest["sources"] == {"csv": fingerprint(CSV_PATH), "model": fingerprint(MODEL_PATH)}
+    size = directory_size(os.path.join(args.dir, manifest["version"]))
+    print(f"📦 版本: {manifest['version']} (发布于 {manifest['created']})")
+    print(f"   传感器: {manifest['rows']} 行, 列 {list(manifest['columns'])}")
+    print(f"   卫星帧: {len(manifest['frames'])}")
+    print(f"   模型:   {'有' if manifest['model'] else '无（随机初始化）'}")
+    print(f"   大小:   {size / 1e6:.1f} MB")
+    print(f"   状态:   {'✅ 最新' if fresh else '⚠️ 源文件已变化，需要重新发布'}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    main()
@@ -0,0 +1,164 @@
+"""
+singleflight.py
+上游调用合并（single-flight）与可选的结果缓存
+
+很多用户同时查询同一地点/路径时，每个请求都会独立调用 Nominatim / Overpass，
+上游负载和延迟随并发数放大。这里让同一键的并发调用只执行一次，其余调用等待同一结果。
+
+- SingleFlight: 按键合并并发调用（结果和异常都传递给所有等待者）
+- TTLCache:     可选的内存结果缓存（LRU + 过期时间），与 SingleFlight 组合使用
+- coalesce:     装饰器，组合上面两者并记录指标
+
+用法:
+    @coalesce("geocode", key=lambda address: address.strip().lower(), ttl=86400)
+    def geocode_location(address): ...
+
+指标:
+    weather_api_coalesced_requests_total{name}  等待他人结果而未执行的调用数
+    weather_api_cache_requests_total{cache}     结果缓存命中/未命中（设置 ttl 时）
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Counter, record_cache
+
+COALESCED = Counter(
+    "weather_api_coalesced_requests_total",
+    "Calls that waited on an identical in-flight call instead of running it.",
+    ("name",))
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同一键的并发调用只执行一次"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        执行 fn()，若同一键已有调用在进行中则等待其结果。
+        Returns: (result, shared)  shared=True 表示结果来自其他调用
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED.inc(name=self.name)
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class TTLCache:
+    """线程安全的 LRU + TTL 结果缓存"""
+
+    _MISSING = object()
+
+    def __init__(self, name, ttl, max_entries=4096):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def coalesce(name, key=None, ttl=0, max_entries=4096, cache_if=None):
+    """
+    装饰器：合并并发的相同调用，可选缓存结果
+
+    Args:
+        name:        指标名称
+        key:         由调用参数生成键的函数，默认使用位置参数元组
+        ttl:         结果缓存秒数，0 表示只合并不缓存
+        max_entries: 缓存最大条目数
+        cache_if:    判断结果是否可缓存的函数（例如失败返回 None 时不缓存）
+    """
+    def decorator(fn):
+        flight = SingleFlight(name)
+        cache = TTLCache(name, ttl, max_entries) if ttl > 0 else None
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            if cache is not None:
+                cached = cache.get(k, TTLCache._MISSING)
+                if cached is not TTLCache._MISSING:
+                    record_cache(name, hit=True)
+                    return cached
+                record_cache(name, hit=False)
+
+            def call():
+                if cache is not None:
+                    # 上一个执行者可能刚刚写入
+                    cached = cache.get(k, TTLCache._MISSING)
+                    if cached is not TTLCache._MISSING:
+                        return cached
+                result = fn(*args, **kwargs)
+                if cache is not None and (cache_if is None or cache_if(result)):
+                    cache.put(k, result)
+                return result
+
+            result, _ = flight.do(k, call)
+            return result
+
+        wrapper.flight = flight
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,109 @@
+"""
+storage.py
+共享 S3 存储层
+
+所有模块通过这里获取 S3 客户端，而不是每次调用都 boto3.client('s3')：
+- 客户端按 (endpoint_url, unsigned) 惰性创建并缓存，复用凭证解析结果和连接池
+- 连接池大小、重试策略、超时可通过环境变量调整
+- 大文件上传/下载使用 TransferConfig（分片 + 并发）
+
+环境变量:
+    S3_ENDPOINT_URL          自定义端点（MinIO / moto server 等）
+    S3_MAX_POOL_CONNECTIONS  连接池大小 (默认 32)
+    S3_MAX_ATTEMPTS          最大重试次数 (默认 5, adaptive 模式)
+    S3_MULTIPART_THRESHOLD_MB / S3_MULTIPART_CHUNKSIZE_MB / S3_MAX_CONCURRENCY
+"""
+
+import os
+import json
+import threading
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore import UNSIGNED
+from botocore.config import Config
+
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "32"))
+S3_MAX_ATTEMPTS = int(os.environ.get("S3_MAX_ATTEMPTS", "5"))
+
+MB = 1024 * 1024
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=int(os.environ.get("S3_MULTIPART_THRESHOLD_MB", "16")) * MB,
+    multipart_chunksize=int(os.environ.get("S3_MULTIPART_CHUNKSIZE_MB", "16")) * MB,
+    max_concurrency=int(os.environ.get("S3_MAX_CONCURRENCY", "8")),
+    use_threads=True,
+)
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+
+
+def _client_config(unsigned=False):
+    return Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "adaptive"},
+        connect_timeout=5,
+        read_timeout=60,
+        tcp_keepalive=True,
+        signature_version=UNSIGNED if unsigned else None,
+    )
+
+
+def get_s3_client(endpoint_url=None, unsigned=False):
+    """
+    获取共享 S3 客户端（线程安全，可跨请求/线程复用）
+
+    Args:
+        endpoint_url: 自定义端点，默认读取 S3_ENDPOINT_URL
+        unsigned: 匿名访问公共 bucket（如 NOAA Himawari）
+    """
+    if endpoint_url is None:
+        endpoint_url = os.environ.get("S3_ENDPOINT_URL") or None
+    key = (endpoint_url, unsigned)
+
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                global _session
+                if _session is None:
+                    _session = boto3.session.Session()
+                client = _session.client("s3", endpoint_url=endpoint_url, config=_client_config(unsigned))
+                _clients[key] = client
+    return client
+
+
+def reset_clients():
+    """丢弃缓存的客户端（凭证轮换或测试时使用）"""
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
+
+
+def read_json(bucket, key, endpoint_url=None):
+    """读取 S3 JSON 对象"""
+    obj = get_s3_client(endpoint_url).get_object(Bucket=bucket, Key=key)
+    return json.loads(obj['Body'].read().decode('utf-8'))
+
+
+def put_json(bucket, key, data, endpoint_url=None):
+    """写入 S3 JSON 对象"""
+    get_s3_client(endpoint_url).put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(data, indent=2, ensure_ascii=False),
+        ContentType="application/json"
+    )
+
+
+def upload_file(local_path, bucket, key, endpoint_url=None):
+    """上传文件（大文件自动分片并发上传）"""
+    get_s3_client(endpoint_url).upload_file(local_path, bucket, key, Config=TRANSFER_CONFIG)
+
+
+def download_file(bucket, key, local_path, endpoint_url=None, unsigned=False):
+    """下载文件（大文件自动分片并发下载）"""
+    get_s3_client(endpoint_url, unsigned=unsigned).download_file(bucket, key, local_path, Config=TRANSFER_CONFIG)
@@ -34,9 +34,58 @@ def test_predict_coordinates(client):
     assert "location_query" in data
     assert "1.35,103.8" in data["location_query"]
     assert "forecast" in data
+    # Forecast curve: first horizon is the 10-minute value
+    horizons = data["forecast"]["horizons"]
+    assert horizons[0]["minutes"] == 10
+    assert horizons[0]["rainfall_mm"] == data["forecast"]["rainfall_mm_next_10min"]
 
 def test_invalid_params(client):
     """Test validation error when no params provided."""
     response = client.get("/predict")
     # Our API returns 400 if params are missing
     assert response.status_code == 400
+
+def test_metrics_endpoint(client):
+    """Test Prometheus metrics export."""
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'weather_api_requests_total{route="/health",method="GET",status="200"}' in response.text
+    assert "weather_api_requests_in_flight" in response.text
+
+    # /health and /api/health are one series
+    series = 'weather_api_requests_total{route="/health",method="GET",status="200"} '
+    count = lambda text: float(text.split(series)[1].split()[0])
+    before = count(response.text)
+    client.get("/api/health")
+    text = client.get("/metrics").text
+    assert count(text) == before + 1
+    assert 'route="/api/health"' not in text
+
+def test_predict_batch(client):
+    """Test batch prediction for coordinates and names in one call."""
+    response = client.post("/predict/batch", json={"points": [
+        {"lat": 1.35, "lon": 103.8},
+        {"location": "Marina Bay Sands"},
+    ]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count"] == 2
+    assert data["results"][0]["location_query"] == "1.35,103.8"
+    assert "forecast" in data["results"][0]
+
+def test_idw_batch_matches_scalar():
+    """Vectorized IDW agrees with calculate_idw, including exact-match and missing stations."""
+    import numpy as np
+    from api import calculate_idw, calculate_idw_batch
+
+    values = np.array([[1.0, 2.0, 3.0], [5.0, 7.0, 0.0], [4.0, 9.0, 9.0], [0.0, 0.0, 0.0]])
+    dists = np.array([[1.0, 2.0, 4.0], [0.05, 1.0, 2.0], [2.0, 3.0, 5.0], [1.0, 2.0, 3.0]])
+    valid = np.array([[True, True, True], [True, True, False], [True, False, False], [False] * 3])
+    result = calculate_idw_batch(values, dists, valid)
+
+    for row in range(3):
+        m = valid[row]
+        assert result[row] == pytest.approx(calculate_idw(list(values[row][m]), list(dists[row][m])))
+    assert np.isnan(result[3])
@@ -1,5 +1,5 @@
 
-import boto3
+from storage import get_s3_client
 import json
 import os
 import datetime
@@ -18,7 +18,7 @@ status = {
 }
 
 print("Uploading simulated status...")
-s3 = boto3.client('s3', endpoint_url=S3_ENDPOINT_URL)
+s3 = get_s3_client(S3_ENDPOINT_URL)
 s3.put_object(
     Bucket=S3_BUCKET, 
     Key="state/training_state.json", 
@@ -0,0 +1,30 @@
+import pandas as pd
+import torch
+
+import evaluate
+from test_weather_dataset import write_tz_aware_data
+from weather_dataset import WeatherDataset, time_split
+from weather_fusion_model import WeatherFusionNet
+
+
+def test_local_hour_ignores_csv_offset():
+    """per_hour buckets are Singapore hours whether the CSV stores +08:00, UTC or naive local times."""
+    local = pd.Timestamp("2026-10-19 14:30", tz="Asia/Singapore")
+    assert evaluate.local_hour(local) == 14
+    assert evaluate.local_hour(local.tz_convert("UTC")) == 14
+    assert evaluate.local_hour(local.tz_localize(None)) == 14
+
+
+def test_evaluates_tz_aware_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_tz_aware_data()
+    time_split(WeatherDataset("sensors.csv", "satellite_data", num_horizons=3), split_file="split.json")
+    torch.save(WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=3).state_dict(), "model.pth")
+    monkeypatch.setattr(evaluate, "MODEL_PATH", "model.pth")
+    monkeypatch.setattr(evaluate, "CSV_PATH", "sensors.csv")
+    monkeypatch.setattr(evaluate, "SPLIT_FILE", "split.json")
+
+    results = evaluate.evaluate_model()
+    assert results["num_samples"] > 0 and len(results["horizons"]) == 3
+    # Validation is the tail of local 2026-10-19 (15:50 UTC is hour 23 in Singapore)
+    assert max(map(int, results["per_hour"])) == 23
@@ -0,0 +1,51 @@
+import numpy as np
+
+from govdata_parser import ReadingColumns
+
+T1 = "2026-10-19T09:00:00+08:00"
+T2 = "2026-10-19T09:01:00+08:00"
+
+RAINFALL = {"items": [
+    {"timestamp": T2, "readings": [{"station_id": "S2", "value": 0.4}, {"station_id": "S1", "value": None}]},
+    {"timestamp": T1, "readings": [{"station_id": "S1", "value": 0}, {"station_id": "S1", "value": 1.0}]},
+]}
+PM25 = {"items": [
+    {"timestamp": T1, "readings": {"pm25_one_hourly": {"west": 12, "east": None}}},
+    {"timestamp": T1, "readings": {"pm25_one_hourly": {"west": 18}}},
+]}
+
+
+def test_list_and_dict_readings_in_one_wide_frame():
+    """Rows sorted by (timestamp, sensor_id); PM2.5 regions broadcast to their stations; None stays NaN."""
+    cols = ReadingColumns()
+    assert cols.add(RAINFALL, "rainfall") == 4
+    assert cols.add(PM25, "pm25", {"S1": "west", "S2": "east"}) == 3
+    df = cols.to_frame()
+
+    assert list(df.columns) == ["timestamp", "sensor_id", "pm25", "rainfall"]
+    assert [(str(t), s) for t, s in zip(df["timestamp"], df["sensor_id"])] == [
+        ("2026-10-19 09:00:00+08:00", "S1"), ("2026-10-19 09:00:00+08:00", "S2"),
+        ("2026-10-19 09:01:00+08:00", "S1"), ("2026-10-19 09:01:00+08:00", "S2")]
+    assert np.isnan(df["pm25"][1])        # east was None
+    assert np.isnan(df["rainfall"][2])    # S1 at T2 was None
+    assert df["rainfall"][3] == 0.4
+    assert df.fillna(0.0)["rainfall"][2] == 0.0
+
+
+def test_duplicate_readings_first_or_mean():
+    """Duplicate (timestamp, sensor, type) readings: first valid reading, or the mean as pivot_table did."""
+    cols = ReadingColumns()
+    cols.add(RAINFALL, "rainfall")
+    cols.add(PM25, "pm25", {"S1": "west"})
+
+    first = cols.to_frame()
+    assert first["rainfall"][0] == 0.0 and first["pm25"][0] == 12
+
+    mean = cols.to_frame(duplicates="mean")
+    assert mean["rainfall"][0] == 0.5 and mean["pm25"][0] == 15
+
+    # A None duplicate never masks a real value
+    cols = ReadingColumns()
+    cols.add({"items": [{"timestamp": T1, "readings": [
+        {"station_id": "S1", "value": None}, {"station_id": "S1", "value": 2.0}]}]}, "rainfall")
+    assert cols.to_frame()["rainfall"][0] == 2.0
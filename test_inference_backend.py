@@ -0,0 +1,96 @@
+import os
+import time
+
+import torch
+
+import inference_backend as ib
+from weather_fusion_model import WeatherFusionNet
+
+
+def make_model(tmp_path, horizons=3):
+    model = WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=horizons).eval()
+    model_path = str(tmp_path / "weather_fusion_model.pth")
+    torch.save(model.state_dict(), model_path)
+    return model, model_path
+
+
+def test_torchscript_export_matches_eager_with_dynamic_batch(tmp_path):
+    """The traced artifact loads as the backend and agrees with eager for any batch size."""
+    model, model_path = make_model(tmp_path)
+    ts_path = ib.export_torchscript(model, str(tmp_path / "model.ts"))
+
+    backend = ib.load_backend(model, "auto", model_path, ts_path, str(tmp_path / "missing.onnx"))
+    assert backend.name == "torchscript"
+    for batch in (1, 5):
+        sat, sensor = torch.randn(batch, 1, 64, 64), torch.randn(batch, 6, 4)
+        with torch.no_grad():
+            expected = model(sat, sensor)
+        assert torch.allclose(backend(sat, sensor), expected, atol=1e-5)
+
+
+def test_falls_back_to_eager_when_artifact_missing_or_stale(tmp_path):
+    """Missing or out-of-date artifacts never shadow the current weights."""
+    model, model_path = make_model(tmp_path)
+    ts_path = str(tmp_path / "model.ts")
+    assert ib.load_backend(model, "torchscript", model_path, ts_path).name == "eager"
+
+    ib.export_torchscript(model, ts_path)
+    stale = time.time() - 60
+    os.utime(ts_path, (stale, stale))
+    assert ib.load_backend(model, "auto", model_path, ts_path).name == "eager"
+    assert ib.load_backend(model, "eager", model_path, ts_path).name == "eager"
+
+
+def test_quantized_model_passes_accuracy_check(tmp_path):
+    """int8 variant (static conv + dynamic LSTM/Linear) stays close to the float model and is selectable."""
+    model, model_path = make_model(tmp_path)
+    frames = torch.rand(16, 1, 64, 64) * 0.6 + 0.2
+    quantized = ib.quantize_model(model, frames)
+
+    loader = [(torch.rand(4, 1, 64, 64) * 0.6 + 0.2, torch.randn(4, 6, 4), torch.rand(4, 3)) for _ in range(3)]
+    report = ib.accuracy_check(model, quantized, loader, max_increase=0.05)
+    assert report["passed"]
+    assert report["max_abs_diff"] < 0.05
+
+    q_path = str(tmp_path / "model.int8.ts")
+    assert ib.load_backend(model, "quantized", model_path, quantized_path=q_path).name == "eager"
+    ib.export_torchscript(quantized, q_path)
+    assert ib.load_backend(model, "quantized", model_path, quantized_path=q_path).name == "quantized"
+
+
+def test_refresh_exports_rebuilds_stale_artifacts_for_the_selected_backend(tmp_path, monkeypatch):
+    """A newer checkpoint (e.g. pulled from S3) gets fresh artifacts instead of silently serving eager."""
+    model, model_path = make_model(tmp_path)
+    ts_path, q_path = str(tmp_path / "model.ts"), str(tmp_path / "model.int8.ts")
+    ib.export_torchscript(model, ts_path)
+    stale = time.time() - 60
+    os.utime(ts_path, (stale, stale))
+
+    exported = ib.refresh_exports(model, "torchscript", model_path, torchscript_path=ts_path)
+    assert exported == {"torchscript": ts_path}
+    assert ib.load_backend(model, "torchscript", model_path, ts_path).name == "torchscript"
+    assert ib.refresh_exports(model, "torchscript", model_path, torchscript_path=ts_path) == {}
+    assert ib.refresh_exports(model, "eager", model_path) == {}
+
+    loader = [(torch.rand(4, 1, 64, 64) * 0.6 + 0.2, torch.randn(4, 6, 4), torch.rand(4, 3)) for _ in range(3)]
+    monkeypatch.chdir(tmp_path)  # quantization report
+    exported = ib.refresh_exports(model, "quantized", model_path, quantized_path=q_path, loader=loader)
+    assert exported == {"quantized": q_path}
+    assert ib.load_backend(model, "quantized", model_path, quantized_path=q_path).name == "quantized"
+
+
+def test_quantize_gate_runs_on_tz_aware_validation_data(tmp_path, monkeypatch):
+    """The int8 gate reads the real validation split; +08:00 CSV timestamps must not break it."""
+    from test_weather_dataset import write_tz_aware_data
+    from weather_dataset import WeatherDataset, time_split, SPLIT_FILE
+
+    monkeypatch.chdir(tmp_path)
+    write_tz_aware_data()
+    time_split(WeatherDataset("sensors.csv", "satellite_data", num_horizons=3), split_file=SPLIT_FILE)
+    model, model_path = make_model(tmp_path)
+
+    loader = ib.validation_loader(model, "sensors.csv", "satellite_data")
+    report = ib.quantize_and_gate(model, loader, ib.calibration_frames(), path=str(tmp_path / "model.int8.ts"),
+                                  report_path=str(tmp_path / "report.json"), model_path=model_path)
+    assert report["num_predictions"] == len(loader.dataset) * 3
+    assert report["static_conv"]
@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+import torch
+
+from inference_queue import MicroBatcher, maybe_batched
+
+
+class RecordingBackend:
+    """Row-wise backend that records the batch sizes it was called with."""
+
+    name = "recording"
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, sat, sensor):
+        self.calls.append(sat.shape[0])
+        return sat.flatten(1).sum(1, keepdim=True) + sensor.flatten(1).sum(1, keepdim=True)
+
+
+def test_concurrent_submissions_share_one_forward():
+    """Inputs arriving within the window run as one batch and each caller gets its own rows."""
+    backend = RecordingBackend()
+    batcher = MicroBatcher(backend, window_ms=200, max_batch=64)
+    inputs = [(torch.randn(rows, 1, 4, 4), torch.randn(rows, 6, 4)) for rows in (1, 2, 1, 3)]
+    results = [None] * len(inputs)
+
+    def call(i):
+        results[i] = batcher(*inputs[i])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(inputs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert backend.calls == [7]
+    for (sat, sensor), result in zip(inputs, results):
+        assert torch.allclose(result, RecordingBackend()(sat, sensor))
+
+
+def test_max_batch_and_errors():
+    """A full batch runs without waiting out the window; backend errors reach every caller."""
+    backend = RecordingBackend()
+    batcher = MicroBatcher(backend, window_ms=5000, max_batch=2)
+    futures = [batcher.submit(torch.randn(1, 1, 4, 4), torch.randn(1, 6, 4)) for _ in range(2)]
+    assert all(f.result(timeout=2).shape == (1, 1) for f in futures)
+
+    def fail(sat, sensor):
+        raise RuntimeError("boom")
+
+    batcher.backend = fail
+    future = batcher.submit(torch.randn(1, 1, 4, 4), torch.randn(1, 6, 4))
+    batcher.close()
+    with pytest.raises(RuntimeError, match="boom"):
+        future.result()
+
+    assert maybe_batched(backend, window_ms=0) is backend
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import torch
+
+from live_ingest import LiveIngestor, LiveSensorBuffer
+from predict import get_input_data
+
+END = pd.Timestamp("2026-10-19 14:30", tz="Asia/Singapore")
+
+
+def nea_frame(start, minutes, sensors=("S1", "S2"), seed=0):
+    """Wide frame shaped like the real-time feeds: 1-min temperature/humidity, 5-min rainfall, hourly PM2.5."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for m in range(minutes):
+        ts = start + pd.Timedelta(minutes=m)
+        for sid in sensors:
+            rows.append({
+                "timestamp": ts, "sensor_id": sid,
+                "humidity": 70 + rng.random() * 20,
+                "pm25": 15 + rng.random() * 10 if m % 60 == 0 else np.nan,
+                "rainfall": rng.random() if m % 5 == 0 else np.nan,
+                "temperature": 26 + rng.random() * 4,
+            })
+    return pd.DataFrame(rows)
+
+
+def test_inputs_match_csv_pipeline():
+    """Ring-buffer inputs equal get_input_data on the same readings after the CSV ffill().fillna(0)."""
+    frame = nea_frame(END - pd.Timedelta(minutes=120), 121)
+    buffer = LiveSensorBuffer(window_minutes=180, max_sensors=8)
+    assert buffer.push(frame) == len(frame)
+
+    csv_df = frame.sort_values(["sensor_id", "timestamp"]).ffill().fillna(0.0)
+    live = buffer.station_inputs(["S1", "S2", "unknown"], END)
+    assert set(live) == {"S1", "S2"}
+    for sid, (sat, sensor) in live.items():
+        expected_sat, expected_sensor = get_input_data(csv_df, sid, END)
+        assert torch.allclose(sensor, expected_sensor, atol=1e-6)
+        assert sat.shape == expected_sat.shape
+
+    readings = buffer.latest_readings(["S1"], END)
+    last = csv_df[csv_df["sensor_id"] == "S1"].iloc[-1]
+    assert readings["S1"] == (last["temperature"], last["humidity"], last["pm25"])
+
+
+def test_buffer_wraps_without_growing():
+    """Old minutes are overwritten in place; memory is fixed and stale slots are never read."""
+    buffer = LiveSensorBuffer(window_minutes=90, max_sensors=2)
+    nbytes = buffer.values.nbytes
+    buffer.push(nea_frame(END - pd.Timedelta(minutes=300), 200, seed=1))
+    buffer.push(nea_frame(END - pd.Timedelta(minutes=100), 101, seed=2))
+    assert buffer.values.nbytes == nbytes
+    assert buffer.is_fresh(END) and not buffer.is_fresh(END + pd.Timedelta(hours=1))
+
+    # A third sensor does not fit and is dropped
+    assert buffer.push(nea_frame(END, 1, sensors=("S3",))) == 0
+    assert set(buffer.station_inputs(["S1", "S2", "S3"], END)) == {"S1", "S2"}
+    # Only 90 minutes exist: 70 minutes back from an hour later is outside the window
+    assert buffer.station_inputs(["S1"], END + pd.Timedelta(hours=1)) == {}
+
+
+def test_ingestor_backfills_then_polls():
+    days, polls = [], []
+    buffer = LiveSensorBuffer(window_minutes=120, max_sensors=4)
+
+    def fetch_day(day):
+        days.append(day)
+        return nea_frame(END - pd.Timedelta(minutes=100), 100)
+
+    def fetch_latest():
+        polls.append(1)
+        return nea_frame(END, 1)
+
+    ingestor = LiveIngestor(buffer, interval=60, fetch_latest=fetch_latest, fetch_day=fetch_day)
+    assert ingestor.poll() > 0
+    assert days and len(polls) == 1
+    assert ingestor.poll() == 2  # recent success: no second backfill
+    assert len(days) <= 2 and set(buffer.station_inputs(["S1", "S2"], END)) == {"S1", "S2"}
+
+    ingestor.fetch_latest = lambda: (_ for _ in ()).throw(ConnectionError("offline"))
+    assert ingestor.poll() == 0
+
+
+def test_station_inputs_use_newest_frame_before_current_slot_is_published(monkeypatch, tmp_path):
+    """At 14:30 local the 06:30 UTC slot isn't out yet; the 06:20 live frame is used instead of zeros."""
+    import predict
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(predict, "RECENT_FRAMES", predict.OrderedDict())
+    predict.publish_frame("20261019_0620", np.full((64, 64), 250.0, np.float32))
+
+    buffer = LiveSensorBuffer(window_minutes=180, max_sensors=8)
+    buffer.push(nea_frame(END - pd.Timedelta(minutes=120), 121))
+    inputs = buffer.station_inputs(["S1", "S2"], END)
+    assert set(inputs) == {"S1", "S2"}
+    for sat, _ in inputs.values():
+        assert torch.allclose(sat, torch.full((1, 1, 64, 64), 0.5))
+
+
+def test_workers_share_one_buffer_and_one_poller(tmp_path):
+    """With a shared path one worker polls and writes; another worker's buffer reads the same data."""
+    path = str(tmp_path / "live")
+    buffers = [LiveSensorBuffer(window_minutes=180, max_sensors=8, path=path) for _ in range(2)]
+    polls = []
+
+    def fetch_latest():
+        polls.append(1)
+        return nea_frame(END, 1, sensors=("S1", "S2", "S3"))
+
+    ingestors = [LiveIngestor(b, fetch_latest=fetch_latest,
+                              fetch_day=lambda day: nea_frame(END - pd.Timedelta(minutes=120), 120))
+                 for b in buffers]
+    assert ingestors[0].is_ingester() and not ingestors[1].is_ingester()
+    assert ingestors[0].poll() > 0 and len(polls) == 1
+
+    writer, reader = buffers
+    assert reader.newest == writer.newest and set(reader.sensors) == {"S1", "S2", "S3"}
+    for sid, (_, sensor) in writer.station_inputs(["S1", "S2"], END).items():
+        assert torch.equal(reader.station_inputs([sid], END)[sid][1], sensor)
+    assert reader.latest_readings(["S3"], END) == writer.latest_readings(["S3"], END)
+
+    # The polling worker exits: the other one takes over on its next attempt
+    ingestors[0]._ingest_lock.close()
+    assert ingestors[1].is_ingester()
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+
+import pytest
+import torch
+
+import storage
+from inference_queue import MicroBatcher
+from model_watcher import ModelWatcher
+
+
+class Serving:
+    """Stand-in for the api module's serving reference."""
+
+    def __init__(self, model):
+        self.model = model
+        self.swaps = []
+
+    def swap(self, new_model, old_model):
+        self.swaps.append(old_model)
+        self.model = new_model
+
+
+def write_model(path, version):
+    with open(path, "w") as f:
+        f.write(str(version))
+    stale = time.time() - 10  # past the settle window
+    os.utime(path, (stale - version, stale - version))
+
+
+def test_new_checkpoint_is_loaded_warmed_and_swapped(tmp_path):
+    """A changed file is loaded and warmed before the swap; unchanged files and failures keep the model."""
+    path = str(tmp_path / "weather_fusion_model.pth")
+    write_model(path, 1)
+    warmed = []
+
+    def load():
+        with open(path) as f:
+            return f"model-{f.read()}"
+
+    serving = Serving("model-1")
+    watcher = ModelWatcher([path, str(tmp_path / "missing.ts")], load, serving.swap,
+                           warmup=warmed.append, interval=0).start(serving.model)
+    assert watcher.check() is False
+
+    write_model(path, 2)
+    assert watcher.check() is True
+    assert serving.model == "model-2" and warmed == ["model-2"] and serving.swaps == ["model-1"]
+    assert watcher.check() is False
+
+    def broken():
+        raise RuntimeError("truncated checkpoint")
+
+    watcher.load = broken
+    write_model(path, 3)
+    assert watcher.check() is False
+    assert serving.model == "model-2"
+
+
+def test_file_still_being_written_waits_for_next_check(tmp_path):
+    path = str(tmp_path / "weather_fusion_model.pth")
+    write_model(path, 1)
+    serving = Serving("model-1")
+    watcher = ModelWatcher([path], lambda: "model-2", serving.swap, interval=0).start(serving.model)
+    with open(path, "w") as f:
+        f.write("partial")
+    assert watcher.check() is False
+    watcher.settle_seconds = 0
+    assert watcher.check() is True
+
+
+def test_requests_holding_a_closed_batcher_still_complete():
+    """After a swap closes the old MicroBatcher, callers that captured it are served inline."""
+    backend = lambda sat, sensor: sat.sum(dim=(1, 2, 3)).unsqueeze(1)
+    old = MicroBatcher(backend, window_ms=1)
+    old.close()
+    result = [None]
+    thread = threading.Thread(target=lambda: result.__setitem__(0, old(torch.ones(2, 1, 2, 2), torch.zeros(2, 6, 4))))
+    thread.start()
+    thread.join(timeout=2)
+    assert not thread.is_alive()
+    assert result[0].tolist() == [[4.0], [4.0]]
+
+
+def test_pulls_new_checkpoint_from_s3_by_etag(tmp_path, monkeypatch):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        storage.reset_clients()
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="models")
+        client.put_object(Bucket="models", Key="models/latest.pth", Body=b"v2")
+
+        path = str(tmp_path / "weather_fusion_model.pth")
+        write_model(path, 1)
+        serving = Serving("model-1")
+        watcher = ModelWatcher([path], lambda: open(path).read(), serving.swap, interval=0,
+                               settle_seconds=0, s3_bucket="models", s3_key="models/latest.pth")
+        watcher.start(serving.model)
+
+        assert watcher.check() is True and serving.model == "v2"
+        assert watcher.pull_s3() is False  # same ETag: no download
+        storage.reset_clients()
+
+
+def test_only_one_worker_pulls_from_s3_and_exports_do_not_retrigger(tmp_path, monkeypatch):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        storage.reset_clients()
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="models")
+        client.put_object(Bucket="models", Key="models/latest.pth", Body=b"v2")
+
+        path = str(tmp_path / "weather_fusion_model.pth")
+        artifact = str(tmp_path / "weather_fusion_model.ts")
+        write_model(path, 1)
+
+        def load():
+            with open(artifact, "w") as f:  # stands in for refresh_exports
+                f.write("exported")
+            return open(path).read()
+
+        workers = [ModelWatcher([path, artifact], load, Serving("model-1").swap, interval=0, settle_seconds=0,
+                                s3_bucket="models", s3_key="models/latest.pth") for _ in range(2)]
+        assert workers[0].pull_s3() is True
+        assert workers[1].pull_s3() is False  # not the leader: sees the new file locally instead
+        for watcher in workers:
+            watcher.start("model-1")
+            assert watcher.check() is True and watcher.current == "v2"
+            assert watcher.check() is False  # its own export doesn't count as a new model
+
+        # A worker taking over after the leader exits doesn't download the same object again
+        workers[0]._leader_lock.close()
+        successor = ModelWatcher([path], load, Serving("v2").swap, interval=0,
+                                 s3_bucket="models", s3_key="models/latest.pth")
+        assert successor.pull_s3() is False and successor._leader_lock is not None
+        storage.reset_clients()
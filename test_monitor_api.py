@@ -0,0 +1,48 @@
+import threading
+import time
+
+import monitor_api
+from monitor_api import DownloadStatus, MonitorSnapshotCache
+
+
+def fake_build(monkeypatch, fail=False, delay=0.0):
+    calls = []
+
+    def build(s3):
+        calls.append(threading.get_ident())
+        time.sleep(delay)
+        if fail:
+            raise ConnectionError("S3 unavailable")
+        return DownloadStatus(completedDays=len(calls))
+
+    monkeypatch.setattr(monitor_api, "get_s3_client", lambda: None)
+    monkeypatch.setattr(monitor_api, "build_download_snapshot", build)
+    return calls
+
+
+def test_concurrent_cold_requests_share_one_build(monkeypatch):
+    calls = fake_build(monkeypatch, delay=0.2)
+    cache = MonitorSnapshotCache(interval=3600)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.download_status())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert [r.completedDays for r in results] == [1] * 8
+
+
+def test_failed_build_backs_off(monkeypatch):
+    calls = fake_build(monkeypatch, fail=True)
+    cache = MonitorSnapshotCache(interval=3600, retry_seconds=0.2)
+    for _ in range(5):
+        assert cache.download_status() is None
+    assert len(calls) == 1
+
+    time.sleep(0.25)
+    cache.download_status()
+    assert len(calls) == 2
+    # Second failure doubles the wait
+    assert cache._retry_at - time.monotonic() > 0.3
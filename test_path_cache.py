@@ -0,0 +1,64 @@
+import time
+
+from path_cache import PathCache, load_path_samples
+
+GEOMETRY = {"elements": [{"type": "way", "geometry": [{"lat": 1.30, "lon": 103.80}, {"lat": 1.31, "lon": 103.81}]}]}
+
+
+def counting(value):
+    calls = []
+
+    def fn(*args, **kwargs):
+        calls.append(args)
+        return value
+    return fn, calls
+
+
+def age(cache, query, days):
+    """Pretend the entry was fetched `days` ago."""
+    entry = dict(cache._memory[query])
+    entry["fetched_at"] = time.time() - days * 86400
+    cache._save(query, entry)
+
+
+def test_hit_skips_fetch_and_sampling(tmp_path):
+    cache = PathCache(str(tmp_path), ttl_days=90, offline=False)
+    fetch, fetched = counting(GEOMETRY)
+    sample, sampled = counting([(1.30, 103.80), (1.31, 103.81)])
+
+    geometry, samples = load_path_samples("Rail  Corridor", 2.0, fetch, sample, cache=cache)
+    assert geometry == GEOMETRY and samples == [[1.30, 103.80], [1.31, 103.81]]
+
+    # New process, same directory, different spelling of the query
+    cache = PathCache(str(tmp_path), ttl_days=90, offline=False)
+    assert load_path_samples("rail corridor", 2.0, fetch, sample, cache=cache) == (GEOMETRY, samples)
+    assert len(fetched) == len(sampled) == 1
+
+    # Another spacing resamples the cached geometry without refetching
+    load_path_samples("rail corridor", 1.0, fetch, sample, cache=cache)
+    assert len(fetched) == 1 and len(sampled) == 2
+
+
+def test_overpass_entries_expire_but_extract_and_offline_do_not(tmp_path):
+    cache = PathCache(str(tmp_path), ttl_days=90, offline=False)
+    cache.put_geometry("rail corridor", GEOMETRY, source="overpass")
+    cache.put_geometry("park connector", GEOMETRY, source="extract")
+    age(cache, "rail corridor", 91)
+    age(cache, "park connector", 400)
+
+    assert cache.get_geometry("rail corridor") is None
+    assert cache.get_geometry("park connector") == GEOMETRY
+    assert cache.purge(expired_only=True) == 1
+
+    cache.put_geometry("rail corridor", GEOMETRY, source="overpass")
+    age(cache, "rail corridor", 400)
+    offline = PathCache(str(tmp_path), ttl_days=90, offline=True)
+    assert offline.get_geometry("rail corridor") == GEOMETRY
+    assert offline.purge(expired_only=True) == 0
+
+
+def test_offline_miss_never_fetches(tmp_path):
+    cache = PathCache(str(tmp_path), offline=True)
+    fetch, fetched = counting(GEOMETRY)
+    assert load_path_samples("unknown trail", 2.0, fetch, lambda g, **kw: [], cache=cache) == (None, [])
+    assert fetched == []
@@ -0,0 +1,75 @@
+import numpy as np
+
+from predict import chain_segments, extract_path_segments, haversine, process_and_sample_path, resample_polyline
+
+
+def line(lat0, lat1, lon=103.80, n=11):
+    """North-south polyline as Overpass geometry."""
+    return [{"lat": float(lat), "lon": lon} for lat in np.linspace(lat0, lat1, n)]
+
+
+def ways():
+    # Three consecutive ~5.5 km ways, listed out of order and one reversed
+    return [
+        {"type": "way", "id": 2, "geometry": line(1.40, 1.35)},
+        {"type": "way", "id": 1, "geometry": line(1.45, 1.40)},
+        {"type": "way", "id": 3, "geometry": line(1.30, 1.35)},
+    ]
+
+
+def relation(members):
+    return {"type": "relation", "id": 9, "members": [
+        {"type": "way", "ref": ref, "role": "", "geometry": geom} for ref, geom in members]}
+
+
+def test_segments_chain_into_one_ordered_polyline():
+    segments = extract_path_segments({"elements": ways()})
+    chains = chain_segments(segments)
+    assert len(chains) == 1
+    lats = chains[0][:, 0]
+    assert np.all(np.diff(lats) > 0) or np.all(np.diff(lats) < 0)
+    assert len(chains[0]) == 31  # shared endpoints are not repeated
+
+    # A disconnected segment stays its own chain
+    far = extract_path_segments({"elements": [{"type": "way", "id": 4, "geometry": line(1.20, 1.25, lon=103.95)}]})
+    assert len(chain_segments(segments + far)) == 2
+
+
+def test_relation_duplicates_of_ways_are_dropped():
+    """Overpass returns the ways and the relation containing them; the path must not double back."""
+    members = [(el["id"], el["geometry"]) for el in ways()]
+    expected = process_and_sample_path({"elements": ways()}, sample_dist_km=2.0)
+
+    with_relation = {"elements": ways() + [relation(members)]}
+    assert len(extract_path_segments(with_relation)) == 3
+    samples = process_and_sample_path(with_relation, sample_dist_km=2.0)
+    assert np.allclose(samples, expected)
+    assert np.all(np.diff(np.array(samples)[:, 0]) < 0)  # north -> south, no return leg
+
+    # Same geometry under an unknown ref (or reversed) is still a duplicate
+    reversed_copy = relation([(99, members[0][1][::-1])])
+    assert len(extract_path_segments({"elements": ways() + [reversed_copy]})) == 3
+    # Relation-only members are kept
+    assert len(extract_path_segments({"elements": [relation(members)]})) == 3
+
+
+def test_resample_spacing_along_arc_length():
+    pts = np.array([[p["lat"], p["lon"]] for p in line(1.45, 1.30, n=50)])
+    samples = resample_polyline(pts, 2.0)
+    total = haversine(1.45, 103.80, 1.30, 103.80)
+    assert len(samples) == int(total // 2.0) + 1
+    steps = haversine(samples[:-1, 0], samples[:-1, 1], samples[1:, 0], samples[1:, 1])
+    assert np.allclose(steps, 2.0, atol=1e-6)
+    assert np.allclose(samples[0], pts[0])
+    assert len(resample_polyline(pts[:1], 2.0)) == 1
+
+
+def test_many_segments_chain():
+    """Endpoint index: thousands of shuffled segments still chain into one polyline."""
+    rng = np.random.default_rng(0)
+    lats = np.linspace(1.30, 1.45, 3001)
+    segments = [np.array([[lats[i], 103.8], [lats[i + 1], 103.8]]) for i in range(3000)]
+    segments = [seg[::-1] if rng.random() < 0.5 else seg for seg in segments]
+    rng.shuffle(segments)
+    chains = chain_segments(segments)
+    assert len(chains) == 1 and len(chains[0]) == 3001
@@ -0,0 +1,111 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from response_cache import SlotCache, current_slot, location_key
+
+SLOT = datetime(2025, 10, 1, 15, 30)
+
+def test_location_key_normalization():
+    """Names are case/whitespace-insensitive; coordinates are rounded."""
+    assert location_key("  Marina   Bay ") == location_key("marina bay")
+    assert location_key(None, 1.35012, 103.80049) == location_key(None, 1.3504, 103.8001)
+    assert location_key() is None
+    assert current_slot(datetime(2025, 10, 1, 15, 37, 12)) == SLOT
+
+def test_hit_lru_and_slot_expiry():
+    """Entries are reused within a slot, evicted LRU, and dropped on the next slot."""
+    cache = SlotCache("test", max_entries=2)
+    calls = []
+    compute = lambda v: (lambda: calls.append(v) or v)
+
+    assert cache.get_or_compute("a", SLOT, compute("a1")) == "a1"
+    assert cache.get_or_compute("a", SLOT, compute("a2")) == "a1"
+    cache.get_or_compute("b", SLOT, compute("b1"))
+    cache.get_or_compute("c", SLOT, compute("c1"))  # evicts "a"
+    assert cache.get("a", SLOT) is None
+    assert cache.get("b", SLOT) == "b1"
+
+    next_slot = SLOT + timedelta(minutes=10)
+    assert cache.get_or_compute("b", next_slot, compute("b2")) == "b2"
+    assert len(cache) == 1
+    assert calls == ["a1", "b1", "c1", "b2"]
+
+def test_concurrent_misses_compute_once():
+    """Concurrent identical misses share one computation, including its error."""
+    cache = SlotCache("test", max_entries=10)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"ok": True}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", SLOT, slow)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [{"ok": True}] * 8
+
+    def failing():
+        raise ValueError("boom")
+    with pytest.raises(ValueError):
+        cache.get_or_compute("bad", SLOT, failing)
+    assert cache.get("bad", SLOT) is None
+
+def test_coalesce_decorator():
+    """Concurrent upstream calls are merged; only successful results are cached."""
+    from singleflight import coalesce, COALESCED
+
+    calls = []
+
+    @coalesce("test_upstream", key=lambda q: q.lower(), ttl=60, cache_if=lambda r: r is not None)
+    def upstream(q):
+        calls.append(q)
+        time.sleep(0.2)
+        return None if q == "missing" else q.upper()
+
+    before = COALESCED.get(name="test_upstream")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(upstream("Rail Corridor"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["RAIL CORRIDOR"] * 5
+    assert len(calls) == 1
+    assert COALESCED.get(name="test_upstream") - before == 4
+
+    assert upstream("rail corridor") == "RAIL CORRIDOR"  # cached
+    upstream("missing")
+    upstream("missing")
+    assert calls == ["Rail Corridor", "missing", "missing"]
+
+def test_predict_shares_body_but_echoes_each_query(monkeypatch):
+    """Callers in one cache entry get the body computed for the normalized key and their own location_query."""
+    import api
+    calls = []
+
+    def compute(location, lat, lon, now):
+        calls.append((location, lat, lon))
+        return {"timestamp": now, "location_query": location or f"{lat},{lon}", "forecast": {}}
+
+    monkeypatch.setattr(api, "model", object())
+    monkeypatch.setattr(api, "compute_prediction", compute)
+    monkeypatch.setattr(api, "predict_cache", SlotCache("test"))
+
+    first = api.predict_weather(location=None, lat=1.35012, lon=103.80049)
+    second = api.predict_weather(location=None, lat=1.3504, lon=103.8001)
+    assert calls == [(None, 1.35, 103.8)]
+    assert first["location_query"] == "1.35012,103.80049"
+    assert second["location_query"] == "1.3504,103.8001"
+
+    assert api.predict_weather(location="Marina Bay", lat=None, lon=None)["location_query"] == "Marina Bay"
+    assert api.predict_weather(location=" marina  bay", lat=None, lon=None)["location_query"] == " marina  bay"
+    assert len(calls) == 2
@@ -0,0 +1,118 @@
+import pytest
+
+moto = pytest.importorskip("moto")
+
+import boto3
+
+import s3_manifest
+
+BUCKET = "test-weather-bucket"
+
+@pytest.fixture
+def s3(monkeypatch):
+    # moto provides an in-process S3 stand-in
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+def put_day(s3, date_fmt, n_files, complete=False):
+    for i in range(n_files):
+        s3.put_object(Bucket=BUCKET, Key=f"satellite/{date_fmt}/NC_H09_{date_fmt}_{i:04d}.nc", Body=b"x" * 10)
+    if complete:
+        s3.put_object(Bucket=BUCKET, Key=f"satellite/{date_fmt}/.complete", Body=b"done")
+
+def test_build_day_manifest(s3):
+    """Manifest records file counts, bytes, NEA presence and status."""
+    put_day(s3, "20251001", 3, complete=True)
+    s3.put_object(Bucket=BUCKET, Key="govdata/rainfall_2025-10-01.json", Body=b"{}")
+
+    manifest = s3_manifest.build_day_manifest(s3, "2025-10-01", bucket=BUCKET)
+    assert manifest["status"] == "completed"
+    assert manifest["satellite"] == {"files": 3, "bytes": 30}
+    assert manifest["nea"]["rainfall"]["present"] is True
+    assert manifest["nea"]["pm25"]["present"] is False
+
+def test_write_updates_index(s3):
+    """Writing day manifests rolls them up into the index."""
+    put_day(s3, "20251001", 2, complete=True)
+    put_day(s3, "20251002", 1)
+    s3_manifest.refresh_day_manifest(s3, "2025-10-01", bucket=BUCKET, updated_by="downloader")
+    s3_manifest.refresh_day_manifest(s3, "2025-10-02", bucket=BUCKET)
+
+    index = s3_manifest.read_manifest_index(s3, bucket=BUCKET)
+    assert index["days"]["2025-10-01"]["status"] == "completed"
+    assert index["days"]["2025-10-02"]["status"] == "running"
+    assert s3_manifest.read_day_manifest(s3, "2025-10-01", bucket=BUCKET)["updated_by"] == "downloader"
+
+def test_mark_trained_keeps_counts(s3):
+    """Marking a day trained after archiving keeps the recorded counts."""
+    put_day(s3, "20251001", 2, complete=True)
+    s3_manifest.refresh_day_manifest(s3, "2025-10-01", bucket=BUCKET)
+    for obj in s3.list_objects_v2(Bucket=BUCKET, Prefix="satellite/")["Contents"]:
+        s3.delete_object(Bucket=BUCKET, Key=obj["Key"])
+
+    s3_manifest.mark_day_status(s3, "2025-10-01", "trained", bucket=BUCKET)
+    manifest = s3_manifest.read_day_manifest(s3, "2025-10-01", bucket=BUCKET)
+    assert manifest["status"] == "trained"
+    assert manifest["satellite"]["files"] == 2
+
+def test_missing_manifest(s3):
+    """Missing manifests and index read as None."""
+    assert s3_manifest.read_day_manifest(s3, "2025-10-01", bucket=BUCKET) is None
+    assert s3_manifest.read_manifest_index(s3, bucket=BUCKET) is None
+
+def test_listing_and_manifest_snapshots_agree(s3, monkeypatch):
+    """Monitor totals are the same whether built from the manifest index or a bucket listing."""
+    import monitor_api
+    monkeypatch.setattr(monitor_api, "S3_BUCKET", BUCKET)
+    put_day(s3, "20251001", 3, complete=True)
+    put_day(s3, "20251002", 2)
+    s3.put_object(Bucket=BUCKET, Key="satellite/README.txt", Body=b"not a day")
+    s3.put_object(Bucket=BUCKET, Key="govdata/rainfall_2025-10-01.json", Body=b"{}")
+
+    listed = monitor_api.build_download_snapshot(s3)
+    s3_manifest.refresh_day_manifest(s3, "2025-10-01", bucket=BUCKET)
+    from_index = monitor_api.build_download_snapshot(s3)
+
+    assert listed.filesDownloaded == from_index.filesDownloaded == 5
+    assert listed.completedDays == from_index.completedDays == 1
+    assert listed.dateProgress == from_index.dateProgress
+
+    # A trained day keeps its counts and is reported as trained, not completed
+    s3_manifest.mark_day_status(s3, "2025-10-01", "trained", bucket=BUCKET)
+    trained = monitor_api.build_download_snapshot(s3)
+    assert trained.filesDownloaded == 5 and trained.completedDays == 1
+    assert [d.status for d in trained.dateProgress] == ["trained", "running"]
+
+
+def load_schedulers():
+    """Root training_scheduler.py and the scripts/ copy run on different hosts but must agree."""
+    import importlib.util
+    import training_scheduler
+
+    spec = importlib.util.spec_from_file_location("scripts_training_scheduler", "scripts/training_scheduler.py")
+    scripts_copy = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(scripts_copy)
+    return [training_scheduler, scripts_copy]
+
+
+@pytest.mark.parametrize("scheduler", load_schedulers(), ids=["root", "scripts"])
+def test_schedulers_read_and_mark_day_manifests(s3, monkeypatch, scheduler):
+    monkeypatch.setattr(scheduler, "S3_BUCKET", BUCKET)
+    monkeypatch.setattr(scheduler, "get_s3_client", lambda *args, **kwargs: s3)
+    put_day(s3, "20251001", 2, complete=True)
+    put_day(s3, "20251002", 2)
+    s3.put_object(Bucket=BUCKET, Key="satellite/20251003/.complete", Body=b"done")  # no manifest yet
+
+    s3_manifest.refresh_day_manifest(s3, "2025-10-01", bucket=BUCKET)
+    s3_manifest.refresh_day_manifest(s3, "2025-10-02", bucket=BUCKET)
+    assert scheduler.check_data_available("2025-10-01")
+    assert not scheduler.check_data_available("2025-10-02")
+    assert scheduler.check_data_available("2025-10-03")  # .complete fallback
+
+    scheduler.mark_day_trained("2025-10-01")
+    assert s3_manifest.read_day_manifest(s3, "2025-10-01", bucket=BUCKET)["status"] == "trained"
+    assert not scheduler.check_data_available("2025-10-01")  # trained days are not picked up again
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pytest
+import torch
+import xarray as xr
+
+import download_jaxa_data as jaxa
+import predict
+
+FILES = ["NC_H09_20261019_0140_R21_FLDK.06001_06001.nc", "NC_H09_20261019_0150_R21_FLDK.06001_06001.nc"]
+
+
+def fake_remote(monkeypatch, tmp_path):
+    """JAXA listing/download replaced by small synthetic netCDF files."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(jaxa, "S3_BUCKET", None)
+    monkeypatch.setattr(jaxa, "run_curl_list", lambda path: FILES + ["README.txt"] if path.endswith("/19") else [])
+
+    def download(remote_path, file_name, local_path):
+        kelvin = 240.0 + FILES.index(file_name) * 10
+        xr.Dataset({"tbb": (("y", "x"), np.full((100, 100), kelvin, np.float32))}).to_netcdf(local_path)
+        return True
+
+    monkeypatch.setattr(jaxa, "run_curl_download", download)
+
+
+def test_ingest_publishes_frame_to_cache_and_disk(monkeypatch, tmp_path):
+    fake_remote(monkeypatch, tmp_path)
+    monkeypatch.setattr(predict, "RECENT_FRAMES", predict.OrderedDict())
+    frame = jaxa.ingest_file("/jma/netcdf/202610/19", FILES[1], on_frame=predict.publish_frame, keep_raw=False)
+
+    assert frame.shape == (64, 64) and np.allclose(frame, 250.0)
+    assert np.allclose(np.load(os.path.join("processed_data", FILES[1].replace(".nc", ".npy"))), 250.0)
+    assert not os.path.exists(os.path.join("satellite_data", FILES[1]))
+
+    # Served from memory for the matching local (UTC+8) slot
+    sat = predict.load_satellite_tensor(datetime(2026, 10, 19, 9, 55))
+    assert torch.allclose(sat, torch.full((1, 1, 64, 64), 0.5))
+
+
+def test_daemon_ingests_newest_first(monkeypatch, tmp_path):
+    fake_remote(monkeypatch, tmp_path)
+    monkeypatch.setattr(jaxa, "datetime", type("FixedNow", (datetime,), {
+        "utcnow": classmethod(lambda cls: datetime(2026, 10, 19, 2, 5))}))
+    stop = threading.Event()
+    published = []
+
+    def on_frame(slot, frame):
+        published.append(slot)
+        if len(published) == len(FILES):
+            stop.set()
+
+    jaxa.run_daemon(hours=1, interval=0, on_frame=on_frame, stop_event=stop)
+    assert published == ["20261019_0150", "20261019_0140"]
+
+
+def test_current_slot_not_published_yet_uses_newest_recent_frame(monkeypatch, tmp_path):
+    """Until JAXA publishes the current slot, requests get the newest live frame within the age bound, not zeros."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(predict, "RECENT_FRAMES", predict.OrderedDict())
+    predict.publish_frame("20261019_0140", np.full((64, 64), 240.0, np.float32))
+    predict.publish_frame("20261019_0150", np.full((64, 64), 250.0, np.float32))
+    predict.publish_frame("20261019_0230", np.full((64, 64), 290.0, np.float32))
+
+    def served(hour, minute):  # local time (UTC+8)
+        return predict.load_satellite_tensor(datetime(2026, 10, 19, hour, minute))[0, 0, 0, 0].item()
+
+    # UTC 02:10 and 02:20 are not out yet: the 01:50 frame (up to 30 minutes old) is served
+    assert served(10, 10) == pytest.approx(0.5) and served(10, 20) == pytest.approx(0.5)
+    # A published slot is used exactly, and a later frame never stands in for an earlier slot
+    assert served(10, 30) == pytest.approx(0.9) and served(9, 40) == pytest.approx(0.4)
+    assert served(9, 30) == 0.0
+    # Beyond SAT_MAX_FRAME_AGE_MINUTES nothing is reused
+    monkeypatch.setattr(predict, "SAT_MAX_FRAME_AGE_MINUTES", 20)
+    assert served(10, 20) == 0.0
+
+
+def test_frames_from_another_process_are_used_before_the_slot_lands(monkeypatch, tmp_path):
+    """A worker that didn't ingest the frame itself falls back to the newest processed .npy within the bound."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(predict, "RECENT_FRAMES", predict.OrderedDict())
+    os.makedirs("processed_data")
+    np.save("processed_data/NC_H09_20261019_0150_R21_FLDK.06001_06001.npy", np.full((64, 64), 250.0, np.float32))
+    np.save("processed_data/NC_H09_20261019_0230_R21_FLDK.06001_06001.npy", np.full((64, 64), 290.0, np.float32))
+    predict.publish_frame("20261019_0140", np.full((64, 64), 240.0, np.float32))
+
+    # UTC 02:10: 01:50 on disk is newer than 01:40 in memory
+    sat = predict.load_satellite_tensor(datetime(2026, 10, 19, 10, 10))
+    assert torch.allclose(sat, torch.full((1, 1, 64, 64), 0.5))
+    monkeypatch.setattr(predict, "SAT_MAX_FRAME_AGE_MINUTES", 10)
+    assert torch.count_nonzero(predict.load_satellite_tensor(datetime(2026, 10, 19, 10, 20))) == 0
+
+
+def test_only_the_lock_holder_ingests(monkeypatch, tmp_path):
+    """A second daemon (another API worker) waits on the ingest lock instead of downloading the same files."""
+    fake_remote(monkeypatch, tmp_path)
+    monkeypatch.setattr(jaxa, "datetime", type("FixedNow", (datetime,), {
+        "utcnow": classmethod(lambda cls: datetime(2026, 10, 19, 2, 5))}))
+    holder = jaxa.try_ingest_lock()
+    assert holder is not None and jaxa.try_ingest_lock() is None
+
+    stop = threading.Event()
+    published = []
+    waiting = threading.Thread(target=jaxa.run_daemon, kwargs={
+        "interval": 0.01, "on_frame": lambda slot, frame: (published.append(slot), stop.set()), "stop_event": stop})
+    waiting.start()
+    time.sleep(0.1)
+    assert published == []
+
+    holder.close()  # the ingesting worker exits: this daemon takes over
+    waiting.join(timeout=5)
+    assert published == ["20261019_0150"]
+    assert sorted(os.listdir("processed_data")) == [".ingest.lock", FILES[1].replace(".nc", ".npy")]
@@ -0,0 +1,150 @@
+import fcntl
+import sqlite3
+import threading
+import time
+
+from datetime import datetime, timezone
+
+import search_log
+from search_log import SearchLogWriter
+
+
+def make_db(tmp_path):
+    path = str(tmp_path / "weather.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE search_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            query TEXT NOT NULL,
+            ip_address TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_concurrent_searches_are_written_in_batches(tmp_path):
+    """Many threads enqueue; rows land in few WAL transactions with their enqueue timestamps."""
+    path = make_db(tmp_path)
+    writer = SearchLogWriter(path, flush_ms=50, batch_size=100)
+    threads = [threading.Thread(target=lambda k=k: [writer.log(f"q{k}", "10.0.0.1") for _ in range(50)])
+               for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.flush()
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM search_history").fetchone()[0] == 400
+    assert conn.execute("SELECT COUNT(*) FROM search_history WHERE timestamp IS NULL").fetchone()[0] == 0
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+    writer.close()
+
+
+def test_full_queue_drops_instead_of_blocking_and_close_flushes(tmp_path):
+    path = make_db(tmp_path)
+    writer = SearchLogWriter(path, flush_ms=10, max_queue=1)
+    writer._ensure_started = lambda: None  # keep the writer stopped so the queue stays full
+    assert writer.log("a") is True
+    assert writer.log("b") is False
+
+    del writer._ensure_started
+    writer._ensure_started()
+    writer.close()
+    assert sqlite3.connect(path).execute("SELECT query FROM search_history").fetchall() == [("a",)]
+
+
+def test_rollups_match_full_scan_and_backfill(tmp_path):
+    """Incremental rollups agree with GROUP BY over search_history, including a backfilled old database."""
+    path = make_db(tmp_path)
+    conn = sqlite3.connect(path)
+    conn.executemany(search_log.INSERT_SQL, [
+        ("Orchard", "1.1.1.1", "2026-10-18 09:00:00"), ("Orchard", "2.2.2.2", "2026-10-19 09:00:00"),
+        ("Changi", None, "2026-10-19 10:00:00"), ("  ", "1.1.1.1", "2026-10-19 11:00:00")])
+    conn.commit()
+    search_log.ensure_rollups(conn)  # old database: backfilled once
+    conn.close()
+
+    writer = SearchLogWriter(path, flush_ms=10)
+    for q in ["Changi", "Changi", "Bedok"]:
+        writer.log(q, "2.2.2.2")
+    writer.close()
+
+    conn = sqlite3.connect(path)
+    expected = conn.execute(
+        "SELECT query, COUNT(*) FROM search_history WHERE TRIM(query) != '' "
+        "GROUP BY query ORDER BY COUNT(*) DESC, query LIMIT 2").fetchall()
+    assert search_log.top_searches(conn, 2) == expected == [("Changi", 3), ("Orchard", 2)]
+    assert search_log.top_ips(conn) == conn.execute(
+        "SELECT ip_address, COUNT(*) FROM search_history WHERE ip_address IS NOT NULL "
+        "GROUP BY ip_address ORDER BY COUNT(*) DESC").fetchall()
+    assert search_log.day_stats(conn, "2026-10-19") == conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT ip_address), COUNT(DISTINCT query) FROM search_history "
+        "WHERE DATE(timestamp) = '2026-10-19'").fetchone()
+    plan = " ".join(r[-1] for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT key, count FROM search_rollup WHERE kind = 'query' AND day = '' "
+        "ORDER BY count DESC LIMIT 6"))
+    assert "idx_search_rollup_count" in plan and "TEMP B-TREE" not in plan
+    conn.close()
+
+
+def test_decayed_and_daily_rankings(tmp_path):
+    """An old favourite loses to a recent burst under decay and in a short daily window."""
+    path = make_db(tmp_path)
+    conn = sqlite3.connect(path)
+    search_log.ensure_rollups(conn)
+    with conn:
+        rows = [("Sentosa", None, "2026-08-01 12:00:00")] * 10 + [("Jurong", None, "2026-10-19 08:00:00")] * 3
+        conn.executemany(search_log.INSERT_SQL, rows)
+        search_log.apply_rollups(conn, rows)
+    now = datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+
+    assert search_log.top_searches(conn, 1) == [("Sentosa", 10)]
+    (name, score), = search_log.top_searches(conn, 1, decayed=True, now=now)
+    assert name == "Jurong" and 2.9 < score <= 3
+    assert search_log.top_searches(conn, 5, days=7, now=now) == [("Jurong", 3)]
+    conn.close()
+
+
+def test_concurrent_workers_backfill_once(tmp_path):
+    """A second worker importing api waits for the first one's backfill instead of failing on the SQLite lock."""
+    path = make_db(tmp_path)
+    conn = sqlite3.connect(path)
+    conn.executemany(search_log.INSERT_SQL, [("Orchard", "1.1.1.1", "2026-10-19 09:00:00")] * 3)
+    conn.commit()
+    conn.close()
+
+    # Worker 1: holds the backfill lock with a write transaction open
+    lock = open(f"{path}.rollup.lock", "w")
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    first = sqlite3.connect(path)
+    first.executescript(search_log.ROLLUP_SCHEMA)
+    first.execute("BEGIN IMMEDIATE")
+    search_log.apply_rollups(first, first.execute("SELECT query, ip_address, timestamp FROM search_history"))
+
+    errors = []
+
+    def second_worker():
+        conn = sqlite3.connect(path, timeout=0.05)
+        try:
+            search_log.ensure_rollups(conn)
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=second_worker)
+    thread.start()
+    time.sleep(0.3)  # well past the second connection's busy timeout
+    assert thread.is_alive()
+    first.commit()
+    lock.close()
+    thread.join(timeout=5)
+
+    assert errors == []
+    assert search_log.top_searches(first, 1) == [("Orchard", 3)]  # not rebuilt a second time on top
+    first.close()
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from sensor_store import IngestLedger, upsert_rows
+
+
+def frame(times, sensor="S1", **values):
+    return pd.DataFrame({"timestamp": pd.to_datetime(times), "sensor_id": sensor, **values})
+
+
+def test_append_fast_path_and_ledger_roundtrip(tmp_path):
+    csv = tmp_path / "real_sensor_data.csv"
+    ledger = IngestLedger(str(tmp_path / "ledger.json"))
+    assert upsert_rows(frame(["2026-10-18 09:00"], temperature=[27.0]), csv, ledger) == "created"
+    ledger.mark("temperature_2026-10-18.json", {"mtime": 1.0, "size": 10})
+    ledger.save()
+
+    ledger = IngestLedger(str(tmp_path / "ledger.json"))
+    assert ledger.is_ingested("temperature_2026-10-18.json", {"mtime": 1.0, "size": 10})
+    assert not ledger.is_ingested("temperature_2026-10-18.json", {"mtime": 2.0, "size": 10})
+    assert ledger.max_timestamp == pd.Timestamp("2026-10-18 09:00")
+
+    assert upsert_rows(frame(["2026-10-19 09:00"], temperature=[28.0]), csv, ledger) == "appended"
+    out = pd.read_csv(csv)
+    assert list(out.columns) == ["timestamp", "sensor_id", "humidity", "pm25", "rainfall", "temperature"]
+    assert out["temperature"].tolist() == [27.0, 28.0]
+    assert ledger.max_timestamp == pd.Timestamp("2026-10-19 09:00")
+
+
+def test_tz_aware_rows_align_to_naive_local_csv(tmp_path):
+    """NEA timestamps carry +08:00; the CSV stores naive Singapore time."""
+    csv = tmp_path / "real_sensor_data.csv"
+    upsert_rows(frame(["2026-10-19 09:00"], temperature=[27.0]), csv)
+    ledger = IngestLedger(str(tmp_path / "ledger.json"))
+    aware = frame(["2026-10-19T02:00:00Z"], temperature=[28.0])  # 10:00 in Singapore
+    assert upsert_rows(aware, csv, ledger) == "appended"
+    assert pd.read_csv(csv)["timestamp"].tolist() == ["2026-10-19 09:00:00", "2026-10-19 10:00:00"]
+    assert ledger.max_timestamp == pd.Timestamp("2026-10-19 10:00")
+
+
+def test_other_sensor_type_for_ingested_day_merges(tmp_path):
+    """A later file for an already-ingested day fills its own column; NaN never overwrites."""
+    csv = tmp_path / "real_sensor_data.csv"
+    ledger = IngestLedger(str(tmp_path / "ledger.json"))
+    upsert_rows(frame(["2026-10-19 09:00", "2026-10-19 09:01"], temperature=[27.0, 27.5],
+                      rainfall=[0.2, 0.0]), csv, ledger)
+
+    late = frame(["2026-10-19 09:00", "2026-10-19 09:01", "2026-10-19 09:02"],
+                 rainfall=[np.nan, 1.5, 0.3], humidity=[80.0, 81.0, 82.0])
+    assert upsert_rows(late, csv, ledger) == "merged"
+
+    out = pd.read_csv(csv)
+    assert out["timestamp"].tolist() == ["2026-10-19 09:00:00", "2026-10-19 09:01:00", "2026-10-19 09:02:00"]
+    assert out["temperature"].tolist() == [27.0, 27.5, 0.0]
+    assert out["rainfall"].tolist() == [0.2, 1.5, 0.3]   # NaN kept the old value; 1.5 replaced 0.0
+    assert out["humidity"].tolist() == [80.0, 81.0, 82.0]
+
+
+def test_full_fetch_resets_ledger_before_incremental_run(tmp_path, monkeypatch):
+    """A FETCH_INCREMENTAL=0 rewrite must not leave a stale max_timestamp that lets the next run re-append rows."""
+    import datetime
+    import fetch_and_process_gov_data as gov
+
+    monkeypatch.chdir(tmp_path)
+    days = [datetime.date(2026, 10, 17), datetime.date(2026, 10, 18)]
+    monkeypatch.setattr(gov, "FETCH_CONFIG", days)
+    monkeypatch.setattr(gov, "process_day", lambda day: frame(
+        [f"{day} 09:00", f"{day} 09:01"], temperature=[27.0, 28.0], rainfall=0.0, humidity=80.0, pm25=20.0))
+
+    # An older ledger from earlier incremental runs
+    stale = IngestLedger()
+    stale.reset({"nea:2026-10-01": {}}, pd.Timestamp("2026-10-01 23:59"))
+    stale.save()
+
+    monkeypatch.setattr(gov, "INCREMENTAL", False)
+    gov.main()
+    ledger = IngestLedger()
+    assert set(ledger.sources) == {"nea:2026-10-17", "nea:2026-10-18"}
+    assert ledger.max_timestamp == pd.Timestamp("2026-10-18 09:01")
+
+    # Next incremental run re-fetches the last day with one more reading: merged, not duplicated
+    monkeypatch.setattr(gov, "INCREMENTAL", True)
+    monkeypatch.setattr(gov, "FETCH_CONFIG", days + [datetime.date(2026, 10, 19)])
+    ledger.sources.pop("nea:2026-10-18")
+    ledger.save()
+    gov.main()
+    out = pd.read_csv("real_sensor_data.csv")
+    assert len(out) == 6 and not out.duplicated(["timestamp", "sensor_id"]).any()
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pandas as pd
+import torch
+
+import predict
+import shared_state
+from weather_fusion_model import WeatherFusionNet
+
+
+def is_memmap_backed(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def make_sources(tmp_path):
+    csv_path = str(tmp_path / "real_sensor_data.csv")
+    times = pd.date_range("2026-10-01", periods=12, freq="10min")
+    pd.DataFrame({
+        "timestamp": np.repeat(times, 2),
+        "sensor_id": ["S1", "S2"] * 12,
+        "humidity": np.linspace(70, 90, 24),
+        "pm25": np.linspace(10, 20, 24),
+        "rainfall": np.linspace(0, 1, 24),
+        "temperature": np.linspace(26, 30, 24),
+    }).to_csv(csv_path, index=False)
+
+    frames_dir = tmp_path / "processed_data"
+    frames_dir.mkdir()
+    np.save(frames_dir / "NC_H09_20261001_0000_R21_FLDK.02401_02401.npy", np.full((64, 64), 250.0, np.float32))
+
+    model_path = str(tmp_path / "weather_fusion_model.pth")
+    torch.save(WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=3).state_dict(), model_path)
+    return csv_path, model_path, str(frames_dir)
+
+
+def test_publish_attach_round_trip_is_zero_copy(tmp_path, monkeypatch):
+    """Workers see the same data and weights as load_system, backed by the published files."""
+    csv_path, model_path, frames_dir = make_sources(tmp_path)
+    state_dir = str(tmp_path / "shm")
+    monkeypatch.setattr(predict, "FRAME_STORE", None)
+    shared_state.publish(state_dir, csv_path, model_path, frames_dir)
+
+    model, df = shared_state.attach(state_dir, csv_path, model_path)
+    expected = pd.read_csv(csv_path, parse_dates=["timestamp"])
+    pd.testing.assert_frame_equal(df.astype({"sensor_id": str}), expected, check_dtype=False)
+    assert is_memmap_backed(df["temperature"].to_numpy())
+
+    reference = WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=3)
+    reference.load_state_dict(torch.load(model_path, weights_only=True))
+    for name, param in model.state_dict().items():
+        assert torch.equal(param, reference.state_dict()[name])
+
+    frame = predict.load_frame(os.path.join(frames_dir, "NC_H09_20261001_0000_R21_FLDK.02401_02401.npy"))
+    assert is_memmap_backed(frame) and float(frame[0, 0]) == 250.0
+
+
+def test_stale_or_missing_state_is_not_attached(tmp_path):
+    """Changed source files (or nothing published) make workers fall back to load_system."""
+    csv_path, model_path, frames_dir = make_sources(tmp_path)
+    state_dir = str(tmp_path / "shm")
+    assert shared_state.attach(state_dir, csv_path, model_path) is None
+
+    shared_state.publish(state_dir, csv_path, model_path, frames_dir)
+    with open(csv_path, "a") as f:
+        f.write("2026-10-01 02:00:00,S1,80,15,0,28\n")
+    assert shared_state.attach(state_dir, csv_path, model_path) is None
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from weather_dataset import WeatherDataset, get_validation_loader, load_split, time_split
+
+
+class FakeDataset:
+    """Only the sample timestamps time_split looks at: 10-minute steps, 60-minute input window."""
+
+    def __init__(self, start, days):
+        targets = pd.date_range(start, periods=days * 144, freq="10min")
+        self.samples = [{"input_start_ts": t - pd.Timedelta(minutes=60), "target_ts": t} for t in targets]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+def test_holdout_trails_incremental_data(tmp_path):
+    """New days push the cutoff forward: training grows, validation keeps its length."""
+    split_file = str(tmp_path / "split.json")
+    train, val = time_split(FakeDataset("2026-09-01", 10), split_file=split_file)
+    first = load_split(split_file)
+    assert first["holdout_minutes"] == 2 * 24 * 60  # 20% of the span, rounded up to 10 min
+
+    # Three more days ingested, window still starting on the same day
+    train2, val2 = time_split(FakeDataset("2026-09-01", 13), split_file=split_file)
+    assert len(train2) == len(train) + 3 * 144
+    assert len(val2) == len(val)
+    assert pd.Timestamp(load_split(split_file)["cutoff"]) == pd.Timestamp(first["cutoff"]) + pd.Timedelta(days=3)
+
+    # Rolling 30-day window moved past the old cutoff: training never empties
+    train3, val3 = time_split(FakeDataset("2026-10-01", 10), split_file=split_file)
+    assert train3 and len(val3) == len(val)
+
+
+def test_unchanged_split_is_not_rewritten(tmp_path):
+    split_file = str(tmp_path / "split.json")
+    dataset = FakeDataset("2026-09-01", 5)
+    time_split(dataset, split_file=split_file)
+    mtime = os.stat(split_file).st_mtime_ns
+    os.utime(split_file, ns=(mtime - 10**9, mtime - 10**9))
+    time_split(dataset, split_file=split_file)
+    assert os.stat(split_file).st_mtime_ns == mtime - 10**9
+
+
+def write_tz_aware_data(days=2):
+    """CSV with +08:00 timestamps as fetch_and_process_gov_data writes them, plus a cached frame per slot."""
+    ts = pd.date_range("2026-10-18", periods=days * 144, freq="10min", tz="Asia/Singapore")
+    pd.DataFrame({"timestamp": ts, "sensor_id": "S1", "temperature": 28.0, "humidity": 80.0,
+                  "rainfall": np.arange(len(ts)) % 7 / 10, "pm25": 20.0}).to_csv("sensors.csv", index=False)
+    os.makedirs("processed_data")
+    for t in ts.tz_convert("UTC"):
+        np.save(f"processed_data/NC_H09_{t:%Y%m%d_%H%M}_R21.npy", np.full((64, 64), 250.0, np.float32))
+
+
+def test_tz_aware_csv_validation_loader_matches_split(tmp_path, monkeypatch):
+    """Persisted cutoff keeps its offset, and the validation-only build sees the same samples."""
+    monkeypatch.chdir(tmp_path)
+    write_tz_aware_data()
+    dataset = WeatherDataset("sensors.csv", "satellite_data", num_horizons=3)
+    _, val = time_split(dataset, split_file="split.json")
+
+    saved = load_split("split.json")
+    cutoff = pd.Timestamp(saved["cutoff"])
+    assert cutoff.utcoffset() == pd.Timedelta(hours=8)
+    assert min(dataset.samples[i]["input_start_ts"] for i in val) == cutoff
+
+    loader = get_validation_loader("sensors.csv", "satellite_data", split_file="split.json", num_horizons=3)
+    assert [s["target_ts"] for s in loader.dataset.samples] == [dataset.samples[i]["target_ts"] for i in val]
+    sat, sensor, target = next(iter(loader))
+    assert sat.shape[1:] == (1, 64, 64) and target.shape[1] == 3
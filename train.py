@@ -1,7 +1,7 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from weather_fusion_model import WeatherFusionNet
+from weather_fusion_model import WeatherFusionNet, FORECAST_HORIZONS
 from weather_dataset import get_dataloaders
 import os
 
@@ -35,10 +35,15 @@ MODEL_SAVE_PATH = "weather_fusion_model.pth"
 def train_model():
     # 1. Data
     print("Loading Data...")
-    train_loader, val_loader = get_dataloaders(CSV_PATH, SAT_DIR, batch_size=BATCH_SIZE)
+    train_loader, val_loader = get_dataloaders(CSV_PATH, SAT_DIR, batch_size=BATCH_SIZE,
+                                               num_horizons=FORECAST_HORIZONS)
+    if len(train_loader) == 0 or len(val_loader) == 0:
+        raise RuntimeError(f"Not enough samples to train: {len(train_loader)} train / "
+                           f"{len(val_loader)} val batches")
     
     # 2. Model
-    model = WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=1) # Sat channel=1 because we use B13 (Infrared) only
+    # Sat channel=1 because we use B13 (Infrared) only; one output per forecast horizon
+    model = WeatherFusionNet(sat_channels=1, sensor_features=4, prediction_dim=FORECAST_HORIZONS)
     
     # 🆕 增量学习: 检查是否存在已训练模型
     if os.path.exists(MODEL_SAVE_PATH):
@@ -83,6 +88,12 @@ def train_model():
                         # Bias shape depends only on hidden size, so it should match if hidden size didn't change.
                         print("   ✅ Smart adaptation applied to weights.")
             
+            # Horizon count changed (e.g. 1 -> 12): keep the encoders, re-initialise the output layer
+            for key in ('fusion_head.3.weight', 'fusion_head.3.bias'):
+                if key in saved_state and saved_state[key].shape != model_state[key].shape:
+                    print(f"   💡 输出层形状变化 {tuple(saved_state[key].shape)} -> {tuple(model_state[key].shape)}，重新初始化")
+                    del saved_state[key]
+            
             # Load with strict=False to allow for minor mismatches if any, but our fix should make it perfect match
             # But let's verify keys first.
             model.load_state_dict(saved_state, strict=False)
@@ -110,6 +121,7 @@ def train_model():
     print(f"  - Epochs: {EPOCHS}")
     print(f"  - Batch Size: {BATCH_SIZE}")
     print(f"  - Learning Rate: {LEARNING_RATE}")
+    print(f"  - Forecast Horizons: {FORECAST_HORIZONS} x 10min")
     print(f"  - Device: {DEVICE}")
     print(f"{'='*60}\n")
     
@@ -186,12 +198,20 @@ def train_model():
         "last_train_mae": avg_train_mae,
         "last_val_mae": avg_val_mae,
         "rmse": best_loss ** 0.5,
+        "forecast_horizons": FORECAST_HORIZONS,
         "success": True
     }
     with open("training_metrics.json", "w") as f:
         import json
         json.dump(metrics, f, indent=2)
     
+    # Export serving artifacts (TorchScript / ONNX) for the API's inference backend
+    try:
+        from inference_backend import export_all, load_model
+        export_all(load_model(MODEL_SAVE_PATH))
+    except Exception as e:
+        print(f"⚠️ Inference export skipped: {e}")
+    
     print("Force exiting to prevent MPS hang...")
     import sys
     sys.exit(0)
@@ -25,10 +25,8 @@ def update_status(state):
 
     # Upload to S3
     try:
-        import boto3
-        s3 = boto3.client('s3', endpoint_url=S3_ENDPOINT_URL)
-        s3_key = "state/training_state.json"
-        s3.upload_file(local_path, S3_BUCKET, s3_key)
+        from storage import upload_file
+        upload_file(local_path, S3_BUCKET, "state/training_state.json", endpoint_url=S3_ENDPOINT_URL)
     except Exception as e:
         print(f"[WARNING] Failed to update status: {e}")
 
@@ -36,10 +34,8 @@ def get_history():
     """Fetch existing history from S3."""
     if not S3_BUCKET: return []
     try:
-        import boto3
-        s3 = boto3.client('s3', endpoint_url=S3_ENDPOINT_URL)
-        obj = s3.get_object(Bucket=S3_BUCKET, Key="history/training_history.json")
-        return json.loads(obj['Body'].read().decode('utf-8'))
+        from storage import read_json
+        return read_json(S3_BUCKET, "history/training_history.json", endpoint_url=S3_ENDPOINT_URL)
     except Exception as e:
         return []
 
@@ -65,9 +61,8 @@ def update_history(run_data):
         json.dump(history, f, indent=2)
         
     try:
-        import boto3
-        s3 = boto3.client('s3', endpoint_url=S3_ENDPOINT_URL)
-        s3.upload_file(local_path, S3_BUCKET, "history/training_history.json")
+        from storage import upload_file
+        upload_file(local_path, S3_BUCKET, "history/training_history.json", endpoint_url=S3_ENDPOINT_URL)
     except Exception as e:
         print(f"[WARNING] Failed to update history: {e}")
 
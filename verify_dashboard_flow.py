@@ -1,4 +1,4 @@
-import boto3
+from storage import get_s3_client
 import json
 import os
 import subprocess
@@ -21,7 +21,7 @@ os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 
 def reset_s3():
     print("Resetting S3 state...")
-    s3 = boto3.client('s3', endpoint_url=S3_ENDPOINT_URL)
+    s3 = get_s3_client(S3_ENDPOINT_URL)
     # Create bucket if not exists (Moto starts empty)
     try:
         s3.create_bucket(Bucket=S3_BUCKET)
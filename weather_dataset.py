@@ -4,6 +4,7 @@ import pandas as pd
 import xarray as xr
 import numpy as np
 import os
+import json
 from datetime import datetime, timezone, timedelta
 
 # --- Himawari-9 Constants & Projection Utils (EQR L3) ---
@@ -31,19 +32,29 @@ SG_LON_MIN, SG_LON_MAX = 103.6, 104.1
 C1, L1 = latlon2xy(SG_LAT_MAX, SG_LON_MIN) # Top-Left (High Lat, Low Lon)
 C2, L2 = latlon2xy(SG_LAT_MIN, SG_LON_MAX) # Bottom-Right (Low Lat, High Lon)
 
+# Persisted train/validation split (time-blocked holdout)
+SPLIT_FILE = "dataset_split.json"
+
 class WeatherDataset(Dataset):
-    def __init__(self, csv_file, sat_dir, sequence_length=6, prediction_horizon=1):
+    def __init__(self, csv_file, sat_dir, sequence_length=6, prediction_horizon=1,
+                 start_time=None, end_time=None, num_horizons=1):
         """
         Args:
             csv_file (string): Path to the csv file with sensor data.
             sat_dir (string): Directory with all satellite .nc files.
             sequence_length (int): How many past timesteps of sensor data to use.
             prediction_horizon (int): How far ahead to predict.
+            num_horizons (int): Number of consecutive 10-minute steps in the target vector,
+                starting at prediction_horizon (1 = single next-step target).
+            start_time, end_time (optional): Only build samples whose whole window
+                (first input step .. target) lies in [start_time, end_time].
+                Data outside the window is dropped before resampling.
         """
         self.sensor_df = pd.read_csv(csv_file)
         self.sat_dir = sat_dir
         self.seq_len = sequence_length
         self.horizon = prediction_horizon
+        self.num_horizons = num_horizons
         
         self.sensor_df['timestamp'] = pd.to_datetime(self.sensor_df['timestamp'])
         
@@ -66,6 +77,16 @@ class WeatherDataset(Dataset):
         else:
             print("⚠️  数据集为空")
         
+        # 🆕 时间窗口: 只构建窗口内的样本 (例如只加载验证集)
+        self.start_time = pd.Timestamp(start_time) if start_time is not None else None
+        self.end_time = pd.Timestamp(end_time) if end_time is not None else None
+        if self.start_time is not None:
+            self.start_time = _match_tz(self.start_time, self.sensor_df['timestamp'])
+            self.sensor_df = self.sensor_df[self.sensor_df['timestamp'] >= self.start_time.floor('10min')]
+        if self.end_time is not None:
+            self.end_time = _match_tz(self.end_time, self.sensor_df['timestamp'])
+            self.sensor_df = self.sensor_df[self.sensor_df['timestamp'] < self.end_time.floor('10min') + timedelta(minutes=10)]
+        
         # --- PRE-SCAN AVAILABLE SATELLITE FILES ---
         self.available_sat_timestamps = set()
         
@@ -137,7 +158,8 @@ class WeatherDataset(Dataset):
         self.samples = []
         for sensor_id, group in merged.groupby('sensor_id'):
             # group is sorted because resampled was sorted
-            timestamps = group['timestamp'].values
+            # (DatetimeIndex, not .values: tz-aware CSVs keep their timezone)
+            timestamps = pd.DatetimeIndex(group['timestamp'])
             valid_sat_flags = group['valid_sat'].values
             num_rows = len(group)
             
@@ -145,11 +167,20 @@ class WeatherDataset(Dataset):
                 continue
 
             # Iterate over valid end points
-            for i in range(self.seq_len, num_rows - self.horizon + 1):
+            last_offset = self.horizon + self.num_horizons - 1  # steps from input end to last target
+            for i in range(self.seq_len, num_rows - last_offset + 1):
                 # We need Satellite Image at input sequence END (i-1)
                 if not valid_sat_flags[i-1]:
                     continue
                 
+                input_start_ts = pd.Timestamp(timestamps[i - self.seq_len])
+                # Last target step: the whole target vector must lie inside the window
+                target_ts = pd.Timestamp(timestamps[i + last_offset - 1])
+                if self.start_time is not None and input_start_ts < self.start_time:
+                    continue
+                if self.end_time is not None and target_ts > self.end_time:
+                    continue
+                
                 # Check continuity (optional check for gaps)
                 # ...
 
@@ -158,6 +189,9 @@ class WeatherDataset(Dataset):
                     'input_idx_start': i - self.seq_len,
                     'input_idx_end': i,
                     'target_idx': i + self.horizon - 1,
+                    'input_start_ts': input_start_ts,
+                    'first_target_ts': pd.Timestamp(timestamps[i + self.horizon - 1]),
+                    'target_ts': target_ts,
                     'group_data': group # View into the group dataframe
                 })
 
@@ -181,9 +215,10 @@ class WeatherDataset(Dataset):
         
         sensor_tensor = torch.tensor(sensor_seq, dtype=torch.float32)
         
-        # 2. Get Target
-        target_val = group.iloc[sample_info['target_idx']]['rainfall']
-        target_tensor = torch.tensor([target_val], dtype=torch.float32)
+        # 2. Get Target (one value per horizon)
+        t = sample_info['target_idx']
+        target_vals = group['rainfall'].values[t : t + self.num_horizons]
+        target_tensor = torch.tensor(target_vals, dtype=torch.float32)
         
         # 3. Get Satellite Image
         current_ts = group.iloc[sample_info['input_idx_end'] - 1]['timestamp']
@@ -227,15 +262,102 @@ def import_glob():
     import glob
     return glob
 
-def get_dataloaders(csv_path, sat_dir, batch_size=4, split=0.8):
-    dataset = WeatherDataset(csv_path, sat_dir)
-    train_size = int(split * len(dataset))
-    val_size = len(dataset) - train_size
-    train_ds, val_ds = torch.utils.data.random_split(dataset, [train_size, val_size])
+def _match_tz(ts, series):
+    """Align a timestamp's timezone with the sensor data (naive timestamps are UTC+8 local)."""
+    tz = series.dt.tz
+    if tz is not None and ts.tzinfo is None:
+        return ts.tz_localize(timezone(timedelta(hours=8))).tz_convert(tz)
+    if tz is None and ts.tzinfo is not None:
+        return ts.tz_convert(timezone(timedelta(hours=8))).tz_localize(None)
+    return ts
+
+def load_split(split_file=SPLIT_FILE):
+    if not os.path.exists(split_file):
+        return None
+    with open(split_file) as f:
+        return json.load(f)
+
+def time_split(dataset, split=0.8, split_file=SPLIT_FILE):
+    """
+    Time-blocked holdout: validation = samples whose whole window starts at or after
+    the cutoff, training = samples whose target is before it. Samples straddling the
+    cutoff are dropped so no sensor readings are shared between the two sets.
+
+    The holdout is a fixed-length trailing block: its duration is derived from `split`
+    on the first run and persisted in `split_file`. Later runs keep that duration and
+    place the cutoff that far before the newest sample, so incrementally ingested data
+    moves the older part of the previous holdout into training while validation stays
+    the same size. The file is only rewritten when the cutoff changes.
+    Returns (train_indices, val_indices).
+    """
+    if len(dataset) == 0:
+        return [], []
+    
+    target_ts = pd.DatetimeIndex([s['target_ts'] for s in dataset.samples])
+    start_ts = pd.DatetimeIndex([s['input_start_ts'] for s in dataset.samples])
+    first, last = target_ts.min(), target_ts.max()
+    
+    saved = load_split(split_file)
+    holdout = None
+    if saved and saved.get('split') == split and saved.get('holdout_minutes'):
+        holdout = pd.Timedelta(minutes=saved['holdout_minutes'])
+    if holdout is None:
+        holdout = ((last - first) * (1 - split)).ceil('10min')
+    
+    cutoff = (last - holdout).floor('10min')
+    if cutoff <= first:
+        # Window shorter than the persisted holdout: fall back to the split quantile
+        cutoff = (first + (last - first) * split).floor('10min')
+    
+    train_idx = np.flatnonzero(target_ts < cutoff).tolist()
+    val_idx = np.flatnonzero(start_ts >= cutoff).tolist()
+    
+    if saved and saved.get('cutoff') == cutoff.isoformat() and saved.get('val_end') == last.isoformat() \
+            and saved.get('holdout_minutes') == holdout / pd.Timedelta(minutes=1):
+        print(f"Time split @ {cutoff} (unchanged): {len(train_idx)} train / {len(val_idx)} val samples")
+        return train_idx, val_idx
+    
+    info = {
+        'split': split,
+        'holdout_minutes': holdout / pd.Timedelta(minutes=1),
+        'cutoff': cutoff.isoformat(),
+        'val_start': cutoff.isoformat(),
+        'val_end': last.isoformat(),
+        'num_train': len(train_idx),
+        'num_val': len(val_idx),
+        'created_at': datetime.now().isoformat()
+    }
+    with open(split_file, 'w') as f:
+        json.dump(info, f, indent=2)
+    print(f"Time split @ {cutoff}: {len(train_idx)} train / {len(val_idx)} val samples")
+    return train_idx, val_idx
+
+def get_dataloaders(csv_path, sat_dir, batch_size=4, split=0.8, split_file=SPLIT_FILE, num_horizons=1):
+    dataset = WeatherDataset(csv_path, sat_dir, num_horizons=num_horizons)
+    train_idx, val_idx = time_split(dataset, split, split_file)
+    train_ds = torch.utils.data.Subset(dataset, train_idx)
+    val_ds = torch.utils.data.Subset(dataset, val_idx)
     train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True)
     val_loader = DataLoader(val_ds, batch_size=batch_size, shuffle=False)
     return train_loader, val_loader
 
+def get_validation_loader(csv_path, sat_dir, batch_size=256, split_file=SPLIT_FILE, num_horizons=1,
+                          **loader_kwargs):
+    """
+    Build only the validation samples from the persisted split, without resampling
+    or aligning the training period. Falls back to a full build if no split exists.
+    """
+    saved = load_split(split_file)
+    if saved is None:
+        print(f"No split file ({split_file}) found, building full dataset...")
+        dataset = WeatherDataset(csv_path, sat_dir, num_horizons=num_horizons)
+        _, val_idx = time_split(dataset, split_file=split_file)
+        dataset = torch.utils.data.Subset(dataset, val_idx)
+    else:
+        dataset = WeatherDataset(csv_path, sat_dir, start_time=saved['val_start'], end_time=saved['val_end'],
+                                 num_horizons=num_horizons)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False, **loader_kwargs)
+
 if __name__ == "__main__":
     # Test Logic
     print("--- Testing WeatherDataset ---")
@@ -1,6 +1,21 @@
+import os
 import torch
 import torch.nn as nn
 
+# Multi-horizon forecasting: the head emits one rainfall value per 10-minute step
+# (10, 20, ..., 10*K minutes ahead). 1 = classic "next 10 minutes" model; 12 = 2-hour outlook.
+HORIZON_STEP_MINUTES = 10
+FORECAST_HORIZONS = int(os.environ.get("FORECAST_HORIZONS", "1"))
+
+def horizon_minutes(num_horizons):
+    """Lead time in minutes of each output of a K-horizon model."""
+    return [HORIZON_STEP_MINUTES * (k + 1) for k in range(num_horizons)]
+
+def prediction_dim_from_state_dict(state_dict, default=1):
+    """Number of horizons a saved checkpoint was trained for (size of the last head layer)."""
+    weight = state_dict.get('fusion_head.3.weight')
+    return weight.shape[0] if weight is not None else default
+
 class SatelliteEncoder(nn.Module):
     """
     Encoder for Satellite Images (Spatial Data).
@@ -68,7 +83,7 @@ class WeatherFusionNet(nn.Module):
             nn.Linear(fusion_input_dim, 64),
             nn.ReLU(),
             nn.Dropout(0.2),
-            nn.Linear(64, prediction_dim) # e.g., predict rainfall amount (regression)
+            nn.Linear(64, prediction_dim) # rainfall amount per forecast horizon (regression)
         )
 
     def forward(self, sat_img, sensor_data):